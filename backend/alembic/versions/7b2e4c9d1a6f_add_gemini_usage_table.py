@@ -0,0 +1,44 @@
+"""Add gemini_usage table
+
+Revision ID: 7b2e4c9d1a6f
+Revises: 3f9c1d2e7a5b
+Create Date: 2026-10-18 14:05:12.442871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7b2e4c9d1a6f'
+down_revision = '3f9c1d2e7a5b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('gemini_usage',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('route', sa.String(length=200), nullable=False),
+    sa.Column('model', sa.String(length=100), nullable=False),
+    sa.Column('prompt_template', sa.String(length=100), nullable=True),
+    sa.Column('calls', sa.Integer(), nullable=False),
+    sa.Column('prompt_tokens', sa.Integer(), nullable=False),
+    sa.Column('candidate_tokens', sa.Integer(), nullable=False),
+    sa.Column('image_tokens', sa.Integer(), nullable=False),
+    sa.Column('total_tokens', sa.Integer(), nullable=False),
+    sa.Column('latency_seconds', sa.Float(), nullable=False),
+    sa.Column('cost_usd', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_gemini_usage_day_user', 'gemini_usage', ['day', 'user_id'])
+    op.create_index('ix_gemini_usage_day_route', 'gemini_usage', ['day', 'route'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_gemini_usage_day_route', table_name='gemini_usage')
+    op.drop_index('ix_gemini_usage_day_user', table_name='gemini_usage')
+    op.drop_table('gemini_usage')
@@ -0,0 +1,38 @@
+"""Make the dedup key unique among queued and running jobs
+
+Revision ID: a2c9e7f3b1d5
+Revises: f1b6c2d8e4a7
+Create Date: 2026-10-19 11:06:52.480317
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a2c9e7f3b1d5'
+down_revision = 'f1b6c2d8e4a7'
+branch_labels = None
+depends_on = None
+
+ACTIVE = sa.text("status IN ('queued', 'running')")
+
+
+def upgrade() -> None:
+    # Submissions that raced past the old in-process check keep running, but
+    # under their own id as dedup key so the oldest active job keeps the key
+    op.execute(
+        "UPDATE jobs SET dedup_key = id "
+        "WHERE status IN ('queued', 'running') AND EXISTS ("
+        "SELECT 1 FROM jobs AS older WHERE older.dedup_key = jobs.dedup_key "
+        "AND older.status IN ('queued', 'running') "
+        "AND (older.created_at < jobs.created_at OR (older.created_at = jobs.created_at AND older.id < jobs.id)))"
+    )
+    op.drop_index('ix_jobs_dedup_key', table_name='jobs')
+    op.create_index('ux_jobs_dedup_key_active', 'jobs', ['dedup_key'], unique=True,
+                    postgresql_where=ACTIVE, sqlite_where=ACTIVE)
+
+
+def downgrade() -> None:
+    op.drop_index('ux_jobs_dedup_key_active', table_name='jobs')
+    op.create_index('ix_jobs_dedup_key', 'jobs', ['dedup_key', 'status'])
@@ -0,0 +1,96 @@
+"""Index hot query paths and store booking dates as DATE
+
+Revision ID: c4d8e1f2a9b3
+Revises: 7b2e4c9d1a6f
+Create Date: 2026-10-18 17:21:37.905214
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4d8e1f2a9b3'
+down_revision = '7b2e4c9d1a6f'
+branch_labels = None
+depends_on = None
+
+# Formats seen in bookings.date, tried in order
+DATE_FORMATS = ("%Y-%m-%d", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M:%S", "%d/%m/%Y", "%d-%m-%Y", "%Y/%m/%d")
+BACKFILL_BATCH = 5000
+
+
+def _parse_date(value):
+    value = value.strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    try:
+        return datetime.fromisoformat(value).date()
+    except ValueError:
+        return None
+
+
+def _check_unique_emails(bind):
+    duplicates = bind.execute(sa.text(
+        "SELECT email FROM users GROUP BY email HAVING COUNT(*) > 1 LIMIT 20"
+    )).scalars().all()
+    if duplicates:
+        raise RuntimeError(f"Cannot add a unique index on users.email; duplicated: {', '.join(duplicates)}")
+
+
+def _backfill_booking_dates(bind):
+    bookings = sa.table('bookings', sa.column('id', sa.Integer), sa.column('date', sa.String),
+                        sa.column('booking_date', sa.Date))
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(bookings.c.id, bookings.c.date)
+            .where(bookings.c.id > last_id).order_by(bookings.c.id).limit(BACKFILL_BATCH)
+        ).all()
+        if not rows:
+            return
+        updates = []
+        for booking_id, value in rows:
+            parsed = _parse_date(value or "")
+            if parsed is None:
+                raise RuntimeError(f"Booking {booking_id} has an unparseable date {value!r}; fix it and rerun")
+            updates.append({"b_id": booking_id, "b_date": parsed})
+        bind.execute(
+            bookings.update().where(bookings.c.id == sa.bindparam("b_id")).values(booking_date=sa.bindparam("b_date")),
+            updates,
+        )
+        last_id = rows[-1][0]
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    _check_unique_emails(bind)
+    op.create_index('ix_users_email', 'users', ['email'], unique=True)
+
+    op.add_column('bookings', sa.Column('booking_date', sa.Date(), nullable=True))
+    _backfill_booking_dates(bind)
+    with op.batch_alter_table('bookings') as batch_op:
+        batch_op.drop_column('date')
+        batch_op.alter_column('booking_date', new_column_name='date', existing_type=sa.Date(), nullable=False)
+
+    op.create_index('ix_bookings_user_id_id', 'bookings', ['user_id', 'id'])
+    op.create_index('ix_bookings_status_id', 'bookings', ['status', 'id'])
+    op.create_index('ix_bookings_date', 'bookings', ['date'])
+    op.create_index('ix_photos_category_id', 'photos', ['category', 'id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_photos_category_id', table_name='photos')
+    op.drop_index('ix_bookings_date', table_name='bookings')
+    op.drop_index('ix_bookings_status_id', table_name='bookings')
+    op.drop_index('ix_bookings_user_id_id', table_name='bookings')
+
+    with op.batch_alter_table('bookings') as batch_op:
+        batch_op.alter_column('date', type_=sa.String(length=20), existing_type=sa.Date(),
+                              existing_nullable=False, postgresql_using='date::varchar')
+
+    op.drop_index('ix_users_email', table_name='users')
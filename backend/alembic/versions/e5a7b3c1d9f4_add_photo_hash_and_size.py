@@ -0,0 +1,29 @@
+"""Add photo content hash and size
+
+Revision ID: e5a7b3c1d9f4
+Revises: c4d8e1f2a9b3
+Create Date: 2026-10-18 18:02:54.117630
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a7b3c1d9f4'
+down_revision = 'c4d8e1f2a9b3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('photos', sa.Column('sha256', sa.String(length=64), nullable=True))
+    op.add_column('photos', sa.Column('size', sa.BigInteger(), nullable=True))
+    op.create_index('ix_photos_sha256', 'photos', ['sha256'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_photos_sha256', table_name='photos')
+    with op.batch_alter_table('photos') as batch_op:
+        batch_op.drop_column('size')
+        batch_op.drop_column('sha256')
@@ -0,0 +1,55 @@
+"""Drop the gemini_usage user foreign key
+
+Revision ID: f1b6c2d8e4a7
+Revises: e5a7b3c1d9f4
+Create Date: 2026-10-19 09:41:18.226014
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1b6c2d8e4a7'
+down_revision = 'e5a7b3c1d9f4'
+branch_labels = None
+depends_on = None
+
+
+def _gemini_usage(*foreign_keys):
+    return sa.Table('gemini_usage', sa.MetaData(),
+        sa.Column('id', sa.Integer(), primary_key=True, nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('route', sa.String(length=200), nullable=False),
+        sa.Column('model', sa.String(length=100), nullable=False),
+        sa.Column('prompt_template', sa.String(length=100), nullable=True),
+        sa.Column('calls', sa.Integer(), nullable=False),
+        sa.Column('prompt_tokens', sa.Integer(), nullable=False),
+        sa.Column('candidate_tokens', sa.Integer(), nullable=False),
+        sa.Column('image_tokens', sa.Integer(), nullable=False),
+        sa.Column('total_tokens', sa.Integer(), nullable=False),
+        sa.Column('latency_seconds', sa.Float(), nullable=False),
+        sa.Column('cost_usd', sa.Float(), nullable=False),
+        sa.Index('ix_gemini_usage_day_user', 'day', 'user_id'),
+        sa.Index('ix_gemini_usage_day_route', 'day', 'route'),
+        *foreign_keys
+    )
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name == 'sqlite':
+        # The constraint is unnamed in SQLite; rebuild the table without it
+        with op.batch_alter_table('gemini_usage', copy_from=_gemini_usage(), recreate='always'):
+            pass
+    else:
+        op.drop_constraint('gemini_usage_user_id_fkey', 'gemini_usage', type_='foreignkey')
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'sqlite':
+        foreign_key = sa.ForeignKeyConstraint(['user_id'], ['users.id'])
+        with op.batch_alter_table('gemini_usage', copy_from=_gemini_usage(foreign_key), recreate='always'):
+            pass
+    else:
+        op.create_foreign_key('gemini_usage_user_id_fkey', 'gemini_usage', 'users', ['user_id'], ['id'])
@@ -0,0 +1,322 @@
+import asyncio
+import hashlib
+import math
+import os
+import re
+import time
+from typing import Optional
+from fastapi import HTTPException, status
+import httpx
+from google import genai
+from google.genai import errors, types
+from dotenv import load_dotenv
+from .result_cache import normalize_prompt
+from .single_flight import SingleFlight
+from .resilience import TokenBucket, CircuitBreaker, CircuitOpen, RateLimited, backoff_delay
+from .metrics import GEMINI_REQUEST_SECONDS
+from .usage import usage_recorder
+
+load_dotenv()
+
+IMAGE_MODEL = "gemini-2.5-flash-image-preview"
+VISION_MODEL = "gemini-2.5-flash"
+COST_MODEL = "gemini-2.0-flash-exp"
+
+# Maximum number of in-flight calls per model. Calls go through the SDK's
+# async surface, so waiting on Gemini never holds a thread or the event loop;
+# the limits only protect the upstream quota.
+DEFAULT_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "32"))
+MODEL_CONCURRENCY = {
+    IMAGE_MODEL: int(os.getenv("GEMINI_IMAGE_CONCURRENCY", "16")),
+    VISION_MODEL: int(os.getenv("GEMINI_VISION_CONCURRENCY", "32")),
+    COST_MODEL: int(os.getenv("GEMINI_TEXT_CONCURRENCY", "32")),
+}
+
+# Per-call time budget, including time spent waiting for a concurrency slot
+MODEL_TIMEOUT_SECONDS = {
+    IMAGE_MODEL: float(os.getenv("GEMINI_IMAGE_TIMEOUT_SECONDS", "120")),
+    VISION_MODEL: float(os.getenv("GEMINI_VISION_TIMEOUT_SECONDS", "60")),
+    COST_MODEL: float(os.getenv("GEMINI_TEXT_TIMEOUT_SECONDS", "60")),
+}
+
+# Limit on a single upstream attempt. A timed-out attempt counts as a circuit
+# breaker failure and is retried, so a hanging upstream opens the circuit the
+# same way 503s do. Kept below the per-call budgets above, so an attempt is
+# counted before its callers give up on it.
+DEFAULT_ATTEMPT_TIMEOUT_SECONDS = float(os.getenv("GEMINI_ATTEMPT_TIMEOUT_SECONDS", "45"))
+MODEL_ATTEMPT_TIMEOUT_SECONDS = {
+    IMAGE_MODEL: float(os.getenv("GEMINI_IMAGE_ATTEMPT_TIMEOUT_SECONDS", "90")),
+    VISION_MODEL: float(os.getenv("GEMINI_VISION_ATTEMPT_TIMEOUT_SECONDS", "45")),
+    COST_MODEL: float(os.getenv("GEMINI_TEXT_ATTEMPT_TIMEOUT_SECONDS", "45")),
+}
+
+# Concurrent identical calls (same model, normalized prompt, images and config)
+# share one upstream request
+SINGLE_FLIGHT_ENABLED = os.getenv("GEMINI_SINGLE_FLIGHT", "true").lower() in ("1", "true", "yes")
+
+# Client-side request rate per model, as a token bucket refilled per minute
+DEFAULT_RATE_PER_MINUTE = float(os.getenv("GEMINI_MAX_RATE_PER_MINUTE", "300"))
+MODEL_RATE_PER_MINUTE = {
+    IMAGE_MODEL: float(os.getenv("GEMINI_IMAGE_RATE_PER_MINUTE", "60")),
+    VISION_MODEL: float(os.getenv("GEMINI_VISION_RATE_PER_MINUTE", "300")),
+    COST_MODEL: float(os.getenv("GEMINI_TEXT_RATE_PER_MINUTE", "300")),
+}
+RATE_BURST = int(os.getenv("GEMINI_RATE_BURST", "10"))
+# Longest a call may queue for a rate limit token before failing with 503
+RATE_MAX_WAIT_SECONDS = float(os.getenv("GEMINI_RATE_MAX_WAIT_SECONDS", "30"))
+
+# 429 and 5xx responses and network errors are retried with jittered exponential backoff
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "3"))
+RETRY_BASE_SECONDS = float(os.getenv("GEMINI_RETRY_BASE_SECONDS", "1"))
+RETRY_MAX_SECONDS = float(os.getenv("GEMINI_RETRY_MAX_SECONDS", "30"))
+
+# After this many consecutive retryable failures a model's circuit opens and
+# calls fail fast with 503 until the reset period has passed
+BREAKER_FAILURES = int(os.getenv("GEMINI_BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("GEMINI_BREAKER_RESET_SECONDS", "30"))
+
+_client = None
+_semaphores = {}
+_buckets = {}
+_breakers = {}
+_retries = {}
+_single_flight = SingleFlight()
+
+
+def get_client():
+    """Return the shared Gemini client, creating it on first use."""
+    global _client
+    if _client is None:
+        try:
+            api_key = os.getenv('GEMINI_KEY')
+            if not api_key:
+                raise ValueError("GEMINI_KEY not found in environment variables")
+            _client = genai.Client(api_key=api_key)
+            print("Google Generative AI client initialized successfully")
+        except Exception as e:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                                detail=f"Failed to initialize Google Generative AI client: {str(e)}")
+    return _client
+
+
+def _get_semaphore(model: str) -> asyncio.Semaphore:
+    semaphore = _semaphores.get(model)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(MODEL_CONCURRENCY.get(model, DEFAULT_CONCURRENCY))
+        _semaphores[model] = semaphore
+    return semaphore
+
+
+def _get_bucket(model: str) -> TokenBucket:
+    bucket = _buckets.get(model)
+    if bucket is None:
+        bucket = TokenBucket(MODEL_RATE_PER_MINUTE.get(model, DEFAULT_RATE_PER_MINUTE) / 60, RATE_BURST)
+        _buckets[model] = bucket
+    return bucket
+
+
+def _get_breaker(model: str) -> CircuitBreaker:
+    breaker = _breakers.get(model)
+    if breaker is None:
+        breaker = CircuitBreaker(BREAKER_FAILURES, BREAKER_RESET_SECONDS)
+        _breakers[model] = breaker
+    return breaker
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, errors.APIError):
+        return error.code in RETRYABLE_STATUS_CODES
+    return isinstance(error, (ConnectionError, httpx.TransportError, asyncio.TimeoutError))
+
+
+def _find_retry_delay(details) -> Optional[float]:
+    if isinstance(details, dict):
+        delay = details.get("retryDelay")
+        if isinstance(delay, str):
+            match = re.match(r"([\d.]+)s$", delay)
+            if match:
+                return float(match.group(1))
+        details = list(details.values())
+    if isinstance(details, list):
+        for item in details:
+            delay = _find_retry_delay(item)
+            if delay is not None:
+                return delay
+    return None
+
+
+def retry_hint(error: Exception) -> Optional[float]:
+    """Seconds the server asked us to wait, from a Retry-After header or a google.rpc.RetryInfo detail."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if headers:
+        try:
+            return float(headers.get("retry-after"))
+        except (TypeError, ValueError):
+            pass
+    return _find_retry_delay(getattr(error, "details", None))
+
+
+def _unavailable(model: str, retry_after: float) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=f"{model} is temporarily unavailable, please retry later",
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+    )
+
+
+def upstream_stats() -> dict:
+    """Rate limiter, circuit breaker and retry state per model."""
+    models = set(_buckets) | set(_breakers)
+    return {
+        model: {
+            "rate_limit": _get_bucket(model).stats(),
+            "circuit": _get_breaker(model).stats(),
+            "retries": _retries.get(model, 0),
+        }
+        for model in sorted(models)
+    }
+
+
+def image_part(prepared):
+    """Wrap a ``PreparedImage`` as an inline content part."""
+    return types.Part.from_bytes(data=prepared.data, mime_type=prepared.mime_type)
+
+
+def _hash_content(digest, content):
+    if isinstance(content, (list, tuple)):
+        for item in content:
+            _hash_content(digest, item)
+        return
+    if isinstance(content, str):
+        digest.update(b"text:" + normalize_prompt(content).encode("utf-8") + b"\0")
+        return
+    inline = getattr(content, "inline_data", None)
+    if inline is not None and inline.data is not None:
+        digest.update(f"inline:{inline.mime_type}:".encode("utf-8"))
+        digest.update(hashlib.sha256(inline.data).digest())
+        return
+    text = getattr(content, "text", None)
+    if text is not None:
+        digest.update(b"text:" + normalize_prompt(text).encode("utf-8") + b"\0")
+        return
+    digest.update(repr(content).encode("utf-8"))
+
+
+def request_key(model: str, contents, config=None) -> str:
+    """Key identifying a Gemini request by model, normalized text, image hashes and config."""
+    digest = hashlib.sha256(model.encode("utf-8") + b"\0")
+    _hash_content(digest, contents)
+    if config is not None:
+        # repr() is deterministic and, unlike JSON, copes with schema classes in the config
+        digest.update(b"config:" + repr(config).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _template_id(contents) -> Optional[str]:
+    """Id of the prompt template the contents were rendered from, if any."""
+    items = contents if isinstance(contents, (list, tuple)) else [contents]
+    for item in items:
+        template_id = getattr(item, "template_id", None)
+        if template_id:
+            return template_id
+    return None
+
+
+def coalescing_stats() -> dict:
+    """Upstream calls and calls saved by single-flight coalescing, per model."""
+    models = {
+        model: {"upstream_calls": counters["calls"], "coalesced_calls": counters["coalesced"]}
+        for model, counters in _single_flight.stats.items()
+    }
+    return {
+        "enabled": SINGLE_FLIGHT_ENABLED,
+        "in_flight": _single_flight.in_flight(),
+        "calls_saved": sum(counters["coalesced_calls"] for counters in models.values()),
+        "models": models,
+    }
+
+
+async def _generate_content(model: str, contents, config=None):
+    """Call Gemini under the model's rate limit, circuit breaker and retry policy.
+
+    Each attempt is bounded by the model's attempt timeout; a timeout is
+    retried and counted against the circuit breaker like a 503.
+    Raises HTTPException 503 with Retry-After when the circuit is open, the
+    rate limit queue is too long, retryable errors persist past MAX_RETRIES,
+    or the server asks for a longer wait than RETRY_MAX_SECONDS.
+    Other errors (e.g. 400 for a bad request) are raised unchanged.
+    """
+    client = get_client()
+    breaker = _get_breaker(model)
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            trial = breaker.before_call()
+        except CircuitOpen as e:
+            raise _unavailable(model, e.retry_after) from e
+        started = None
+        try:
+            await _get_bucket(model).acquire(RATE_MAX_WAIT_SECONDS)
+            async with _get_semaphore(model):
+                started = time.perf_counter()
+                response = await asyncio.wait_for(
+                    client.aio.models.generate_content(model=model, contents=contents, config=config),
+                    MODEL_ATTEMPT_TIMEOUT_SECONDS.get(model, DEFAULT_ATTEMPT_TIMEOUT_SECONDS)
+                )
+            latency = time.perf_counter() - started
+            GEMINI_REQUEST_SECONDS.labels(model=model, outcome="ok").observe(latency)
+            usage_recorder.record(model, response, latency, _template_id(contents))
+        except asyncio.CancelledError:
+            breaker.record_cancelled(trial)
+            raise
+        except RateLimited as e:
+            breaker.record_cancelled(trial)
+            raise _unavailable(model, e.retry_after) from e
+        except Exception as e:
+            if started is not None:
+                outcome = "timeout" if isinstance(e, asyncio.TimeoutError) else "error"
+                GEMINI_REQUEST_SECONDS.labels(model=model, outcome=outcome).observe(time.perf_counter() - started)
+            if not _is_retryable(e):
+                # Upstream is healthy, the request itself was rejected
+                breaker.record_success()
+                raise
+            hint = retry_hint(e)
+            breaker.record_failure(hint)
+            if attempt == MAX_RETRIES:
+                print(f"Gemini {model} failed after {attempt + 1} attempts: {e}")
+                raise _unavailable(model, hint or breaker.retry_after() or RETRY_BASE_SECONDS) from e
+            if hint is not None and hint > RETRY_MAX_SECONDS:
+                # Waiting that long would hold the request open; pass the hint on instead
+                print(f"Gemini {model} asked to retry in {hint:.1f}s, over the {RETRY_MAX_SECONDS:g}s cap: {e}")
+                raise _unavailable(model, hint) from e
+            delay = backoff_delay(attempt, RETRY_BASE_SECONDS, RETRY_MAX_SECONDS, hint)
+            _retries[model] = _retries.get(model, 0) + 1
+            print(f"Gemini {model} attempt {attempt + 1} failed ({e}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+        else:
+            breaker.record_success()
+            return response
+
+
+async def generate_content(model: str, contents, config=None, timeout: Optional[float] = None):
+    """Run ``generate_content`` on the async client under the model's concurrency limit.
+
+    Identical concurrent requests are coalesced into one upstream call whose
+    response is shared by every caller (its token usage is attributed to the
+    first caller). ``timeout`` (seconds) bounds this
+    caller's wait; ``TimeoutError`` is raised when it runs out.
+    """
+    def call():
+        return _generate_content(model, contents, config)
+
+    if SINGLE_FLIGHT_ENABLED:
+        key = request_key(model, contents, config)
+        pending = _single_flight.do(key, call, group=model)
+    else:
+        pending = call()
+    if timeout is None:
+        return await pending
+    try:
+        return await asyncio.wait_for(pending, timeout)
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"{model} did not respond within {timeout:g}s") from None
@@ -0,0 +1,75 @@
+from typing import Tuple
+import numpy as np
+from .spatial import haversine_m
+
+_GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash_encode(latitude: float, longitude: float, precision: int = 6) -> str:
+    """Encode a coordinate as a geohash string of ``precision`` characters.
+
+    Precision 6 gives cells of roughly 1.2 km x 0.6 km, precision 5 about 5 km x 5 km.
+    """
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    geohash = []
+    bit, ch, even = 0, 0, True
+    while len(geohash) < precision:
+        if even:
+            mid = (lon_range[0] + lon_range[1]) / 2
+            if longitude >= mid:
+                ch |= 1 << (4 - bit)
+                lon_range[0] = mid
+            else:
+                lon_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if latitude >= mid:
+                ch |= 1 << (4 - bit)
+                lat_range[0] = mid
+            else:
+                lat_range[1] = mid
+        even = not even
+        if bit < 4:
+            bit += 1
+        else:
+            geohash.append(_GEOHASH_BASE32[ch])
+            bit, ch = 0, 0
+    return "".join(geohash)
+
+
+def geohash_bounds(geohash: str) -> Tuple[float, float, float, float]:
+    """Return the (min_lat, min_lon, max_lat, max_lon) corners of a geohash cell."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        value = _GEOHASH_BASE32.index(char)
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            target = lon_range if even else lat_range
+            mid = (target[0] + target[1]) / 2
+            if bit:
+                target[0] = mid
+            else:
+                target[1] = mid
+            even = not even
+    return lat_range[0], lon_range[0], lat_range[1], lon_range[1]
+
+
+def geohash_center(geohash: str) -> Tuple[float, float]:
+    """Return the (latitude, longitude) centre of a geohash cell."""
+    min_lat, min_lon, max_lat, max_lon = geohash_bounds(geohash)
+    return (min_lat + max_lat) / 2, (min_lon + max_lon) / 2
+
+
+def geohash_half_diagonal_m(geohash: str) -> float:
+    """Return the distance in metres from a geohash cell's centre to its farthest corner.
+
+    Any point in the cell lies within this distance of the centre, under 0.7 km at precision 6.
+    """
+    min_lat, min_lon, max_lat, max_lon = geohash_bounds(geohash)
+    latitude, longitude = geohash_center(geohash)
+    distances = haversine_m(latitude, longitude, np.array([min_lat, min_lat, max_lat, max_lat]),
+                            np.array([min_lon, max_lon, min_lon, max_lon]))
+    return float(distances.max())
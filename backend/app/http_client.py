@@ -0,0 +1,27 @@
+import httpx
+from typing import Optional
+
+# One pooled client for the lifetime of the application so outbound calls
+# (Google Places, etc.) reuse keep-alive HTTP/2 connections instead of paying
+# a TLS handshake per request.
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared outbound HTTP client, creating it on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            http2=True,
+            timeout=httpx.Timeout(10.0, connect=5.0),
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=60.0)
+        )
+    return _client
+
+
+async def close_http_client():
+    """Close the shared client; called on application shutdown."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
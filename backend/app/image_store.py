@@ -0,0 +1,110 @@
+import asyncio
+import hashlib
+import os
+from io import BytesIO
+from PIL import Image, features
+from starlette.concurrency import run_in_threadpool
+from dotenv import load_dotenv
+from .storage import storage, content_key
+from .metrics import IMAGE_PROCESSING_SECONDS, timed
+
+load_dotenv()
+
+# Generated images are stored as a compressed master plus smaller derivatives
+# so clients can pick a size through srcset instead of downloading the master.
+DERIVATIVE_WIDTHS = [int(width) for width in os.getenv("GENERATED_IMAGE_WIDTHS", "320,1024").split(",") if width.strip()]
+MASTER_QUALITY = int(os.getenv("GENERATED_IMAGE_QUALITY", "90"))
+DERIVATIVE_QUALITY = int(os.getenv("GENERATED_IMAGE_DERIVATIVE_QUALITY", "80"))
+
+_requested_format = os.getenv("GENERATED_IMAGE_FORMAT", "webp").lower()
+if _requested_format == "avif" and not features.check("avif"):
+    print("AVIF encoding not available in this Pillow build, using WebP for generated images")
+    _requested_format = "webp"
+GENERATED_IMAGE_FORMAT = _requested_format
+
+
+def encode_image_set(image_bytes: bytes) -> dict:
+    """Decode a generated image and encode the master and resized derivatives in memory.
+
+    Returns ``{"width", "height", "digest", "files": {descriptor: bytes}}``,
+    where descriptors are srcset widths such as ``"320w"``; the largest one is the master.
+    """
+    with timed(IMAGE_PROCESSING_SECONDS, operation="encode"):
+        return _encode_image_set(image_bytes)
+
+
+def _encode_image_set(image_bytes: bytes) -> dict:
+    img = Image.open(BytesIO(image_bytes))
+    img.load()
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+
+    pil_format = GENERATED_IMAGE_FORMAT.upper()
+    files = {}
+
+    for width in sorted(DERIVATIVE_WIDTHS):
+        if width >= img.width:
+            continue
+        height = max(1, round(img.height * width / img.width))
+        derivative = img.resize((width, height), Image.Resampling.LANCZOS)
+        buffer = BytesIO()
+        derivative.save(buffer, format=pil_format, quality=DERIVATIVE_QUALITY)
+        files[f"{width}w"] = buffer.getvalue()
+
+    buffer = BytesIO()
+    img.save(buffer, format=pil_format, quality=MASTER_QUALITY)
+    master = buffer.getvalue()
+    files[f"{img.width}w"] = master
+
+    return {
+        "width": img.width,
+        "height": img.height,
+        "digest": hashlib.sha256(master).hexdigest(),
+        "files": files,
+    }
+
+
+async def save_generated_image(image_bytes: bytes, prefix: str = "generated") -> dict:
+    """Encode a generated image off the event loop and write it to storage.
+
+    Keys are content-addressed by the master's SHA-256. Returns a dict describing
+    the stored objects::
+
+        {"key": "generated/<sha256>.webp", "width": 1024, "height": 1024, "bytes": 183204,
+         "variants": {"320w": "generated/<sha256>_320w.webp", "1024w": "generated/<sha256>.webp"}}
+    """
+    encoded = await run_in_threadpool(encode_image_set, image_bytes)
+    master_descriptor = f"{encoded['width']}w"
+    content_type = f"image/{GENERATED_IMAGE_FORMAT}"
+
+    variants = {}
+    for descriptor in encoded["files"]:
+        suffix = "" if descriptor == master_descriptor else f"_{descriptor}"
+        variants[descriptor] = content_key(prefix, f"{encoded['digest']}{suffix}", GENERATED_IMAGE_FORMAT)
+    await asyncio.gather(*(
+        storage.put_bytes(variants[descriptor], data, content_type)
+        for descriptor, data in encoded["files"].items()
+    ))
+
+    return {
+        "key": variants[master_descriptor],
+        "width": encoded["width"],
+        "height": encoded["height"],
+        "variants": variants,
+        "bytes": sum(len(data) for data in encoded["files"].values()),
+    }
+
+
+def image_urls(image_set: dict, base_url: str) -> dict:
+    """Build the response fields for a stored image: the master URL and a srcset-style width map."""
+    return {
+        "image_url": storage.url(image_set["key"], base_url),
+        "image_srcset": {
+            descriptor: storage.url(key, base_url) for descriptor, key in image_set.get("variants", {}).items()
+        },
+    }
+
+
+def image_set_keys(image_set: dict) -> list:
+    """Return every storage key belonging to a stored image."""
+    return list(dict.fromkeys([image_set["key"], *image_set.get("variants", {}).values()]))
@@ -0,0 +1,289 @@
+import asyncio
+import json
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Optional
+from fastapi import HTTPException, status
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from dotenv import load_dotenv
+from .database import SessionLocal
+from .models import Job
+
+load_dotenv()
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "1000"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "5"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+# A job left running for longer than this (e.g. its instance died) is queued again
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "900"))
+# A running job's lease is renewed this often, so long handlers keep it
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", str(JOB_LEASE_SECONDS / 3)))
+# Submitted priorities are clamped to 0..JOB_MAX_PRIORITY
+JOB_MAX_PRIORITY = int(os.getenv("JOB_MAX_PRIORITY", "10"))
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+PENDING_STATUSES = (QUEUED, RUNNING)
+
+_handlers: Dict[str, Callable[[dict], Awaitable[dict]]] = {}
+
+
+def job_handler(kind: str):
+    """Register a coroutine ``handler(payload) -> result`` for a job kind."""
+    def decorator(handler):
+        _handlers[kind] = handler
+        return handler
+    return decorator
+
+
+def job_to_dict(job: Job) -> dict:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "priority": job.priority,
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+
+class JobQueue:
+    """Persistent priority queue of AI jobs drained by a bounded pool of local workers.
+
+    Jobs live in the ``jobs`` table, so they survive restarts and can be shared
+    by several instances on the same database. Higher ``priority`` runs first,
+    then oldest first. A worker claims a job with a conditional UPDATE, so two
+    workers never run the same job. While a handler runs, a heartbeat renews
+    the job's lease, so only jobs whose instance died are claimed again.
+    Failed jobs are retried with exponential backoff up to ``max_attempts``;
+    4xx errors from a handler are not retried.
+    Submitting a job identical to one still queued or running returns the
+    existing job instead of adding a new one. A unique partial index on the
+    dedup key of queued and running jobs makes that hold across instances.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, max_queued: int = JOB_MAX_QUEUED):
+        self.workers = workers
+        self.max_queued = max_queued
+        self._tasks = []
+        self._running = set()
+        self._wakeup = None
+
+    # Database operations
+
+    @staticmethod
+    async def _pending_job(db, dedup_key: str) -> Optional[Job]:
+        return (await db.scalars(
+            select(Job).where(Job.dedup_key == dedup_key, Job.status.in_(PENDING_STATUSES)).limit(1)
+        )).first()
+
+    async def _insert(self, kind: str, payload: dict, dedup_key: str, priority: int, max_attempts: int):
+        async with SessionLocal() as db:
+            existing = await self._pending_job(db, dedup_key)
+            if existing is not None:
+                return job_to_dict(existing), False
+            queued = await db.scalar(select(func.count(Job.id)).where(Job.status == QUEUED))
+            if queued >= self.max_queued:
+                raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                    detail="Job queue is full, try again later",
+                                    headers={"Retry-After": str(int(JOB_POLL_SECONDS * 10))})
+            now = datetime.utcnow()
+            job = Job(
+                id=uuid.uuid4().hex,
+                kind=kind,
+                status=QUEUED,
+                priority=priority,
+                dedup_key=dedup_key,
+                payload=json.dumps(payload),
+                attempts=0,
+                max_attempts=max_attempts,
+                available_at=now,
+                created_at=now,
+            )
+            db.add(job)
+            try:
+                await db.commit()
+            except IntegrityError:
+                # Another submission (possibly on another instance) won the race
+                await db.rollback()
+                existing = await self._pending_job(db, dedup_key)
+                if existing is None:
+                    raise
+                return job_to_dict(existing), False
+            return job_to_dict(job), True
+
+    async def _claim(self) -> Optional[tuple]:
+        now = datetime.utcnow()
+        async with SessionLocal() as db:
+            candidates = (await db.scalars(
+                select(Job.id)
+                .where(or_(
+                    (Job.status == QUEUED) & (Job.available_at <= now),
+                    (Job.status == RUNNING) & (Job.started_at <= now - timedelta(seconds=JOB_LEASE_SECONDS)),
+                ))
+                .order_by(Job.priority.desc(), Job.created_at)
+                .limit(self.workers)
+            )).all()
+            for job_id in candidates:
+                claimed = await db.execute(
+                    update(Job)
+                    .where(Job.id == job_id)
+                    .where(or_(
+                        Job.status == QUEUED,
+                        (Job.status == RUNNING) & (Job.started_at <= now - timedelta(seconds=JOB_LEASE_SECONDS)),
+                    ))
+                    .values(status=RUNNING, started_at=now, attempts=Job.attempts + 1)
+                )
+                await db.commit()
+                if claimed.rowcount == 1:
+                    job = await db.get(Job, job_id)
+                    return job.id, job.kind, json.loads(job.payload), job.attempts, job.max_attempts
+        return None
+
+    async def _renew(self, job_id: str, attempts: int):
+        async with SessionLocal() as db:
+            await db.execute(
+                update(Job).where(Job.id == job_id, Job.status == RUNNING, Job.attempts == attempts)
+                .values(started_at=datetime.utcnow())
+            )
+            await db.commit()
+
+    async def _finish(self, job_id: str, result: dict):
+        async with SessionLocal() as db:
+            await db.execute(
+                update(Job).where(Job.id == job_id)
+                .values(status=SUCCEEDED, result=json.dumps(result, default=str), error=None,
+                        finished_at=datetime.utcnow())
+            )
+            await db.commit()
+
+    async def _fail(self, job_id: str, error: str, retry_in: Optional[float]):
+        now = datetime.utcnow()
+        if retry_in is None:
+            values = {"status": FAILED, "error": error, "finished_at": now}
+        else:
+            values = {"status": QUEUED, "error": error, "available_at": now + timedelta(seconds=retry_in)}
+        async with SessionLocal() as db:
+            await db.execute(update(Job).where(Job.id == job_id).values(**values))
+            await db.commit()
+
+    async def _release(self, job_ids: list):
+        async with SessionLocal() as db:
+            await db.execute(
+                update(Job).where(Job.id.in_(job_ids), Job.status == RUNNING)
+                .values(status=QUEUED, started_at=None, attempts=Job.attempts - 1)
+            )
+            await db.commit()
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        async with SessionLocal() as db:
+            job = await db.get(Job, job_id)
+            if job is None:
+                return None
+            data = job_to_dict(job)
+            data["result"] = json.loads(job.result) if job.result else None
+            return data
+
+    # Public API
+
+    async def submit(self, kind: str, payload: dict, dedup_key: str, priority: int = 0,
+                     max_attempts: int = JOB_MAX_ATTEMPTS) -> dict:
+        """Queue a job and return its status, or the status of an identical pending job.
+
+        ``priority`` is clamped to ``0..JOB_MAX_PRIORITY``. Raises HTTPException
+        503 when the queue already holds ``max_queued`` jobs.
+        """
+        if kind not in _handlers:
+            raise ValueError(f"No handler registered for job kind {kind}")
+        priority = min(max(priority, 0), JOB_MAX_PRIORITY)
+        job, created = await self._insert(kind, payload, dedup_key, priority, max_attempts)
+        if created and self._wakeup is not None:
+            self._wakeup.set()
+        job["deduplicated"] = not created
+        return job
+
+    async def _heartbeat(self, job_id: str, attempts: int):
+        """Keep renewing the lease of a running job so ``_claim`` does not hand it out again."""
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+            try:
+                await self._renew(job_id, attempts)
+            except Exception as e:
+                print(f"Error renewing lease of job {job_id}: {e}")
+
+    async def _run(self, job_id: str, kind: str, payload: dict, attempts: int, max_attempts: int):
+        self._running.add(job_id)
+        heartbeat = asyncio.create_task(self._heartbeat(job_id, attempts))
+        try:
+            try:
+                result = await _handlers[kind](payload)
+            finally:
+                heartbeat.cancel()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            message = e.detail if isinstance(e, HTTPException) else str(e)
+            retryable = not (isinstance(e, HTTPException) and e.status_code < 500)
+            retry_in = None
+            if retryable and attempts < max_attempts:
+                retry_in = JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1)
+                # Honour the Retry-After of a 503 from an unavailable upstream
+                retry_after = (getattr(e, "headers", None) or {}).get("Retry-After")
+                if retry_after:
+                    retry_in = max(retry_in, float(retry_after))
+            print(f"Job {job_id} ({kind}) attempt {attempts} failed: {message}")
+            await self._fail(job_id, message, retry_in)
+        else:
+            await self._finish(job_id, result)
+        finally:
+            self._running.discard(job_id)
+
+    async def _worker(self):
+        while True:
+            try:
+                claimed = await self._claim()
+            except Exception as e:
+                print(f"Error claiming job: {e}")
+                claimed = None
+            if claimed is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), JOB_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._run(*claimed)
+            except Exception as e:
+                # The job stays running until its lease expires and it is claimed again
+                print(f"Error recording result of job {claimed[0]}: {e}")
+
+    def start(self):
+        """Start the worker pool on the running event loop."""
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Stop the workers and put the jobs they were running back in the queue."""
+        interrupted = list(self._running)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if interrupted:
+            await self._release(interrupted)
+
+
+job_queue = JobQueue()
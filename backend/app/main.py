@@ -1,17 +1,40 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from . import models
 from .database import engine
-from .routers import user, auth, photo, booking, ai_image, shops
+from .routers import user, auth, photo, booking, ai_image, shops, jobs, metrics as metrics_router
+from .http_client import close_http_client
+from .jobs import job_queue
+from .usage import usage_recorder
+from .utils import shutdown_hash_pool
+from .storage import storage, LocalStorage
+from .metrics import MetricsMiddleware, instrument_engine, loop_lag_monitor
 from dotenv import load_dotenv
 load_dotenv()
 
-models.Base.metadata.create_all(bind=engine)
+instrument_engine(engine.sync_engine)
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    async with engine.begin() as conn:
+        await conn.run_sync(models.Base.metadata.create_all)
+    loop_lag_monitor.start()
+    usage_recorder.start()
+    job_queue.start()
+    yield
+    await job_queue.stop()
+    await usage_recorder.stop()
+    await loop_lag_monitor.stop()
+    await close_http_client()
+    await engine.dispose()
+    shutdown_hash_pool()
 
-app.mount("/assets", StaticFiles(directory="assets"), name="assets")
+app = FastAPI(lifespan=lifespan)
+
+if isinstance(storage, LocalStorage):
+    app.mount("/assets", StaticFiles(directory=storage.root), name="assets")
 
 origins = [
     "*",
@@ -24,10 +47,13 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(user.router)
 app.include_router(auth.router)
 app.include_router(photo.router)
 app.include_router(booking.router)
 app.include_router(ai_image.router)
-app.include_router(shops.router)
\ No newline at end of file
+app.include_router(shops.router)
+app.include_router(jobs.router)
+app.include_router(metrics_router.router)
\ No newline at end of file
@@ -0,0 +1,200 @@
+import asyncio
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily
+from sqlalchemy import event
+from dotenv import load_dotenv
+
+load_dotenv()
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+# How often the event loop is probed for scheduling lag
+LOOP_LAG_INTERVAL_SECONDS = float(os.getenv("METRICS_LOOP_LAG_INTERVAL_SECONDS", "0.5"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+BYTES_BUCKETS = (16 * 1024, 64 * 1024, 256 * 1024, 1024 ** 2, 2 * 1024 ** 2, 5 * 1024 ** 2,
+                 10 * 1024 ** 2, 25 * 1024 ** 2, 50 * 1024 ** 2)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS
+)
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests currently being served")
+GEMINI_REQUEST_SECONDS = Histogram(
+    "gemini_request_duration_seconds", "Latency of each upstream Gemini call attempt",
+    ["model", "outcome"], buckets=LATENCY_BUCKETS
+)
+SINGLE_FLIGHT_CALLS = Counter(
+    "single_flight_calls_total", "Calls through single-flight coalescing, by whether they went upstream",
+    ["group", "result"]
+)
+GEMINI_TOKENS = Counter("gemini_tokens_total", "Gemini tokens used", ["model", "type"])
+GEMINI_COST_USD = Counter("gemini_cost_usd_total", "Estimated Gemini spend in USD", ["model"])
+UPLOAD_BYTES = Histogram("upload_size_bytes", "Size of uploaded files", ["kind"], buckets=BYTES_BUCKETS)
+IMAGE_PROCESSING_SECONDS = Histogram(
+    "image_processing_duration_seconds", "Time spent preparing and encoding images",
+    ["operation"], buckets=LATENCY_BUCKETS
+)
+PLACES_CALLS = Counter("places_api_calls_total", "Google Places API calls", ["endpoint", "outcome"])
+PLACES_CALLS_PER_REQUEST = Histogram(
+    "places_api_calls_per_request", "Google Places API calls made while serving one request",
+    ["route"], buckets=COUNT_BUCKETS
+)
+DB_QUERIES = Counter("db_queries_total", "SQL statements executed")
+DB_QUERIES_PER_REQUEST = Histogram(
+    "db_queries_per_request", "SQL statements executed while serving one request",
+    ["route"], buckets=COUNT_BUCKETS
+)
+LOOP_LAG_SECONDS = Histogram(
+    "event_loop_lag_seconds", "Delay of a scheduled event loop wakeup past its due time",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+
+# Per-request counters. The middleware installs a fresh dict for each request;
+# code run for that request (including threadpool calls, which copy the
+# context) increments it through ``count``.
+_request_counters: contextvars.ContextVar[Optional[Dict[str, int]]] = contextvars.ContextVar(
+    "request_counters", default=None
+)
+
+
+def count(name: str, amount: int = 1):
+    """Add to a per-request counter, if a request is being served."""
+    counters = _request_counters.get()
+    if counters is not None:
+        counters[name] = counters.get(name, 0) + amount
+
+
+@contextmanager
+def timed(histogram: Histogram, **labels):
+    """Observe the wall time of a block into ``histogram``."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.labels(**labels).observe(time.perf_counter() - start)
+
+
+def record_places_call(endpoint: str, outcome: str):
+    PLACES_CALLS.labels(endpoint=endpoint, outcome=outcome).inc()
+    count("places_calls")
+
+
+# Caches already keep hit/miss counters; they are read at scrape time instead
+# of being incremented twice on the hot path.
+
+_cache_sources: Dict[str, Callable[[], dict]] = {}
+
+
+def register_cache(name: str, stats: Callable[[], dict]):
+    """Expose a cache's ``stats()`` hits and misses as ``cache_requests_total``."""
+    _cache_sources[name] = stats
+
+
+class _CacheCollector:
+    def collect(self):
+        requests = CounterMetricFamily("cache_requests", "Cache lookups by result", labels=["cache", "result"])
+        for name, stats in _cache_sources.items():
+            counters = stats()
+            requests.add_metric([name, "hit"], counters.get("hits", 0))
+            requests.add_metric([name, "miss"], counters.get("misses", 0))
+        yield requests
+
+
+REGISTRY.register(_CacheCollector())
+
+
+def instrument_engine(engine):
+    """Count SQL statements executed through ``engine``."""
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count_query(conn, cursor, statement, parameters, context, executemany):
+        DB_QUERIES.inc()
+        count("db_queries")
+
+
+def _route_label(scope: dict) -> str:
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    # Mounted apps (e.g. /assets) set no route; label them by mount path
+    if "endpoint" in scope:
+        return scope.get("root_path") or "unmatched"
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, DB queries and Places calls per route template.
+
+    Plain ASGI rather than ``BaseHTTPMiddleware`` so streaming responses pass
+    through untouched; latency runs until the last body chunk is sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        counters = {}
+        token = _request_counters.set(counters)
+        start = time.perf_counter()
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            _request_counters.reset(token)
+            route = _route_label(scope)
+            HTTP_REQUEST_SECONDS.labels(method=scope["method"], route=route,
+                                        status=str(status_code)).observe(time.perf_counter() - start)
+            DB_QUERIES_PER_REQUEST.labels(route=route).observe(counters.get("db_queries", 0))
+            if "places_calls" in counters:
+                PLACES_CALLS_PER_REQUEST.labels(route=route).observe(counters["places_calls"])
+
+
+class LoopLagMonitor:
+    """Background task measuring how late the event loop wakes a sleeping task."""
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL_SECONDS):
+        self.interval = interval
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            due = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            LOOP_LAG_SECONDS.observe(max(0.0, loop.time() - due))
+
+    def start(self):
+        if METRICS_ENABLED and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+loop_lag_monitor = LoopLagMonitor()
+
+
+def render_metrics():
+    """Return the Prometheus text exposition and its content type."""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -1,12 +1,12 @@
 from .database import Base
-from sqlalchemy import Integer, String, Column, ForeignKey
+from sqlalchemy import BigInteger, Integer, String, Column, ForeignKey, Text, DateTime, Date, Float, Index, text
 from sqlalchemy.orm import relationship
 
 class User(Base) :
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, nullable=False)
     username = Column(String(50), nullable=False)
-    email = Column(String(100), nullable=False)
+    email = Column(String(100), nullable=False, unique=True, index=True)
     password = Column(String(100), nullable=False)
     role = Column(Integer, nullable=False)
     bookings = relationship("Booking", back_populates="user")
@@ -15,10 +15,16 @@ class Booking(Base):
     __tablename__ = "bookings"
     id = Column(Integer, primary_key=True, nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    date = Column(String(20), nullable=False)
+    date = Column(Date, nullable=False)
     service_type = Column(String(20), nullable=True)
     status = Column(Integer, nullable=False)
     user = relationship("User", back_populates="bookings")
+    # Lists page through id, so each filter's index ends in id
+    __table_args__ = (
+        Index("ix_bookings_user_id_id", "user_id", "id"),
+        Index("ix_bookings_status_id", "status", "id"),
+        Index("ix_bookings_date", "date"),
+    )
     
 class Photo(Base):
     __tablename__ = "photos"
@@ -26,4 +32,57 @@ class Photo(Base):
     photo = Column(String(300), nullable=False)
     title = Column(String(100), nullable=False)
     description = Column(String(300), nullable=True)
-    category = Column(String(50), nullable=False)
\ No newline at end of file
+    category = Column(String(50), nullable=False)
+    # Content hash and size of the stored file; null for photos uploaded before hashing
+    sha256 = Column(String(64), nullable=True)
+    size = Column(BigInteger, nullable=True)
+    __table_args__ = (
+        Index("ix_photos_category_id", "category", "id"),
+        Index("ix_photos_sha256", "sha256"),
+    )
+
+class Job(Base):
+    __tablename__ = "jobs"
+    id = Column(String(32), primary_key=True, nullable=False)
+    kind = Column(String(50), nullable=False)
+    status = Column(String(20), nullable=False)
+    priority = Column(Integer, nullable=False, default=0)
+    dedup_key = Column(String(64), nullable=False)
+    payload = Column(Text, nullable=False)
+    result = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False)
+    available_at = Column(DateTime, nullable=False)
+    created_at = Column(DateTime, nullable=False)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    __table_args__ = (
+        Index("ix_jobs_status_priority", "status", "priority", "created_at"),
+        # At most one queued or running job per dedup key, across all instances
+        Index("ux_jobs_dedup_key_active", "dedup_key", unique=True,
+              postgresql_where=text("status IN ('queued', 'running')"),
+              sqlite_where=text("status IN ('queued', 'running')")),
+    )
+
+class GeminiUsage(Base):
+    __tablename__ = "gemini_usage"
+    id = Column(Integer, primary_key=True, nullable=False)
+    day = Column(Date, nullable=False)
+    # No foreign key: usage history outlives deleted users, and a token for a
+    # deleted user must not make a whole batch fail to insert
+    user_id = Column(Integer, nullable=True)
+    route = Column(String(200), nullable=False)
+    model = Column(String(100), nullable=False)
+    prompt_template = Column(String(100), nullable=True)
+    calls = Column(Integer, nullable=False, default=0)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    candidate_tokens = Column(Integer, nullable=False, default=0)
+    image_tokens = Column(Integer, nullable=False, default=0)
+    total_tokens = Column(Integer, nullable=False, default=0)
+    latency_seconds = Column(Float, nullable=False, default=0)
+    cost_usd = Column(Float, nullable=False, default=0)
+    __table_args__ = (
+        Index("ix_gemini_usage_day_user", "day", "user_id"),
+        Index("ix_gemini_usage_day_route", "day", "route"),
+    )
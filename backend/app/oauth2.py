@@ -1,18 +1,40 @@
+import hashlib
+import os
+import time
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from . import schemas
-from .database import get_db
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from . import models
+from sqlalchemy import event, inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from . import models, metrics
 from .database import SessionLocal
+from .ttl_cache import TTLCache
+from dotenv import load_dotenv
+
+load_dotenv()
 
 SECRET_KEY = "1234567890"
 ALGORITHM = "HS256"
 EXPIRATION_TIME = 60 * 60 * 24 * 7
+ADMIN_ROLE = 1
+
+# Verified tokens are kept for TOKEN_CACHE_TTL_SECONDS (never past their own
+# expiry) so repeat calls skip the signature check
+TOKEN_CACHE_TTL_SECONDS = float(os.getenv("TOKEN_CACHE_TTL_SECONDS", "300"))
+TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", "10000"))
+# Roles read from the database, dropped as soon as a user's role is changed
+ROLE_CACHE_TTL_SECONDS = float(os.getenv("ROLE_CACHE_TTL_SECONDS", "300"))
+ROLE_CACHE_MAX_ENTRIES = int(os.getenv("ROLE_CACHE_MAX_ENTRIES", "10000"))
+
+token_cache = TTLCache(maxsize=TOKEN_CACHE_MAX_ENTRIES, ttl=TOKEN_CACHE_TTL_SECONDS)
+role_cache = TTLCache(maxsize=ROLE_CACHE_MAX_ENTRIES, ttl=ROLE_CACHE_TTL_SECONDS)
+metrics.register_cache("tokens", token_cache.stats)
+metrics.register_cache("roles", role_cache.stats)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl = "login")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl = "login", auto_error = False)
 
 def create_access_token(data : dict) :
     to_encode = data.copy()
@@ -21,7 +43,16 @@ def create_access_token(data : dict) :
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm = ALGORITHM)
     return encoded_jwt
 
+def user_claims(user) -> dict :
+    """Claims identifying ``user`` in an access token"""
+    return { "id" : user.id, "email" : user.email, "role" : user.role }
+
 def verify_access_token(token : str, credentials_exception) :
+    # Keyed by digest so the cache never holds usable bearer tokens
+    key = hashlib.sha256(token.encode()).digest()
+    token_data = token_cache.get(key)
+    if token_data is not None :
+        return token_data
     try :
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         id = payload.get("id")
@@ -29,12 +60,15 @@ def verify_access_token(token : str, credentials_exception) :
     
         if not id :
             raise credentials_exception
-        token_data = schemas.TokenData(id = id, email = email)
+        token_data = schemas.TokenData(id = id, email = email, role = payload.get("role"))
     except JWTError :
         raise credentials_exception
+    ttl = min(TOKEN_CACHE_TTL_SECONDS, payload["exp"] - time.time()) if "exp" in payload else TOKEN_CACHE_TTL_SECONDS
+    if ttl > 0 :
+        token_cache.set(key, token_data, ttl)
     return token_data
     
-def get_current_user(token : str = Depends(oauth2_scheme), db : Session = Depends(get_db)) :
+async def get_current_user(token : str = Depends(oauth2_scheme)) :
     credentials_exception = HTTPException(status_code = status.HTTP_401_UNAUTHORIZED, 
                                           detail = "error",
                                           headers = { "WWW-authenticate" : "Bearer"}
@@ -42,10 +76,51 @@ def get_current_user(token : str = Depends(oauth2_scheme), db : Session = Depend
     token_data = verify_access_token(token, credentials_exception)
     return token_data
 
-def check_authorization(user) :
-    db = SessionLocal()
-    user_from_db = db.query(models.User).filter(models.User.id == user.id).first()
-    if user_from_db.role != 1 :
-        raise HTTPException(status_code = status.HTTP_401_UNAUTHORIZED, detail = "Unauthorized Access")
-    db.close()
-    return user_from_db
\ No newline at end of file
+async def get_optional_user(token : str = Depends(optional_oauth2_scheme)) :
+    """Return the token's user for endpoints that also serve anonymous callers, or None"""
+    if not token :
+        return None
+    try :
+        return verify_access_token(token, HTTPException(status_code = status.HTTP_401_UNAUTHORIZED))
+    except HTTPException :
+        return None
+
+async def get_role(user_id : int, db : AsyncSession = None) :
+    """Current role of ``user_id`` (None if the user is gone), cached until it changes.
+
+    Reads through ``db`` on a cache miss, or a session of its own when none is given.
+    """
+    role = role_cache.get(user_id)
+    if role is not None :
+        return role
+    if db is None :
+        async with SessionLocal() as db :
+            return await get_role(user_id, db)
+    user_from_db = await db.get(models.User, user_id)
+    if user_from_db is None :
+        return None
+    role_cache.set(user_id, user_from_db.role)
+    return user_from_db.role
+
+async def check_authorization(user, db : AsyncSession = None) :
+    """Raise 401 unless ``user`` is an admin.
+
+    A token whose role claim is not admin is rejected outright; an admin
+    claim is still confirmed against the current role, so demotions apply
+    to tokens already issued.
+    """
+    unauthorized = HTTPException(status_code = status.HTTP_401_UNAUTHORIZED, detail = "Unauthorized Access")
+    if user.role is not None and user.role != ADMIN_ROLE :
+        raise unauthorized
+    if await get_role(user.id, db) != ADMIN_ROLE :
+        raise unauthorized
+    return user
+
+@event.listens_for(models.User, "after_update")
+def _invalidate_changed_role(mapper, connection, target) :
+    if inspect(target).attrs.role.history.has_changes() :
+        role_cache.pop(target.id)
+
+@event.listens_for(models.User, "after_delete")
+def _invalidate_deleted_user(mapper, connection, target) :
+    role_cache.pop(target.id)
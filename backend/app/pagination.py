@@ -0,0 +1,64 @@
+import os
+from dataclasses import dataclass
+from typing import Iterable, Optional, Sequence
+from fastapi import HTTPException, Query, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_PAGE_LIMIT = int(os.getenv("DEFAULT_PAGE_LIMIT", "50"))
+MAX_PAGE_LIMIT = int(os.getenv("MAX_PAGE_LIMIT", "500"))
+
+
+@dataclass
+class PageParams:
+    limit: int
+    after: Optional[int]
+    fields: Optional[str]
+
+
+def page_params(
+    limit: int = Query(DEFAULT_PAGE_LIMIT, ge=1, le=MAX_PAGE_LIMIT, description="Maximum items per page"),
+    after: Optional[int] = Query(None, description="Cursor: return items whose id is greater than this"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return; id is always included"),
+) -> PageParams:
+    """Dependency reading the shared ``limit``/``after``/``fields`` list parameters."""
+    return PageParams(limit=limit, after=after, fields=fields)
+
+
+def _columns(model, fields: Optional[str], allowed: Sequence[str]):
+    if fields is None:
+        names = list(allowed)
+    else:
+        names = [name.strip() for name in fields.split(",") if name.strip()]
+        unknown = [name for name in names if name not in allowed]
+        if unknown:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail=f"Unknown fields {', '.join(unknown)}; use any of {', '.join(allowed)}")
+    if "id" not in names:
+        names.insert(0, "id")
+    return [getattr(model, name) for name in names]
+
+
+async def paginate(db: AsyncSession, model, page: PageParams, allowed: Sequence[str],
+                   filters: Iterable = ()) -> dict:
+    """One keyset page of ``model`` rows matching ``filters``, ordered by id.
+
+    Only the requested columns are selected, and the page starts after the
+    ``after`` id instead of at an offset, so cost stays flat however deep the
+    client pages. ``next_after`` is the cursor for the next page, or None on
+    the last one.
+    """
+    query = select(*_columns(model, page.fields, allowed)).where(*filters)
+    if page.after is not None:
+        query = query.where(model.id > page.after)
+    # One extra row tells whether another page follows without a COUNT
+    rows = (await db.execute(query.order_by(model.id).limit(page.limit + 1))).all()
+    has_more = len(rows) > page.limit
+    rows = rows[:page.limit]
+    return {
+        "items": [dict(row._mapping) for row in rows],
+        "next_after": rows[-1].id if has_more else None,
+    }
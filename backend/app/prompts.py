@@ -0,0 +1,281 @@
+import hashlib
+import math
+import string
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+# Prompt registry: every prompt sent to Gemini is a versioned template defined
+# once here. Bump a template's version when its wording changes on purpose; its
+# ``key`` also carries a fingerprint of the text, so cache entries and job dedup
+# keys built from it never outlive an edit.
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token) for prompt accounting."""
+    return math.ceil(len(text) / 4)
+
+
+class RenderedPrompt(str):
+    """Prompt text that remembers which template it was rendered from, for usage accounting."""
+    template_id: Optional[str] = None
+
+
+def _rendered(text: str, template_id: str) -> RenderedPrompt:
+    rendered = RenderedPrompt(text)
+    rendered.template_id = template_id
+    return rendered
+
+
+@dataclass
+class PromptTemplate:
+    """A ``str.format`` prompt template with a name and version."""
+    name: str
+    version: int
+    text: str
+    fingerprint: str = field(init=False)
+    fields: Tuple[str, ...] = field(init=False)
+
+    def __post_init__(self):
+        self.fingerprint = hashlib.sha256(self.text.encode("utf-8")).hexdigest()[:12]
+        self.fields = tuple(sorted({name for _, name, _, _ in string.Formatter().parse(self.text) if name}))
+
+    @property
+    def id(self) -> str:
+        return f"{self.name}@v{self.version}"
+
+    @property
+    def key(self) -> str:
+        """Template id plus text fingerprint, for cache and dedup keys."""
+        return f"{self.id}:{self.fingerprint}"
+
+    @property
+    def static_tokens(self) -> int:
+        """Estimated tokens of the template text itself, excluding substituted values."""
+        literal = "".join(text for text, _, _, _ in string.Formatter().parse(self.text))
+        return estimate_tokens(literal)
+
+    def render(self, **values) -> RenderedPrompt:
+        return _rendered(self.text.format(**values), self.id)
+
+    def describe(self) -> dict:
+        return {
+            "id": self.id,
+            "version": self.version,
+            "fingerprint": self.fingerprint,
+            "fields": list(self.fields),
+            "static_tokens": self.static_tokens,
+        }
+
+
+_registry: Dict[str, PromptTemplate] = {}
+
+
+def register(name: str, version: int, text: str) -> PromptTemplate:
+    if name in _registry:
+        raise ValueError(f"Prompt template {name} is already registered")
+    template = PromptTemplate(name=name, version=version, text=text)
+    _registry[name] = template
+    return template
+
+
+def get_template(name: str) -> PromptTemplate:
+    return _registry[name]
+
+
+def describe_templates() -> List[dict]:
+    """Id, version, fingerprint and static token estimate of every registered template."""
+    return [template.describe() for template in _registry.values()]
+
+
+# Static lookup tables
+
+SHOPPING_PLATFORMS = {
+    "United States": ["amazon.com", "wayfair.com", "homedepot.com", "lowes.com", "ikea.com"],
+    "United Kingdom": ["amazon.co.uk", "argos.co.uk", "ikea.com", "johnlewis.com", "dfs.co.uk"],
+    "Germany": ["amazon.de", "ikea.com", "otto.de", "moebel.de", "xxxlutz.de"],
+    "France": ["amazon.fr", "ikea.com", "conforama.fr", "but.fr", "leroymerlin.fr"],
+    "Canada": ["amazon.ca", "ikea.com", "homedepot.ca", "wayfair.ca", "costco.ca"],
+    "Australia": ["amazon.com.au", "ikea.com", "bunnings.com.au", "fantastic-furniture.com.au", "harvey-norman.com.au"],
+    "India": ["amazon.in", "flipkart.com", "pepperfry.com", "urbanladder.com", "ikea.com"],
+    "Bangladesh": ["daraz.com.bd", "pickaboo.com", "bagdoom.com", "othoba.com", "ajkerdeal.com"],
+    "Japan": ["amazon.co.jp", "ikea.com", "nitori-net.jp", "rakuten.co.jp", "yodobashi.com"],
+    "South Korea": ["coupang.com", "11st.co.kr", "ikea.com", "homeplus.co.kr", "lotte.com"],
+    "Brazil": ["amazon.com.br", "ikea.com", "casasbahia.com.br", "magazineluiza.com.br", "mobly.com.br"],
+    "Mexico": ["amazon.com.mx", "ikea.com", "liverpool.com.mx", "homedepot.com.mx", "coppel.com"],
+    "Italy": ["amazon.it", "ikea.com", "leroy-merlin.it", "mondo-convenienza.it", "maisons-du-monde.com"],
+    "Spain": ["amazon.es", "ikea.com", "leroymerlin.es", "el-corte-ingles.es", "maisons-du-monde.com"],
+    "Netherlands": ["bol.com", "ikea.com", "fonq.nl", "wehkamp.nl", "gamma.nl"],
+    "Sweden": ["ikea.com", "ellos.se", "jysk.se", "rusta.com", "bauhaus.se"],
+    "Norway": ["ikea.com", "jysk.no", "rusta.com", "elkjop.no", "bauhaus.no"],
+    "Denmark": ["ikea.com", "jysk.dk", "ilva.dk", "bauhaus.dk", "rusta.com"],
+    "Finland": ["ikea.com", "jysk.fi", "bauhaus.fi", "rusta.com", "verkkokauppa.com"],
+    "Russia": ["ozon.ru", "wildberries.ru", "ikea.com", "leroymerlin.ru", "hoff.ru"],
+    "China": ["tmall.com", "jd.com", "ikea.cn", "suning.com", "gome.com.cn"],
+    "Singapore": ["lazada.sg", "shopee.sg", "ikea.com", "courts.com.sg", "harvey-norman.com.sg"],
+    "Malaysia": ["lazada.com.my", "shopee.com.my", "ikea.com", "courts.com.my", "senheng.com.my"],
+    "Thailand": ["lazada.co.th", "shopee.co.th", "ikea.com", "homepro.co.th", "powerbuy.co.th"],
+    "Philippines": ["lazada.com.ph", "shopee.ph", "ikea.com", "sm-store.com", "robinsons.com.ph"],
+    "Indonesia": ["tokopedia.com", "shopee.co.id", "blibli.com", "ikea.com", "ace.id"],
+    "Vietnam": ["shopee.vn", "lazada.vn", "tiki.vn", "sendo.vn", "ikea.com"],
+    "South Africa": ["takealot.com", "makro.co.za", "ikea.com", "game.co.za", "builders.co.za"],
+    "Nigeria": ["jumia.com.ng", "konga.com", "slot.ng", "ikea.com", "shoprite.co.za"],
+    "Egypt": ["jumia.com.eg", "souq.com", "ikea.com", "carrefour.com", "b.tech"],
+    "UAE": ["amazon.ae", "noon.com", "ikea.com", "carrefour.ae", "sharaf-dg.com"],
+    "Saudi Arabia": ["amazon.sa", "noon.com", "ikea.com", "extra.com", "jarir.com"]
+}
+DEFAULT_SHOPPING_PLATFORMS = ["amazon.com", "ikea.com", "wayfair.com"]
+
+# Placeholder rooms returned by room detection when ROOM_DETECTION_FALLBACK is enabled
+FALLBACK_ROOMS = [
+    {"id": "room_1", "label": "Living Room", "type": "living_room", "coordinates": {"x": 300, "y": 120, "width": 180, "height": 140}, "confidence": 0.9, "furniture": ["sofa", "coffee table"], "description": "Main living area"},
+    {"id": "room_2", "label": "Kitchen", "type": "kitchen", "coordinates": {"x": 120, "y": 120, "width": 100, "height": 100}, "confidence": 0.9, "furniture": ["island", "appliances"], "description": "Cooking area"},
+    {"id": "room_3", "label": "Dining Room", "type": "dining_room", "coordinates": {"x": 400, "y": 360, "width": 100, "height": 80}, "confidence": 0.9, "furniture": ["dining table", "chairs"], "description": "Dining area"},
+    {"id": "room_4", "label": "Bedroom 1", "type": "bedroom", "coordinates": {"x": 520, "y": 60, "width": 100, "height": 100}, "confidence": 0.9, "furniture": ["bed", "wardrobe"], "description": "Master bedroom"},
+    {"id": "room_5", "label": "Bedroom 2", "type": "bedroom", "coordinates": {"x": 120, "y": 360, "width": 100, "height": 100}, "confidence": 0.9, "furniture": ["bed", "desk"], "description": "Secondary bedroom"},
+    {"id": "room_6", "label": "Bathroom", "type": "bathroom", "coordinates": {"x": 400, "y": 60, "width": 80, "height": 80}, "confidence": 0.9, "furniture": ["toilet", "sink", "shower"], "description": "Bathroom facilities"},
+    {"id": "room_7", "label": "Hallway", "type": "hallway", "coordinates": {"x": 480, "y": 260, "width": 60, "height": 100}, "confidence": 0.9, "furniture": ["console table"], "description": "Main hallway"}
+]
+
+
+# Image prompts
+
+PHOTO_TRANSFORM = register("photo_transform", 1, (
+    "Transform this image to create a detailed and photorealistic image based on: {prompt}"
+))
+
+INTERIOR_RENOVATION = register("interior_renovation", 1, (
+    "Transform this interior space to create a detailed and photorealistic renovation based on: {prompt}"
+))
+
+INTERIOR_DESIGN = register("interior_design", 1, (
+    "Create a detailed and photorealistic interior design image based on: {prompt}"
+))
+
+SYSTEM_PROMPT_2D_TO_3D = '''
+You are an image generation assistant that converts *2D single-floor plans* into *full 3D interior models*.
+
+Input: A 2D single-floor plan image.
+Output: A high-resolution 3D rendering showing the *entire interior of the floor*, including all rooms, walls, doors, windows, and furniture.
+
+Rules:
+1. *Full Floor Coverage:* Always render the *entire floor layout*. Do not generate single rooms, exterior views, or partial floor areas.
+2. *Layout Accuracy:* Reconstruct walls, doors, windows, and partitions exactly as in the floor plan.
+3. *Furniture & Materials:*
+   * Place beds, sofas, dining tables, kitchen units, and other essentials according to the plan.
+   * Floors: wood in living/bedrooms, tiles in kitchen/bathrooms.
+   * Walls: neutral colors (white, cream).
+4. *Lighting:* Use natural daylight from windows and warm ambient interior lighting.
+5. *Camera & Angle:*
+   * Primary: isometric/top-down view with a 30-45° tilt of the full floor.
+   * Use a wide-angle lens (24–28mm) for interiors.
+
+Constraints:
+• Never generate exterior house views or partial rooms unless explicitly instructed.
+• Always assume the user wants a *complete interior 3D visualization of the single-floor plan*.
+'''
+
+FLOOR_PLAN_TO_3D = register("floor_plan_to_3d", 1, (
+    SYSTEM_PROMPT_2D_TO_3D.replace("{", "{{").replace("}", "}}") + "\nUser instructions: {prompt}"
+))
+
+ROOM_INTERIOR = register("room_interior", 1, """
+    Generate a high-quality 3D interior design for a {room_type} ({room_label}) with {design_style} style.
+
+    Requirements:
+    1. Focus only on the {room_type} space
+    2. Use {design_style} design elements and furniture
+    3. Include appropriate lighting and materials
+    4. Make it realistic and functional
+    5. Use warm, inviting colors and textures
+
+    Style: {design_style}
+    Room Type: {room_type}
+    """)
+
+
+# Structured output prompts. The JSON shape is enforced by the response schema
+# (see structured_output.json_config), so the prompts only describe the content.
+
+ROOM_DETECTION = register("room_detection", 2, """
+    Analyze this 3D interior design image and identify all visible rooms/spaces with their precise coordinates.
+    This is a 3D rendered interior view, so identify the different functional areas/rooms you can see.
+
+    IMPORTANT: Provide accurate coordinates that correspond to the actual room locations in the image.
+    Look for furniture, fixtures, and architectural elements that indicate different room functions.
+
+    Identify these room types: living_room, kitchen, bedroom, bathroom, dining_room, office, hallway, storage, balcony, other.
+
+    For each room, provide:
+    1. Precise coordinates that match the actual room location in the image
+    2. List of visible furniture/fixtures that identify the room type
+    3. Brief description of the room's function
+    4. High confidence score (0.8-1.0) for accurate detections
+
+    Coordinates should be in pixels relative to the image dimensions.
+    Focus on clearly visible and distinct areas in the 3D view.
+    Make sure the coordinates accurately represent where each room appears in the image.
+    """)
+
+_COST_REQUIREMENTS = """
+    1. Total estimated cost in local currency
+    2. Breakdown by categories (furniture, materials, labor, etc.)
+    3. Individual item costs where applicable
+    4. Consider {country}-specific pricing and market rates"""
+
+COST_3D = register("cost_3d", 2, """
+    Based on the 3D interior design generated from the floor plan and user instructions: "{prompt}" in {country},
+    provide a detailed cost breakdown for the project. Include:""" + _COST_REQUIREMENTS + """
+    """)
+
+COST_RENOVATION = register("cost_renovation", 2, """
+    Based on the interior design renovation described as: "{prompt}" in {country},
+    provide a detailed cost breakdown for the renovation. Include:""" + _COST_REQUIREMENTS + """
+    5. For each item, suggest where it can be purchased from these platforms: {platforms}
+
+    For shopping links, create realistic search URLs for each platform. For example:
+    - Amazon: https://amazon.com/s?k=modern+sofa
+    - IKEA: https://ikea.com/search/?q=sofa
+    - Wayfair: https://wayfair.com/furniture/sb0/sofas-c45974.html
+
+    Make sure the URLs are actual searchable links that would help users find the products.
+    """)
+
+
+# Fragments that depend only on the country are built once at import; the
+# user's prompt is the only value substituted per request.
+
+def _split(template: PromptTemplate, **values) -> Tuple[str, str]:
+    """Pre-render everything except ``{prompt}``, returning the text before and after it."""
+    marker = "\0prompt\0"
+    head, tail = template.render(prompt=marker, **values).split(marker)
+    return head, tail
+
+
+def _cost_fragments(country: str) -> Dict[str, Tuple[str, str]]:
+    platforms = ", ".join(SHOPPING_PLATFORMS.get(country, DEFAULT_SHOPPING_PLATFORMS))
+    return {
+        COST_3D.name: _split(COST_3D, country=country),
+        COST_RENOVATION.name: _split(COST_RENOVATION, country=country, platforms=platforms),
+    }
+
+
+_COUNTRY_FRAGMENTS = {country: _cost_fragments(country) for country in SHOPPING_PLATFORMS}
+
+
+@lru_cache(maxsize=256)
+def _other_country_fragments(country: str) -> Dict[str, Tuple[str, str]]:
+    return _cost_fragments(country)
+
+
+def cost_prompt(template: PromptTemplate, prompt: str, country: str) -> RenderedPrompt:
+    """Render a cost estimation template from its precomputed per-country fragments."""
+    fragments = _COUNTRY_FRAGMENTS.get(country) or _other_country_fragments(country)
+    head, tail = fragments[template.name]
+    return _rendered(head + prompt + tail, template.id)
+
+
+@lru_cache(maxsize=1024)
+def room_prompt(room_type: str, room_label: str, design_style: str) -> RenderedPrompt:
+    """Render the room interior prompt; repeated room/style combinations reuse the same string."""
+    return ROOM_INTERIOR.render(room_type=room_type, room_label=room_label, design_style=design_style)
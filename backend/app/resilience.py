@@ -0,0 +1,128 @@
+import asyncio
+import random
+import time
+from typing import Optional
+
+
+class RateLimited(Exception):
+    """Raised when waiting for a rate limit token would take longer than allowed."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Rate limit exceeded, retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class CircuitOpen(Exception):
+    """Raised while a circuit breaker is open and calls fail fast."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Upstream unavailable, retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Token bucket limiting calls to ``rate`` per second with bursts of up to ``burst``.
+
+    ``acquire`` reserves a token and sleeps until it is due, so waiting callers
+    are served in arrival order without polling.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, max_wait: Optional[float] = None):
+        """Wait for a token; raise ``RateLimited`` instead if that would exceed ``max_wait``."""
+        if self.rate <= 0:
+            return
+        self._refill()
+        wait = max(0.0, (1 - self.tokens) / self.rate)
+        if max_wait is not None and wait > max_wait:
+            raise RateLimited(wait)
+        self.tokens -= 1
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def stats(self) -> dict:
+        self._refill()
+        return {"rate_per_second": self.rate, "burst": self.burst, "tokens": round(self.tokens, 2)}
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker.
+
+    After ``failure_threshold`` failures in a row the circuit opens and calls
+    fail fast for ``reset_seconds``. Then one trial call is let through
+    (half-open): success closes the circuit, failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + self.reset_seconds - time.monotonic())
+
+    def before_call(self) -> bool:
+        """Raise ``CircuitOpen`` if the call must fail fast; return True for the half-open trial call."""
+        if self.state == self.OPEN:
+            if self.retry_after() > 0:
+                raise CircuitOpen(self.retry_after())
+            self.state = self.HALF_OPEN
+            self._trial_in_flight = False
+        if self.state == self.HALF_OPEN:
+            if self._trial_in_flight:
+                raise CircuitOpen(self.reset_seconds)
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self._trial_in_flight = False
+
+    def record_cancelled(self, trial: bool):
+        """Forget a call that ended without an outcome, letting another trial through if it was one."""
+        if trial:
+            self._trial_in_flight = False
+
+    def record_failure(self, hold_seconds: Optional[float] = None):
+        """Count a failure; ``hold_seconds`` keeps the circuit open at least that long once it opens."""
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            if hold_seconds and hold_seconds > self.reset_seconds:
+                self.opened_at += hold_seconds - self.reset_seconds
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "retry_after": round(self.retry_after(), 1) if self.state == self.OPEN else 0,
+        }
+
+
+def backoff_delay(attempt: int, base: float, cap: float, hint: Optional[float] = None) -> float:
+    """Full-jitter exponential backoff for ``attempt`` (0-based), never shorter than a server ``hint``."""
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    if hint is not None:
+        delay = max(delay, hint)
+    return delay
@@ -0,0 +1,217 @@
+import hashlib
+import json
+import os
+import time
+from collections import Counter, OrderedDict
+from typing import Optional
+from starlette.concurrency import run_in_threadpool
+from dotenv import load_dotenv
+from .image_store import image_set_keys
+from .storage import storage
+from . import metrics
+
+load_dotenv()
+
+CACHE_DIR = os.getenv("RESULT_CACHE_DIR", "cache/results")
+CACHE_MAX_BYTES = int(float(os.getenv("RESULT_CACHE_MAX_MB", "1024")) * 1024 * 1024)
+CACHE_TTL_SECONDS = int(float(os.getenv("RESULT_CACHE_TTL_HOURS", "168")) * 3600)
+CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "10000"))
+# Storage prefix owned by the cache; only objects under it are ever deleted
+CACHE_PREFIX = "cache"
+
+
+def cache_prefix(kind: str) -> str:
+    """Storage prefix for cached results of ``kind``, e.g. ``cache/generated``."""
+    return f"{CACHE_PREFIX}/{kind}"
+
+
+def normalize_prompt(prompt: Optional[str]) -> str:
+    """Collapse whitespace and case so trivially different prompts share an entry."""
+    return " ".join((prompt or "").split()).lower()
+
+
+def make_key(model: str, prompt: str, image_bytes: Optional[bytes] = None, **params) -> str:
+    """Build a content-addressed cache key for a generation request.
+
+    The key covers the model, the normalized prompt, the SHA-256 of the input
+    image (if any) and any extra request parameters such as room type or style.
+    """
+    image_hash = hashlib.sha256(image_bytes).hexdigest() if image_bytes else None
+    material = {
+        "model": model,
+        "prompt": normalize_prompt(prompt),
+        "image_sha256": image_hash,
+        "params": {name: normalize_prompt(str(value)) for name, value in sorted(params.items())},
+    }
+    encoded = json.dumps(material, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class ResultCache:
+    """Disk-backed LRU/TTL cache mapping request keys to generated image sets.
+
+    Each entry is a small JSON file in ``directory`` describing an image set
+    (master plus derivatives, see ``image_store``) already written to storage.
+    The metadata file's mtime records the last access so LRU order survives
+    restarts. Evicting an entry deletes its stored objects as well, which keeps
+    the total size under ``max_bytes``.
+
+    Stored keys are content-addressed, so several entries may share an object.
+    Objects are reference counted across entries and deleted only once no
+    entry uses them, and only when they live under ``CACHE_PREFIX``; keys
+    written elsewhere (such as entries recorded before the prefix existed)
+    are left in storage. Metadata file I/O after startup runs in a threadpool.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, ttl_seconds: int, max_entries: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        # Number of entries referencing each storage key
+        self._refs = Counter()
+        # Storage keys of entries dropped while loading, deleted on the next async call
+        self._orphaned_keys = []
+        os.makedirs(self.directory, exist_ok=True)
+        self._load()
+
+    def _meta_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _load(self):
+        found = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            meta_path = os.path.join(self.directory, name)
+            try:
+                with open(meta_path) as f:
+                    entry = json.load(f)
+                found.append((os.path.getmtime(meta_path), name[:-5], entry))
+            except Exception:
+                self._remove_meta(meta_path)
+        for _, key, entry in sorted(found, key=lambda item: item[0]):
+            if "image" not in entry or "key" not in entry["image"] or self._is_expired(entry):
+                self._remove_meta(self._meta_path(key))
+                if "image" in entry and "key" in entry["image"]:
+                    self._orphaned_keys.extend(image_set_keys(entry["image"]))
+                continue
+            self._entries[key] = entry
+            self.total_bytes += entry.get("size", 0)
+            self._refs.update(image_set_keys(entry["image"]))
+        while self._over_budget():
+            oldest_key, entry = self._entries.popitem(last=False)
+            self.total_bytes -= entry.get("size", 0)
+            self._remove_meta(self._meta_path(oldest_key))
+            self._orphaned_keys.extend(self._release(entry["image"]))
+        # Keys of dropped entries may still be used by a surviving one
+        self._orphaned_keys = [k for k in dict.fromkeys(self._orphaned_keys) if not self._refs[k]]
+
+    def _is_expired(self, entry: dict) -> bool:
+        return time.time() - entry.get("created_at", 0) > self.ttl_seconds
+
+    def _over_budget(self) -> bool:
+        return bool(self._entries) and (self.total_bytes > self.max_bytes or len(self._entries) > self.max_entries)
+
+    @staticmethod
+    def _remove_meta(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Error removing cache metadata {path}: {e}")
+
+    def _release(self, image_set: dict) -> list:
+        """Drop one reference to each key of ``image_set``; return the keys now unused."""
+        unused = []
+        for storage_key in image_set_keys(image_set):
+            if self._refs[storage_key] > 1:
+                self._refs[storage_key] -= 1
+            else:
+                del self._refs[storage_key]
+                unused.append(storage_key)
+        return unused
+
+    @staticmethod
+    async def _delete_objects(keys: list):
+        for storage_key in keys:
+            if not storage_key.startswith(CACHE_PREFIX + "/"):
+                continue
+            try:
+                await storage.delete(storage_key)
+            except Exception as e:
+                print(f"Error removing cached object {storage_key}: {e}")
+
+    async def _evict(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry.get("size", 0)
+            await run_in_threadpool(self._remove_meta, self._meta_path(key))
+            await self._delete_objects(self._release(entry["image"]))
+
+    async def _enforce_limits(self):
+        if self._orphaned_keys:
+            orphaned_keys, self._orphaned_keys = self._orphaned_keys, []
+            await self._delete_objects(orphaned_keys)
+        while self._over_budget():
+            await self._evict(next(iter(self._entries)))
+
+    async def get(self, key: str) -> Optional[dict]:
+        """Return the cached image set for ``key``, or None on a miss."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if self._is_expired(entry) or not await storage.exists(entry["image"]["key"]):
+            await self._evict(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        try:
+            await run_in_threadpool(os.utime, self._meta_path(key))
+        except Exception:
+            pass
+        self.hits += 1
+        return entry["image"]
+
+    async def put(self, key: str, image_set: dict):
+        """Record ``image_set`` as the result for ``key`` and evict entries over budget."""
+        size = image_set.get("bytes", 0)
+        entry = {"image": image_set, "size": size, "created_at": time.time()}
+        try:
+            await run_in_threadpool(self._write_meta, self._meta_path(key), entry)
+        except Exception as e:
+            print(f"Error writing result cache entry: {e}")
+            return
+        # Take the new references before releasing the old ones, so objects
+        # shared by both (an identical regeneration) survive
+        self._refs.update(image_set_keys(image_set))
+        old = self._entries.pop(key, None)
+        self._entries[key] = entry
+        self.total_bytes += size
+        if old is not None:
+            self.total_bytes -= old.get("size", 0)
+            await self._delete_objects(self._release(old["image"]))
+        await self._enforce_limits()
+
+    @staticmethod
+    def _write_meta(path: str, entry: dict):
+        with open(path, "w") as f:
+            json.dump(entry, f)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+image_cache = ResultCache(CACHE_DIR, CACHE_MAX_BYTES, CACHE_TTL_SECONDS, CACHE_MAX_ENTRIES)
+metrics.register_cache("result", image_cache.stats)
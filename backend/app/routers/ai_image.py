@@ -1,57 +1,56 @@
-from fastapi import status, APIRouter, HTTPException, UploadFile, File, Form, Request
-from google import genai
-from PIL import Image
-from io import BytesIO
+from datetime import date
+from typing import Optional
+from fastapi import status, APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 import os
 import base64
+import hashlib
 from dotenv import load_dotenv
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import gemini, prompts, oauth2
+from ..database import get_db
+from ..result_cache import image_cache, make_key, cache_prefix
+from ..uploads import ingest_image, sniff_image_format, IngestedImage, IMAGE_MIME_TYPES
+from ..image_store import save_generated_image, image_urls
+from ..storage import storage, private_storage, content_key
+from ..streaming import run_stages, stream_format, stream_stages
+from ..jobs import job_queue, job_handler, JOB_MAX_PRIORITY
+from ..schemas import RoomDetection, CostEstimation
+from ..structured_output import json_config, parse_response, StructuredOutputError
+from ..usage import track_usage, usage_context, current_user_id, usage_recorder, GROUP_COLUMNS
 
 # Load environment variables
 load_dotenv()
 
-router = APIRouter(prefix='/api/v1', tags=['AI Image Generation'])
+# Gemini token usage is attributed to the route and, when a token is sent, the user
+router = APIRouter(prefix='/api/v1', tags=['AI Image Generation'], dependencies=[Depends(track_usage)])
 
-# Configure Google Generative AI client
-try:
-    # Initialize the client with API key from environment variable
-    api_key = os.getenv('GEMINI_KEY')
-    if not api_key:
-        print("Warning: GEMINI_KEY not found in environment variables")
-    
-    client = genai.Client(api_key=api_key)
-    print("Google Generative AI client initialized successfully")
-except Exception as e:
-    print(f"Error configuring Google Generative AI: {e}")
-    client = None
+if not os.getenv('GEMINI_KEY'):
+    print("Warning: GEMINI_KEY not found in environment variables")
 
 
-def _load_image_from_inline(part):
-    """Return a PIL.Image from a Gemini inline_data part, handling base64 strings or raw bytes.
+def _decode_image_part(data) -> bytes:
+    """Return raw image bytes from an inline_data payload.
 
-    Some versions of the google genai SDK return inline_data.data as base64-encoded string,
-    others return raw bytes. This helper normalizes to bytes and opens with PIL safely.
+    The payload may be raw image bytes, base64-encoded bytes or a base64 string
+    depending on the SDK version.
     """
-    inline = getattr(part, "inline_data", None)
-    if inline is None:
-        raise ValueError("No inline_data on part")
-
-    data = getattr(inline, "data", None)
-    if data is None:
-        raise ValueError("No data on inline_data part")
-
-    # Normalize to bytes
     if isinstance(data, str):
-        try:
-            data_bytes = base64.b64decode(data)
-        except Exception as e:
-            # Fallback: treat string as utf-8 bytes (unlikely but safe)
-            data_bytes = data.encode("utf-8")
-    else:
-        data_bytes = data
+        return base64.b64decode(data)
+    if sniff_image_format(bytes(data[:16])):
+        return data
+    return base64.b64decode(data)
 
-    img = Image.open(BytesIO(data_bytes))
-    img.load()
-    return img
+def _extract_image_parts(response) -> list:
+    """Return the inline image payloads of a response, under either SDK spelling (inline_data or inlineData)."""
+    image_parts = []
+    for part in response.candidates[0].content.parts:
+        if hasattr(part, 'inline_data') and part.inline_data:
+            image_parts.append(part.inline_data.data)
+        elif hasattr(part, 'inlineData') and part.inlineData:
+            image_parts.append(part.inlineData.data)
+    return image_parts
 
 @router.post('/generate-image-prompt')
 async def generate_image_from_prompt(
@@ -62,36 +61,17 @@ async def generate_image_from_prompt(
     Generate an image based on a text prompt using Google Generative AI.
     """
     try:
-        # Check if client is initialized
-        global client
-        if client is None:
-            # Try to initialize client again
-            try:
-                api_key = os.getenv('GEMINI_KEY')
-                if not api_key:
-                    raise ValueError("GEMINI_KEY not found in environment variables")
-                client = genai.Client(api_key=api_key)
-                print("Google Generative AI client initialized successfully")
-            except Exception as e:
-                raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, 
-                                   detail=f"Failed to initialize Google Generative AI client: {str(e)}")
-        
-        # Ensure assets directory exists
-        os.makedirs("assets", exist_ok=True)
+        # Make sure the shared Gemini client is available
+        gemini.get_client()
         
         # Generate content using the model - use exact format from docs
-        response = client.models.generate_content(
-            model="gemini-2.5-flash-image-preview",
-            contents=prompt
+        response = await gemini.generate_content(
+            model=gemini.IMAGE_MODEL,
+            contents=prompt,
+            timeout=gemini.MODEL_TIMEOUT_SECONDS[gemini.IMAGE_MODEL]
         )
         
-        # Extract image parts exactly as shown in docs - check for both inline_data and inlineData
-        image_parts = []
-        for part in response.candidates[0].content.parts:
-            if hasattr(part, 'inline_data') and part.inline_data:
-                image_parts.append(part.inline_data.data)
-            elif hasattr(part, 'inlineData') and part.inlineData:
-                image_parts.append(part.inlineData.data)
+        image_parts = _extract_image_parts(response)
         
         if image_parts:
             # Save the generated image using the working pattern
@@ -100,42 +80,27 @@ async def generate_image_from_prompt(
                 print(f"Image data type: {type(image_parts[0])}")
                 print(f"Image data length: {len(image_parts[0])}")
                 
-                # The data is base64 encoded bytes, decode it first
-                if isinstance(image_parts[0], bytes):
-                    # Convert bytes to string first, then decode base64
-                    base64_string = image_parts[0].decode('utf-8')
-                    decoded_data = base64.b64decode(base64_string)
-                elif isinstance(image_parts[0], str):
-                    # Already a string, decode base64 directly
-                    decoded_data = base64.b64decode(image_parts[0])
-                else:
-                    decoded_data = image_parts[0]
-                
-                image = Image.open(BytesIO(decoded_data))
-                
-                print(f"Image opened successfully, size: {image.size}")
+                decoded_data = _decode_image_part(image_parts[0])
                 
-                image_path = f"assets/generated_{os.urandom(16).hex()}.png"
-                image.save(image_path)
-                print(f"Successfully generated and saved image: {image_path}")
+                # Store a compressed master plus resized derivatives, off the event loop
+                saved_image = await save_generated_image(decoded_data, "generated")
+                print(f"Successfully generated and saved image: {saved_image['key']}")
                 
                 # Get the base URL from the request
                 base_url = str(request.base_url).rstrip('/')
-                full_image_url = f"{base_url}/{image_path}"
                 
-                return {"image_url": full_image_url}
+                return image_urls(saved_image, base_url)
             except Exception as e:
                 print(f"Error processing generated image: {e}")
                 
                 # Save debug info
-                debug_file = f"assets/debug_error_{os.urandom(8).hex()}.txt"
-                with open(debug_file, 'w') as f:
-                    f.write(f"Error: {e}\n")
-                    f.write(f"Image parts count: {len(image_parts)}\n")
-                    if image_parts:
-                        f.write(f"Data type: {type(image_parts[0])}\n")
-                        f.write(f"Data length: {len(image_parts[0])}\n")
-                        f.write(f"First 100 chars: {repr(image_parts[0][:100])}\n")
+                debug_file = f"debug/error_{os.urandom(8).hex()}.txt"
+                debug_lines = [f"Error: {e}", f"Image parts count: {len(image_parts)}"]
+                if image_parts:
+                    debug_lines.append(f"Data type: {type(image_parts[0])}")
+                    debug_lines.append(f"Data length: {len(image_parts[0])}")
+                    debug_lines.append(f"First 100 chars: {repr(image_parts[0][:100])}")
+                await private_storage.put_bytes(debug_file, ("\n".join(debug_lines) + "\n").encode("utf-8"), "text/plain")
                 
                 return {"message": f"Error processing generated image: {str(e)}. Debug saved to {debug_file}"}
         else:
@@ -157,95 +122,40 @@ async def generate_image_from_prompt(
 async def generate_image_from_upload(
     request: Request,
     prompt: str = Form(...),
-    image: UploadFile = File(...)
+    image: UploadFile = File(...),
+    force_regenerate: bool = Form(False)
 ):
     """
     Generate an image based on a text prompt and an uploaded image using Google Generative AI.
+    Identical prompt + image pairs are served from the result cache unless force_regenerate is set.
     """
     try:
-        # Check if client is initialized
-        global client
-        if client is None:
-            # Try to initialize client again
-            try:
-                api_key = os.getenv('GEMINI_KEY')
-                if not api_key:
-                    raise ValueError("GEMINI_KEY not found in environment variables")
-                client = genai.Client(api_key=api_key)
-                print("Google Generative AI client initialized successfully")
-            except Exception as e:
-                raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, 
-                                   detail=f"Failed to initialize Google Generative AI client: {str(e)}")
-        
-        # Ensure assets directory exists
-        os.makedirs("assets", exist_ok=True)
-        
-        # Validate content type (best-effort)
-        allowed_types = {"image/png", "image/jpeg", "image/webp"}
-        if image.content_type and image.content_type not in allowed_types:
-            raise HTTPException(status_code=400, detail=f"Unsupported image type: {image.content_type}")
-
-        # Read the uploaded image
-        image_data = await image.read()
-        
-        # Save the uploaded image temporarily to ensure it's a valid image file
-        temp_path = f"assets/temp_{os.urandom(8).hex()}"
-        # Preserve extension if provided
-        ext = ".png"
-        if image.filename and "." in image.filename:
-            ext = "." + image.filename.split(".")[-1].lower()
-        temp_path = temp_path + ext
-        with open(temp_path, "wb") as f:
-            f.write(image_data)
-        
-        # Open the image with PIL (try temp path, fallback to BytesIO)
-        try:
-            img = Image.open(temp_path)
-            img.load()
-            if img.size[0] == 0 or img.size[1] == 0:
-                try:
-                    os.remove(temp_path)
-                except Exception:
-                    pass
-                raise HTTPException(status_code=400, detail="Invalid image upload: Empty or corrupt image file")
-        except Exception:
-            try:
-                img = Image.open(BytesIO(image_data))
-                img.load()
-                if img.size[0] == 0 or img.size[1] == 0:
-                    try:
-                        os.remove(temp_path)
-                    except Exception:
-                        pass
-                    raise HTTPException(status_code=400, detail="Invalid image upload: Empty or corrupt image file")
-            except Exception as e:
-                # Clean temp file and abort with bad request
-                try:
-                    os.remove(temp_path)
-                except Exception:
-                    pass
-                raise HTTPException(status_code=400, detail=f"Invalid image upload: {e}")
-        
-        # Provide prompt and PIL image directly as contents; SDK wraps into a single user content
-        detailed_prompt = f"Transform this image to create a detailed and photorealistic image based on: {prompt}"
-        response = client.models.generate_content(
-            model="gemini-2.5-flash-image-preview",
-            contents=[detailed_prompt, img]
+        # Make sure the shared Gemini client is available
+        gemini.get_client()
+        
+        # Read and validate the uploaded image; decoding waits until after the cache lookup
+        upload = await ingest_image(image)
+        
+        # Serve repeated prompt + image pairs from the result cache
+        cache_key = make_key(gemini.IMAGE_MODEL, prompt, upload.data, template=prompts.PHOTO_TRANSFORM.key)
+        base_url = str(request.base_url).rstrip('/')
+        if not force_regenerate:
+            cached_image = await image_cache.get(cache_key)
+            if cached_image:
+                return {**image_urls(cached_image, base_url), "cached": True}
+        
+        # Downscale and re-encode the photo before sending it to the model
+        prepared = await upload.prepare("photo")
+        
+        # Provide prompt and image directly as contents; SDK wraps into a single user content
+        detailed_prompt = prompts.PHOTO_TRANSFORM.render(prompt=prompt)
+        response = await gemini.generate_content(
+            model=gemini.IMAGE_MODEL,
+            contents=[detailed_prompt, gemini.image_part(prepared)],
+            timeout=gemini.MODEL_TIMEOUT_SECONDS[gemini.IMAGE_MODEL]
         )
         
-        # Remove the temporary file
-        try:
-            os.remove(temp_path)
-        except Exception:
-            pass
-        
-        # Extract image parts exactly as shown in docs - check for both inline_data and inlineData
-        image_parts = []
-        for part in response.candidates[0].content.parts:
-            if hasattr(part, 'inline_data') and part.inline_data:
-                image_parts.append(part.inline_data.data)
-            elif hasattr(part, 'inlineData') and part.inlineData:
-                image_parts.append(part.inlineData.data)
+        image_parts = _extract_image_parts(response)
         
         if image_parts:
             # Save the generated image using the working pattern
@@ -254,29 +164,14 @@ async def generate_image_from_upload(
                 print(f"Image data type: {type(image_parts[0])}")
                 print(f"Image data length: {len(image_parts[0])}")
                 
-                # The data is base64 encoded bytes, decode it first
-                if isinstance(image_parts[0], bytes):
-                    # Convert bytes to string first, then decode base64
-                    base64_string = image_parts[0].decode('utf-8')
-                    decoded_data = base64.b64decode(base64_string)
-                elif isinstance(image_parts[0], str):
-                    # Already a string, decode base64 directly
-                    decoded_data = base64.b64decode(image_parts[0])
-                else:
-                    decoded_data = image_parts[0]
-                
-                generated_image = Image.open(BytesIO(decoded_data))
-                print(f"Image opened successfully, size: {generated_image.size}")
-                
-                image_path = f"assets/generated_{os.urandom(16).hex()}.png"
-                generated_image.save(image_path)
-                print(f"Successfully generated and saved image: {image_path}")
+                decoded_data = _decode_image_part(image_parts[0])
                 
-                # Get the base URL from the request
-                base_url = str(request.base_url).rstrip('/')
-                full_image_url = f"{base_url}/{image_path}"
+                # Store a compressed master plus resized derivatives, off the event loop
+                saved_image = await save_generated_image(decoded_data, cache_prefix("generated"))
+                print(f"Successfully generated and saved image: {saved_image['key']}")
+                await image_cache.put(cache_key, saved_image)
                 
-                return {"image_url": full_image_url}
+                return {**image_urls(saved_image, base_url), "cached": False}
             except Exception as e:
                 print(f"Error processing generated image: {e}")
                 return {"message": f"Error processing generated image: {str(e)}"}
@@ -295,28 +190,19 @@ async def generate_image_from_upload(
         print(f"Error generating image with upload: {str(e)}")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error generating image: {str(e)}")
 
-SYSTEM_PROMPT_2D_TO_3D = '''
-You are an image generation assistant that converts *2D single-floor plans* into *full 3D interior models*.
-
-Input: A 2D single-floor plan image.
-Output: A high-resolution 3D rendering showing the *entire interior of the floor*, including all rooms, walls, doors, windows, and furniture.
-
-Rules:
-1. *Full Floor Coverage:* Always render the *entire floor layout*. Do not generate single rooms, exterior views, or partial floor areas.
-2. *Layout Accuracy:* Reconstruct walls, doors, windows, and partitions exactly as in the floor plan.
-3. *Furniture & Materials:*
-   * Place beds, sofas, dining tables, kitchen units, and other essentials according to the plan.
-   * Floors: wood in living/bedrooms, tiles in kitchen/bathrooms.
-   * Walls: neutral colors (white, cream).
-4. *Lighting:* Use natural daylight from windows and warm ambient interior lighting.
-5. *Camera & Angle:*
-   * Primary: isometric/top-down view with a 30-45° tilt of the full floor.
-   * Use a wide-angle lens (24–28mm) for interiors.
-
-Constraints:
-• Never generate exterior house views or partial rooms unless explicitly instructed.
-• Always assume the user wants a *complete interior 3D visualization of the single-floor plan*.
-'''
+# Opt-in placeholder rooms for demos; responses say so with "fallback": true
+ROOM_DETECTION_FALLBACK = os.getenv("ROOM_DETECTION_FALLBACK", "false").lower() in ("1", "true", "yes")
+ROOM_DETECTION_CONFIG = json_config(RoomDetection)
+ROOM_DETECTION_PROMPT = prompts.ROOM_DETECTION.render()
+COST_ESTIMATION_CONFIG = json_config(CostEstimation)
+
+def _error_detail(error: Exception) -> str:
+    return error.detail if isinstance(error, HTTPException) else str(error)
+
+
+def _fallback_rooms(reason: str) -> dict:
+    print(f"Room detection falling back to mock rooms: {reason}")
+    return {"rooms": [dict(room) for room in prompts.FALLBACK_ROOMS], "fallback": True, "fallback_reason": reason}
 
 @router.post('/detect-rooms-from-3d')
 async def detect_rooms_from_3d(
@@ -325,149 +211,105 @@ async def detect_rooms_from_3d(
 ):
     """
     Detect rooms in a generated 3D interior image and return room coordinates and labels.
+    Errors surface as 503 (model unavailable) or 502 (invalid model output) unless
+    ROOM_DETECTION_FALLBACK is enabled, in which case placeholder rooms are returned
+    with "fallback": true and a "fallback_reason".
     """
     try:
-        global client
-        if client is None:
-            api_key = os.getenv('GEMINI_KEY')
-            if not api_key:
-                raise HTTPException(status_code=500, detail="GEMINI_KEY not found")
-            client = genai.Client(api_key=api_key)
+        gemini.get_client()
         
-        # Read and process the uploaded image
-        image_data = await image.read()
-        temp_path = f"assets/temp_{os.urandom(8).hex()}.png"
-        with open(temp_path, "wb") as f:
-            f.write(image_data)
+        # Read the uploaded image and downscale it for detection
+        upload = await ingest_image(image)
+        prepared = await upload.prepare("detection")
         
         try:
-            img = Image.open(temp_path)
-            img.load()
-            if img.size[0] == 0 or img.size[1] == 0:
-                raise HTTPException(status_code=400, detail="Invalid image upload")
-        except Exception as e:
-            try:
-                os.remove(temp_path)
-            except Exception:
-                pass
-            raise HTTPException(status_code=400, detail=f"Invalid image upload: {e}")
-        
-        # Create prompt for room detection from 3D image
-        room_detection_prompt = """
-        Analyze this 3D interior design image and identify all visible rooms/spaces with their precise coordinates.
-        This is a 3D rendered interior view, so identify the different functional areas/rooms you can see.
-        
-        IMPORTANT: Provide accurate coordinates that correspond to the actual room locations in the image.
-        Look for furniture, fixtures, and architectural elements that indicate different room functions.
-        
-        Return a JSON response with the following structure:
-        {
-            "rooms": [
-                {
-                    "id": "room_1",
-                    "label": "Living Room",
-                    "type": "living_room",
-                    "coordinates": {
-                        "x": 100,
-                        "y": 50,
-                        "width": 200,
-                        "height": 150
-                    },
-                    "confidence": 0.95,
-                    "furniture": ["sofa", "coffee table", "tv"],
-                    "description": "Main living area with seating"
-                }
-            ]
-        }
-        
-        Identify these room types: living_room, kitchen, bedroom, bathroom, dining_room, office, hallway, storage, balcony, other.
-        
-        For each room, provide:
-        1. Precise coordinates that match the actual room location in the image
-        2. List of visible furniture/fixtures that identify the room type
-        3. Brief description of the room's function
-        4. High confidence score (0.8-1.0) for accurate detections
-        
-        Coordinates should be in pixels relative to the image dimensions.
-        Focus on clearly visible and distinct areas in the 3D view.
-        Make sure the coordinates accurately represent where each room appears in the image.
-        """
-        
-        try:
-            response = client.models.generate_content(
-                model="gemini-2.5-flash",
-                contents=[room_detection_prompt, img]
+            response = await gemini.generate_content(
+                model=gemini.VISION_MODEL,
+                contents=[ROOM_DETECTION_PROMPT, gemini.image_part(prepared)],
+                config=ROOM_DETECTION_CONFIG,
+                timeout=gemini.MODEL_TIMEOUT_SECONDS[gemini.VISION_MODEL]
             )
-        except Exception as gemini_error:
-            print(f"Gemini API error: {gemini_error}")
-            # If Gemini API fails, return fallback mock data
-            return {
-                "rooms": [
-                    {"id": "room_1", "label": "Living Room", "type": "living_room", "coordinates": {"x": 300, "y": 120, "width": 180, "height": 140}, "confidence": 0.9, "furniture": ["sofa", "coffee table"], "description": "Main living area"},
-                    {"id": "room_2", "label": "Kitchen", "type": "kitchen", "coordinates": {"x": 120, "y": 120, "width": 100, "height": 100}, "confidence": 0.9, "furniture": ["island", "appliances"], "description": "Cooking area"},
-                    {"id": "room_3", "label": "Dining Room", "type": "dining_room", "coordinates": {"x": 400, "y": 360, "width": 100, "height": 80}, "confidence": 0.9, "furniture": ["dining table", "chairs"], "description": "Dining area"},
-                    {"id": "room_4", "label": "Bedroom 1", "type": "bedroom", "coordinates": {"x": 520, "y": 60, "width": 100, "height": 100}, "confidence": 0.9, "furniture": ["bed", "wardrobe"], "description": "Master bedroom"},
-                    {"id": "room_5", "label": "Bedroom 2", "type": "bedroom", "coordinates": {"x": 120, "y": 360, "width": 100, "height": 100}, "confidence": 0.9, "furniture": ["bed", "desk"], "description": "Secondary bedroom"},
-                    {"id": "room_6", "label": "Bathroom", "type": "bathroom", "coordinates": {"x": 400, "y": 60, "width": 80, "height": 80}, "confidence": 0.9, "furniture": ["toilet", "sink", "shower"], "description": "Bathroom facilities"},
-                    {"id": "room_7", "label": "Hallway", "type": "hallway", "coordinates": {"x": 480, "y": 260, "width": 60, "height": 100}, "confidence": 0.9, "furniture": ["console table"], "description": "Main hallway"}
-                ]
-            }
-        
-        # Clean up temp file
-        try:
-            os.remove(temp_path)
-        except Exception:
-            pass
-        
-        # Parse the response with error handling
-        try:
-            response_text = response.candidates[0].content.parts[0].text
-            print(f"Gemini response: {response_text}")
-            
-            # Extract JSON from the response
-            import json
-            import re
-            
-            # Try to extract JSON from the response
-            json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-            if json_match:
-                try:
-                    rooms_data = json.loads(json_match.group())
-                    return {"rooms": rooms_data.get("rooms", [])}
-                except json.JSONDecodeError as json_error:
-                    print(f"JSON decode error: {json_error}")
-        except Exception as response_error:
-            print(f"Response processing error: {response_error}")
-            # Fallback: return mock data
-            return {
-                "rooms": [
-                    {"id": "room_1", "label": "Living Room", "type": "living_room", "coordinates": {"x": 300, "y": 120, "width": 180, "height": 140}, "confidence": 0.9, "furniture": ["sofa", "coffee table"], "description": "Main living area"},
-                    {"id": "room_2", "label": "Kitchen", "type": "kitchen", "coordinates": {"x": 120, "y": 120, "width": 100, "height": 100}, "confidence": 0.9, "furniture": ["island", "appliances"], "description": "Cooking area"},
-                    {"id": "room_3", "label": "Dining Room", "type": "dining_room", "coordinates": {"x": 400, "y": 360, "width": 100, "height": 80}, "confidence": 0.9, "furniture": ["dining table", "chairs"], "description": "Dining area"},
-                    {"id": "room_4", "label": "Bedroom 1", "type": "bedroom", "coordinates": {"x": 520, "y": 60, "width": 100, "height": 100}, "confidence": 0.9, "furniture": ["bed", "wardrobe"], "description": "Master bedroom"},
-                    {"id": "room_5", "label": "Bedroom 2", "type": "bedroom", "coordinates": {"x": 120, "y": 360, "width": 100, "height": 100}, "confidence": 0.9, "furniture": ["bed", "desk"], "description": "Secondary bedroom"},
-                    {"id": "room_6", "label": "Bathroom", "type": "bathroom", "coordinates": {"x": 400, "y": 60, "width": 80, "height": 80}, "confidence": 0.9, "furniture": ["toilet", "sink", "shower"], "description": "Bathroom facilities"},
-                    {"id": "room_7", "label": "Hallway", "type": "hallway", "coordinates": {"x": 480, "y": 260, "width": 60, "height": 100}, "confidence": 0.9, "furniture": ["console table"], "description": "Main hallway"}
-                ]
-            }
-        
-        # If no JSON match found, fallback to mock data
-        return {
-            "rooms": [
-                {"id": "room_1", "label": "Living Room", "type": "living_room", "coordinates": {"x": 300, "y": 120, "width": 180, "height": 140}, "confidence": 0.9, "furniture": ["sofa", "coffee table"], "description": "Main living area"},
-                {"id": "room_2", "label": "Kitchen", "type": "kitchen", "coordinates": {"x": 120, "y": 120, "width": 100, "height": 100}, "confidence": 0.9, "furniture": ["island", "appliances"], "description": "Cooking area"},
-                {"id": "room_3", "label": "Dining Room", "type": "dining_room", "coordinates": {"x": 400, "y": 360, "width": 100, "height": 80}, "confidence": 0.9, "furniture": ["dining table", "chairs"], "description": "Dining area"},
-                {"id": "room_4", "label": "Bedroom 1", "type": "bedroom", "coordinates": {"x": 520, "y": 60, "width": 100, "height": 100}, "confidence": 0.9, "furniture": ["bed", "wardrobe"], "description": "Master bedroom"},
-                {"id": "room_5", "label": "Bedroom 2", "type": "bedroom", "coordinates": {"x": 120, "y": 360, "width": 100, "height": 100}, "confidence": 0.9, "furniture": ["bed", "desk"], "description": "Secondary bedroom"},
-                {"id": "room_6", "label": "Bathroom", "type": "bathroom", "coordinates": {"x": 400, "y": 60, "width": 80, "height": 80}, "confidence": 0.9, "furniture": ["toilet", "sink", "shower"], "description": "Bathroom facilities"},
-                {"id": "room_7", "label": "Hallway", "type": "hallway", "coordinates": {"x": 480, "y": 260, "width": 60, "height": 100}, "confidence": 0.9, "furniture": ["console table"], "description": "Main hallway"}
-            ]
-        }
+            detection = parse_response(response, RoomDetection)
+        except Exception as detection_error:
+            if not ROOM_DETECTION_FALLBACK:
+                if isinstance(detection_error, StructuredOutputError):
+                    raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY,
+                                        detail=f"Room detection failed: {detection_error}")
+                raise
+            return _fallback_rooms(f"Room detection failed: {_error_detail(detection_error)}")
+        
+        # The model saw a downscaled copy; report boxes in the uploaded image's pixels
+        rooms = []
+        for room in detection.rooms:
+            room_data = room.model_dump()
+            room_data["coordinates"] = prepared.to_original(room_data["coordinates"])
+            rooms.append(room_data)
+        return {"rooms": rooms, "fallback": False}
             
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error in room detection: {e}")
         raise HTTPException(status_code=500, detail=f"Room detection failed: {str(e)}")
 
+async def _generate_room_image(base_url: str, room_prompt: str, upload, cache_key: str,
+                               force_regenerate: bool) -> dict:
+    """Return ``image_url``, ``image_srcset`` and ``cached`` for a room, from the cache when possible."""
+    if not force_regenerate:
+        cached_image = await image_cache.get(cache_key)
+        if cached_image:
+            return {**image_urls(cached_image, base_url), "cached": True}
+    
+    if upload:
+        prepared = await upload.prepare("photo")
+        response = await gemini.generate_content(
+            model=gemini.IMAGE_MODEL,
+            contents=[room_prompt, gemini.image_part(prepared)],
+            timeout=gemini.MODEL_TIMEOUT_SECONDS[gemini.IMAGE_MODEL]
+        )
+    else:
+        response = await gemini.generate_content(
+            model=gemini.IMAGE_MODEL,
+            contents=room_prompt,
+            timeout=gemini.MODEL_TIMEOUT_SECONDS[gemini.IMAGE_MODEL]
+        )
+    
+    # Process the generated image
+    image_parts = _extract_image_parts(response)
+    
+    image_url = None
+    image_srcset = None
+    if image_parts:
+        try:
+            decoded_data = _decode_image_part(image_parts[0])
+            
+            saved_image = await save_generated_image(decoded_data, cache_prefix("room"))
+            await image_cache.put(cache_key, saved_image)
+            urls = image_urls(saved_image, base_url)
+            image_url, image_srcset = urls["image_url"], urls["image_srcset"]
+        except Exception as e:
+            print(f"Error processing generated room image: {e}")
+    
+    return {"image_url": image_url, "image_srcset": image_srcset, "cached": False}
+
+def _room_interior(base_url: str, room_type: str, room_label: str, design_style: str, upload,
+                   force_regenerate: bool):
+    """Return the response fields describing the room and the coroutine generating its image."""
+    room_prompt = prompts.room_prompt(room_type, room_label, design_style)
+    
+    # Serve repeated room/style/image combinations from the result cache; the
+    # template key covers the prompt wording, so only the parameters are hashed
+    cache_key = make_key(
+        gemini.IMAGE_MODEL,
+        prompts.ROOM_INTERIOR.key,
+        upload.data if upload else None,
+        room_type=room_type,
+        room_label=room_label,
+        design_style=design_style
+    )
+    room_fields = {"room_type": room_type, "room_label": room_label, "design_style": design_style}
+    return room_fields, _generate_room_image(base_url, room_prompt, upload, cache_key, force_regenerate)
+
 @router.post('/generate-room-interior')
 async def generate_room_interior(
     request: Request,
@@ -475,250 +317,159 @@ async def generate_room_interior(
     room_label: str = Form(...),
     design_style: str = Form(...),
     country: str = Form(...),
-    image: UploadFile = File(None)
+    image: UploadFile = File(None),
+    force_regenerate: bool = Form(False),
+    stream: Optional[str] = Form(None)
 ):
     """
     Generate interior design for a specific room.
+    Repeated requests for the same room, style and image are served from the result cache
+    unless force_regenerate is set. Set stream to "sse" or "ndjson" (or send a matching
+    Accept header) to receive progress events instead of a single response.
     """
     try:
-        global client
-        if client is None:
-            api_key = os.getenv('GEMINI_KEY')
-            if not api_key:
-                raise HTTPException(status_code=500, detail="GEMINI_KEY not found")
-            client = genai.Client(api_key=api_key)
-        
-        os.makedirs("assets", exist_ok=True)
-        
-        # Create room-specific prompt
-        room_prompt = f"""
-        Generate a high-quality 3D interior design for a {room_type} ({room_label}) with {design_style} style.
+        gemini.get_client()
+        stream = stream_format(request, stream)
         
-        Requirements:
-        1. Focus only on the {room_type} space
-        2. Use {design_style} design elements and furniture
-        3. Include appropriate lighting and materials
-        4. Make it realistic and functional
-        5. Use warm, inviting colors and textures
+        upload = await ingest_image(image) if image else None
+        room_fields, image_stage = _room_interior(
+            str(request.base_url).rstrip('/'), room_type, room_label, design_style, upload, force_regenerate
+        )
         
-        Style: {design_style}
-        Room Type: {room_type}
-        """
+        if stream:
+            def finish(fields: dict, errors: dict) -> dict:
+                return {"image_url": fields.get("image_url"), "image_srcset": fields.get("image_srcset"),
+                        **room_fields, "cached": fields.get("cached", False), "errors": errors}
+            return stream_stages(stream, room_fields, {"image": image_stage}, finish)
         
-        if image:
-            image_data = await image.read()
-            temp_path = f"assets/temp_{os.urandom(8).hex()}.png"
-            with open(temp_path, "wb") as f:
-                f.write(image_data)
-            
-            try:
-                img = Image.open(temp_path)
-                img.load()
-                if img.size[0] == 0 or img.size[1] == 0:
-                    raise HTTPException(status_code=400, detail="Invalid image upload")
-            except Exception as e:
-                try:
-                    os.remove(temp_path)
-                except Exception:
-                    pass
-                raise HTTPException(status_code=400, detail=f"Invalid image upload: {e}")
-            
-            response = client.models.generate_content(
-                model="gemini-2.5-flash-image-preview",
-                contents=[room_prompt, img]
-            )
-            
-            try:
-                os.remove(temp_path)
-            except Exception:
-                pass
-        else:
-            response = client.models.generate_content(
-                model="gemini-2.5-flash-image-preview",
-                contents=room_prompt
-            )
-        
-        # Process the generated image
-        image_parts = []
-        for part in response.candidates[0].content.parts:
-            if hasattr(part, 'inline_data') and part.inline_data:
-                image_parts.append(part.inline_data.data)
-            elif hasattr(part, 'inlineData') and part.inlineData:
-                image_parts.append(part.inlineData.data)
-        
-        image_url = None
-        if image_parts:
-            try:
-                if isinstance(image_parts[0], bytes):
-                    base64_string = image_parts[0].decode('utf-8')
-                    decoded_data = base64.b64decode(base64_string)
-                elif isinstance(image_parts[0], str):
-                    decoded_data = base64.b64decode(image_parts[0])
-                else:
-                    decoded_data = image_parts[0]
-                
-                generated_image = Image.open(BytesIO(decoded_data))
-                image_path = f"assets/room_{os.urandom(16).hex()}.png"
-                generated_image.save(image_path)
-                base_url = str(request.base_url).rstrip('/')
-                image_url = f"{base_url}/{image_path}"
-            except Exception as e:
-                print(f"Error processing generated room image: {e}")
-        
-        return {
-            "image_url": image_url,
-            "room_type": room_type,
-            "room_label": room_label,
-            "design_style": design_style
-        }
+        return {**await image_stage, **room_fields}
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error generating room interior: {e}")
         raise HTTPException(status_code=500, detail=f"Room interior generation failed: {str(e)}")
 
+async def _generate_interior_image(base_url: str, contents) -> dict:
+    """Generate and store an interior image, returning its ``image_url`` and ``image_srcset``."""
+    response = await gemini.generate_content(
+        model=gemini.IMAGE_MODEL,
+        contents=contents,
+        timeout=gemini.MODEL_TIMEOUT_SECONDS[gemini.IMAGE_MODEL]
+    )
+    image_parts = _extract_image_parts(response)
+    if not image_parts:
+        raise ValueError("No image generated by the API")
+    decoded_data = _decode_image_part(image_parts[0])
+    saved_image = await save_generated_image(decoded_data, "generated")
+    return image_urls(saved_image, base_url)
+
+
+async def _estimate_cost(cost_prompt: str) -> dict:
+    cost_response = await gemini.generate_content(
+        model=gemini.COST_MODEL,
+        contents=cost_prompt,
+        config=COST_ESTIMATION_CONFIG,
+        timeout=gemini.MODEL_TIMEOUT_SECONDS[gemini.COST_MODEL]
+    )
+    return {"cost_estimation": parse_response(cost_response, CostEstimation).model_dump()}
+
+
+def _image_with_cost_stages(base_url: str, image_contents, cost_prompt: str) -> dict:
+    return {
+        "image": _generate_interior_image(base_url, image_contents),
+        "cost_estimation": _estimate_cost(cost_prompt),
+    }
+
+
+def _with_cost_response(prompt: str, country: str, fields: dict, errors: dict) -> dict:
+    return {
+        "image_url": fields.get("image_url"),
+        "image_srcset": fields.get("image_srcset"),
+        "cost_estimation": fields.get("cost_estimation"),
+        "country": country,
+        "prompt": prompt,
+        "partial": bool(errors),
+        "errors": errors
+    }
+
+
+async def _image_with_cost(base_url: str, prompt: str, country: str, image_contents, cost_prompt: str,
+                           stream: Optional[str] = None):
+    """Run image generation and cost estimation concurrently.
+
+    The cost prompt does not depend on the generated image, so both calls are
+    issued at once, each under its own timeout. If one side fails the other is
+    still returned, with the failure reported under ``errors``. With a stream
+    format the stages are sent as events, cost first if it is ready first.
+    """
+    stages = _image_with_cost_stages(base_url, image_contents, cost_prompt)
+
+    def finish(fields: dict, errors: dict) -> dict:
+        return _with_cost_response(prompt, country, fields, errors)
+
+    if stream:
+        return stream_stages(stream, {"country": country, "prompt": prompt}, stages, finish)
+
+    fields, errors = await run_stages(stages)
+    if len(errors) == len(stages):
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail=f"Error generating interior with cost: {errors}")
+    return finish(fields, errors)
+
+
+async def _interior_3d_inputs(prompt: str, country: str, upload):
+    """Build the image contents and cost prompt for a 2D floor plan to 3D interior request."""
+    full_prompt = prompts.FLOOR_PLAN_TO_3D.render(prompt=prompt)
+    if upload:
+        prepared = await upload.prepare("floor_plan")
+        image_contents = [full_prompt, gemini.image_part(prepared)]
+    else:
+        # No image, just prompt
+        image_contents = full_prompt
+    cost_prompt = prompts.cost_prompt(prompts.COST_3D, prompt, country)
+    return image_contents, cost_prompt
+
+
+async def _interior_inputs(prompt: str, country: str, upload):
+    """Build the image contents and cost prompt for an interior renovation request."""
+    if upload:
+        # Handle image upload case
+        prepared = await upload.prepare("photo")
+        
+        detailed_prompt = prompts.INTERIOR_RENOVATION.render(prompt=prompt)
+        image_contents = [detailed_prompt, gemini.image_part(prepared)]
+    else:
+        # Handle text-only case
+        image_contents = prompts.INTERIOR_DESIGN.render(prompt=prompt)
+    
+    cost_prompt = prompts.cost_prompt(prompts.COST_RENOVATION, prompt, country)
+    return image_contents, cost_prompt
+
+
 @router.post('/generate-interior-3d-with-cost')
 async def generate_interior_3d_with_cost(
     request: Request,
     prompt: str = Form(...),
     country: str = Form(...),
-    image: UploadFile = File(None)
+    image: UploadFile = File(None),
+    stream: Optional[str] = Form(None)
 ):
     """
     Generate a 3D interior design image from a 2D floor plan and provide cost estimation based on country, using the strict system prompt.
     """
     try:
-        global client
-        if client is None:
-            api_key = os.getenv('GEMINI_KEY')
-            if not api_key:
-                raise HTTPException(status_code=500, detail="GEMINI_KEY not found")
-            client = genai.Client(api_key=api_key)
-        os.makedirs("assets", exist_ok=True)
-        # Generate image first
-        full_prompt = SYSTEM_PROMPT_2D_TO_3D + f"\nUser instructions: {prompt}"
-        if image:
-            image_data = await image.read()
-            temp_path = f"assets/temp_{os.urandom(8).hex()}.png"
-            with open(temp_path, "wb") as f:
-                f.write(image_data)
-            try:
-                img = Image.open(temp_path)
-                img.load()
-                if img.size[0] == 0 or img.size[1] == 0:
-                    raise HTTPException(status_code=400, detail="Invalid image upload")
-            except Exception as e:
-                try:
-                    os.remove(temp_path)
-                except Exception:
-                    pass
-                raise HTTPException(status_code=400, detail=f"Invalid image upload: {e}")
-            response = client.models.generate_content(
-                model="gemini-2.5-flash-image-preview",
-                contents=[full_prompt, img]
-            )
-            try:
-                os.remove(temp_path)
-            except Exception:
-                pass
-        else:
-            # No image, just prompt
-            response = client.models.generate_content(
-                model="gemini-2.5-flash-image-preview",
-                contents=full_prompt
-            )
-        # Extract image parts
-        image_parts = []
-        for part in response.candidates[0].content.parts:
-            if hasattr(part, 'inline_data') and part.inline_data:
-                image_parts.append(part.inline_data.data)
-            elif hasattr(part, 'inlineData') and part.inlineData:
-                image_parts.append(part.inlineData.data)
-        image_url = None
-        if image_parts:
-            try:
-                # Process and save the generated image
-                if isinstance(image_parts[0], bytes):
-                    base64_string = image_parts[0].decode('utf-8')
-                    decoded_data = base64.b64decode(base64_string)
-                elif isinstance(image_parts[0], str):
-                    decoded_data = base64.b64decode(image_parts[0])
-                else:
-                    decoded_data = image_parts[0]
-                generated_image = Image.open(BytesIO(decoded_data))
-                image_path = f"assets/generated_{os.urandom(16).hex()}.png"
-                generated_image.save(image_path)
-                base_url = str(request.base_url).rstrip('/')
-                image_url = f"{base_url}/{image_path}"
-            except Exception as e:
-                print(f"Error processing generated image: {e}")
-        # Generate cost estimation using Gemini
-        cost_prompt = f"""
-        Based on the 3D interior design generated from the floor plan and user instructions: \"{prompt}\" in {country}, 
-        provide a detailed cost breakdown for the project. Include:
-        1. Total estimated cost in local currency
-        2. Breakdown by categories (furniture, materials, labor, etc.)
-        3. Individual item costs where applicable
-        4. Consider {country}-specific pricing and market rates
-        Format the response as JSON with the following structure:
-        {{
-            "total_cost": "amount with currency",
-            "currency": "currency_code",
-            "breakdown": [
-                {{"category": "category_name", "cost": "amount", "description": "details"}},
-                ...
-            ],
-            "items": [
-                {{"item": "item_name", "cost": "amount", "quantity": "number"}},
-                ...
-            ]
-        }}
-        """
-        cost_response = client.models.generate_content(
-            model="gemini-2.0-flash-exp",
-            contents=cost_prompt
-        )
-        # Extract cost estimation text
-        cost_text = ""
-        for part in cost_response.candidates[0].content.parts:
-            if hasattr(part, 'text') and part.text:
-                cost_text = part.text
-                break
-        # Try to parse JSON from the response
-        import json
-        import re
-        try:
-            # Extract JSON from the response text
-            json_match = re.search(r'\{.*\}', cost_text, re.DOTALL)
-            if json_match:
-                cost_data = json.loads(json_match.group())
-            else:
-                # Fallback if no JSON found
-                cost_data = {
-                    "total_cost": "Cost estimation unavailable",
-                    "currency": "USD",
-                    "breakdown": [],
-                    "items": [],
-                    "raw_response": cost_text
-                }
-        except json.JSONDecodeError:
-            cost_data = {
-                "total_cost": "Cost estimation unavailable",
-                "currency": "USD", 
-                "breakdown": [],
-                "items": [],
-                "raw_response": cost_text
-            }
-        return {
-            "image_url": image_url,
-            "cost_estimation": cost_data,
-            "country": country,
-            "prompt": prompt
-        }
+        gemini.get_client()
+        upload = await ingest_image(image) if image else None
+        image_contents, cost_prompt = await _interior_3d_inputs(prompt, country, upload)
+        # Image generation and cost estimation run concurrently
+        return await _image_with_cost(str(request.base_url).rstrip('/'), prompt, country, image_contents,
+                                      cost_prompt, stream_format(request, stream))
     except HTTPException:
         raise
     except Exception as e:
         print(f"Error generating interior with cost: {str(e)}")
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, 
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                            detail=f"Error generating interior with cost: {str(e)}")
 
 @router.post('/generate-interior-with-cost')
@@ -726,219 +477,23 @@ async def generate_interior_with_cost(
     request: Request,
     prompt: str = Form(...),
     country: str = Form(...),
-    image: UploadFile = File(None)
+    image: UploadFile = File(None),
+    stream: Optional[str] = Form(None)
 ):
     """
     Generate an interior design image and provide cost estimation based on country.
+    Set stream to "sse" or "ndjson" (or send a matching Accept header) to receive
+    progress events instead of a single response.
     """
     try:
-        # Check if client is initialized
-        global client
-        if client is None:
-            try:
-                api_key = os.getenv('GEMINI_KEY')
-                if not api_key:
-                    raise ValueError("GEMINI_KEY not found in environment variables")
-                client = genai.Client(api_key=api_key)
-                print("Google Generative AI client initialized successfully")
-            except Exception as e:
-                raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, 
-                                   detail=f"Failed to initialize Google Generative AI client: {str(e)}")
-        
-        # Ensure assets directory exists
-        os.makedirs("assets", exist_ok=True)
-        
-        # Generate image first
-        if image:
-            # Handle image upload case
-            image_data = await image.read()
-            temp_path = f"assets/temp_{os.urandom(8).hex()}.png"
-            with open(temp_path, "wb") as f:
-                f.write(image_data)
-            
-            try:
-                img = Image.open(temp_path)
-                img.load()
-                if img.size[0] == 0 or img.size[1] == 0:
-                    raise HTTPException(status_code=400, detail="Invalid image upload")
-            except Exception as e:
-                try:
-                    os.remove(temp_path)
-                except Exception:
-                    pass
-                raise HTTPException(status_code=400, detail=f"Invalid image upload: {e}")
-            
-            detailed_prompt = f"Transform this interior space to create a detailed and photorealistic renovation based on: {prompt}"
-            response = client.models.generate_content(
-                model="gemini-2.5-flash-image-preview",
-                contents=[detailed_prompt, img]
-            )
-            
-            try:
-                os.remove(temp_path)
-            except Exception:
-                pass
-        else:
-            # Handle text-only case
-            detailed_prompt = f"Create a detailed and photorealistic interior design image based on: {prompt}"
-            response = client.models.generate_content(
-                model="gemini-2.5-flash-image-preview",
-                contents=detailed_prompt
-            )
-        
-        # Extract image parts
-        image_parts = []
-        for part in response.candidates[0].content.parts:
-            if hasattr(part, 'inline_data') and part.inline_data:
-                image_parts.append(part.inline_data.data)
-            elif hasattr(part, 'inlineData') and part.inlineData:
-                image_parts.append(part.inlineData.data)
-        
-        image_url = None
-        if image_parts:
-            try:
-                # Process and save the generated image
-                if isinstance(image_parts[0], bytes):
-                    base64_string = image_parts[0].decode('utf-8')
-                    decoded_data = base64.b64decode(base64_string)
-                elif isinstance(image_parts[0], str):
-                    decoded_data = base64.b64decode(image_parts[0])
-                else:
-                    decoded_data = image_parts[0]
-                
-                generated_image = Image.open(BytesIO(decoded_data))
-                image_path = f"assets/generated_{os.urandom(16).hex()}.png"
-                generated_image.save(image_path)
-                
-                base_url = str(request.base_url).rstrip('/')
-                image_url = f"{base_url}/{image_path}"
-            except Exception as e:
-                print(f"Error processing generated image: {e}")
-        
-        # Generate cost estimation using Gemini
-        # Define country-specific shopping platforms
-        shopping_platforms = {
-            "United States": ["amazon.com", "wayfair.com", "homedepot.com", "lowes.com", "ikea.com"],
-            "United Kingdom": ["amazon.co.uk", "argos.co.uk", "ikea.com", "johnlewis.com", "dfs.co.uk"],
-            "Germany": ["amazon.de", "ikea.com", "otto.de", "moebel.de", "xxxlutz.de"],
-            "France": ["amazon.fr", "ikea.com", "conforama.fr", "but.fr", "leroymerlin.fr"],
-            "Canada": ["amazon.ca", "ikea.com", "homedepot.ca", "wayfair.ca", "costco.ca"],
-            "Australia": ["amazon.com.au", "ikea.com", "bunnings.com.au", "fantastic-furniture.com.au", "harvey-norman.com.au"],
-            "India": ["amazon.in", "flipkart.com", "pepperfry.com", "urbanladder.com", "ikea.com"],
-            "Bangladesh": ["daraz.com.bd", "pickaboo.com", "bagdoom.com", "othoba.com", "ajkerdeal.com"],
-            "Japan": ["amazon.co.jp", "ikea.com", "nitori-net.jp", "rakuten.co.jp", "yodobashi.com"],
-            "South Korea": ["coupang.com", "11st.co.kr", "ikea.com", "homeplus.co.kr", "lotte.com"],
-            "Brazil": ["amazon.com.br", "ikea.com", "casasbahia.com.br", "magazineluiza.com.br", "mobly.com.br"],
-            "Mexico": ["amazon.com.mx", "ikea.com", "liverpool.com.mx", "homedepot.com.mx", "coppel.com"],
-            "Italy": ["amazon.it", "ikea.com", "leroy-merlin.it", "mondo-convenienza.it", "maisons-du-monde.com"],
-            "Spain": ["amazon.es", "ikea.com", "leroymerlin.es", "el-corte-ingles.es", "maisons-du-monde.com"],
-            "Netherlands": ["bol.com", "ikea.com", "fonq.nl", "wehkamp.nl", "gamma.nl"],
-            "Sweden": ["ikea.com", "ellos.se", "jysk.se", "rusta.com", "bauhaus.se"],
-            "Norway": ["ikea.com", "jysk.no", "rusta.com", "elkjop.no", "bauhaus.no"],
-            "Denmark": ["ikea.com", "jysk.dk", "ilva.dk", "bauhaus.dk", "rusta.com"],
-            "Finland": ["ikea.com", "jysk.fi", "bauhaus.fi", "rusta.com", "verkkokauppa.com"],
-            "Russia": ["ozon.ru", "wildberries.ru", "ikea.com", "leroymerlin.ru", "hoff.ru"],
-            "China": ["tmall.com", "jd.com", "ikea.cn", "suning.com", "gome.com.cn"],
-            "Singapore": ["lazada.sg", "shopee.sg", "ikea.com", "courts.com.sg", "harvey-norman.com.sg"],
-            "Malaysia": ["lazada.com.my", "shopee.com.my", "ikea.com", "courts.com.my", "senheng.com.my"],
-            "Thailand": ["lazada.co.th", "shopee.co.th", "ikea.com", "homepro.co.th", "powerbuy.co.th"],
-            "Philippines": ["lazada.com.ph", "shopee.ph", "ikea.com", "sm-store.com", "robinsons.com.ph"],
-            "Indonesia": ["tokopedia.com", "shopee.co.id", "blibli.com", "ikea.com", "ace.id"],
-            "Vietnam": ["shopee.vn", "lazada.vn", "tiki.vn", "sendo.vn", "ikea.com"],
-            "South Africa": ["takealot.com", "makro.co.za", "ikea.com", "game.co.za", "builders.co.za"],
-            "Nigeria": ["jumia.com.ng", "konga.com", "slot.ng", "ikea.com", "shoprite.co.za"],
-            "Egypt": ["jumia.com.eg", "souq.com", "ikea.com", "carrefour.com", "b.tech"],
-            "UAE": ["amazon.ae", "noon.com", "ikea.com", "carrefour.ae", "sharaf-dg.com"],
-            "Saudi Arabia": ["amazon.sa", "noon.com", "ikea.com", "extra.com", "jarir.com"]
-        }
+        # Make sure the shared Gemini client is available
+        gemini.get_client()
         
-        platforms = shopping_platforms.get(country, ["amazon.com", "ikea.com", "wayfair.com"])
+        upload = await ingest_image(image) if image else None
+        image_contents, cost_prompt = await _interior_inputs(prompt, country, upload)
         
-        cost_prompt = f"""
-        Based on the interior design renovation described as: \"{prompt}\" in {country}, 
-        provide a detailed cost breakdown for the renovation. Include:
-        
-        1. Total estimated cost in local currency
-        2. Breakdown by categories (furniture, materials, labor, etc.)
-        3. Individual item costs where applicable
-        4. Consider {country}-specific pricing and market rates
-        5. For each item, suggest where it can be purchased from these platforms: {', '.join(platforms)}
-        
-        Format the response as JSON with the following structure:
-        {{
-            \"total_cost\": \"amount with currency\",
-            \"currency\": \"currency_code\",
-            \"breakdown\": [
-                {{\"category\": \"category_name\", \"cost\": \"amount\", \"description\": \"details\"}},
-                ...
-            ],
-            \"items\": [
-                {{
-                    \"item\": \"item_name\", 
-                    \"cost\": \"amount\", 
-                    \"quantity\": \"number\",
-                    \"shopping_links\": [
-                        {{\"platform\": \"platform_name\", \"url\": \"search_url_for_item\", \"note\": \"availability_note\"}},
-                        ...
-                    ]
-                }},
-                ...
-            ]
-        }}
-        
-        For shopping links, create realistic search URLs for each platform. For example:
-        - Amazon: https://amazon.com/s?k=modern+sofa
-        - IKEA: https://ikea.com/search/?q=sofa
-        - Wayfair: https://wayfair.com/furniture/sb0/sofas-c45974.html
-        
-        Make sure the URLs are actual searchable links that would help users find the products.
-        """
-        
-        cost_response = client.models.generate_content(
-            model="gemini-2.0-flash-exp",
-            contents=cost_prompt
-        )
-        
-        # Extract cost estimation text
-        cost_text = ""
-        for part in cost_response.candidates[0].content.parts:
-            if hasattr(part, 'text') and part.text:
-                cost_text = part.text
-                break
-        
-        # Try to parse JSON from the response
-        import json
-        import re
-        
-        try:
-            # Extract JSON from the response text
-            json_match = re.search(r'\{.*\}', cost_text, re.DOTALL)
-            if json_match:
-                cost_data = json.loads(json_match.group())
-            else:
-                # Fallback if no JSON found
-                cost_data = {
-                    "total_cost": "Cost estimation unavailable",
-                    "currency": "USD",
-                    "breakdown": [],
-                    "items": [],
-                    "raw_response": cost_text
-                }
-        except json.JSONDecodeError:
-            cost_data = {
-                "total_cost": "Cost estimation unavailable",
-                "currency": "USD", 
-                "breakdown": [],
-                "items": [],
-                "raw_response": cost_text
-            }
-        
-        return {
-            "image_url": image_url,
-            "cost_estimation": cost_data,
-            "country": country,
-            "prompt": prompt
-        }
+        return await _image_with_cost(str(request.base_url).rstrip('/'), prompt, country, image_contents,
+                                      cost_prompt, stream_format(request, stream))
         
     except HTTPException:
         raise
@@ -946,3 +501,190 @@ async def generate_interior_with_cost(
         print(f"Error generating interior with cost: {str(e)}")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, 
                            detail=f"Error generating interior with cost: {str(e)}")
+
+
+# Background jobs: the same generations, queued and run by the job workers
+
+async def _stash_upload(upload) -> Optional[str]:
+    """Store an ingested upload for a job under a content-addressed key."""
+    if upload is None:
+        return None
+    key = content_key("jobs/inputs", hashlib.sha256(upload.data).hexdigest(), upload.format)
+    if not await private_storage.exists(key):
+        await private_storage.put_bytes(key, upload.data, upload.mime_type)
+    return key
+
+
+async def _load_stashed_upload(key: Optional[str]) -> Optional[IngestedImage]:
+    if not key:
+        return None
+    # Jobs queued before inputs moved to private storage still point at the public store
+    source = private_storage if await private_storage.exists(key) else storage
+    data = b"".join([chunk async for chunk in source.get_stream(key)])
+    image_format = sniff_image_format(data[:16])
+    return IngestedImage(data=data, format=image_format, mime_type=IMAGE_MIME_TYPES[image_format])
+
+
+# Prompt templates each job kind renders; their keys are part of the dedup key
+JOB_TEMPLATES = {
+    "generate-room-interior": (prompts.ROOM_INTERIOR,),
+    "generate-interior-with-cost": (prompts.INTERIOR_RENOVATION, prompts.INTERIOR_DESIGN, prompts.COST_RENOVATION),
+    "generate-interior-3d-with-cost": (prompts.FLOOR_PLAN_TO_3D, prompts.COST_3D),
+}
+
+
+async def _submit_job(request: Request, kind: str, params: dict, upload, priority: int) -> JSONResponse:
+    payload = {
+        **params,
+        "image_key": await _stash_upload(upload),
+        "base_url": str(request.base_url).rstrip('/'),
+        "user_id": current_user_id(),
+    }
+    # Identical in-flight submissions share one job
+    key_params = {name: value for name, value in payload.items() if name not in ("image_key", "user_id")}
+    key_params["templates"] = ",".join(template.key for template in JOB_TEMPLATES[kind])
+    dedup_key = make_key(kind, key_params.pop("prompt", ""), upload.data if upload else None, **key_params)
+    job = await job_queue.submit(kind, payload, dedup_key, priority=priority)
+    base_url = payload["base_url"]
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content=jsonable_encoder({
+            **job,
+            "status_url": f"{base_url}/api/v1/jobs/{job['id']}",
+            "result_url": f"{base_url}/api/v1/jobs/{job['id']}/result",
+        })
+    )
+
+
+def _ai_job(kind: str):
+    """Register a job handler whose Gemini usage is attributed to the submitting user and route."""
+    def decorator(handler):
+        async def run(payload: dict) -> dict:
+            with usage_context(payload.get("user_id"), f"/api/v1/jobs/{kind}"):
+                return await handler(payload)
+        return job_handler(kind)(run)
+    return decorator
+
+
+@_ai_job("generate-room-interior")
+async def _run_room_interior_job(payload: dict) -> dict:
+    upload = await _load_stashed_upload(payload["image_key"])
+    room_fields, image_stage = _room_interior(
+        payload["base_url"], payload["room_type"], payload["room_label"], payload["design_style"],
+        upload, payload["force_regenerate"]
+    )
+    return {**await image_stage, **room_fields}
+
+
+async def _run_with_cost_job(payload: dict, build_inputs) -> dict:
+    upload = await _load_stashed_upload(payload["image_key"])
+    image_contents, cost_prompt = await build_inputs(payload["prompt"], payload["country"], upload)
+    stages = _image_with_cost_stages(payload["base_url"], image_contents, cost_prompt)
+    fields, errors = await run_stages(stages)
+    if len(errors) == len(stages):
+        # Nothing to return: let the job queue retry
+        raise RuntimeError(f"Error generating interior with cost: {errors}")
+    return _with_cost_response(payload["prompt"], payload["country"], fields, errors)
+
+
+@_ai_job("generate-interior-with-cost")
+async def _run_interior_with_cost_job(payload: dict) -> dict:
+    return await _run_with_cost_job(payload, _interior_inputs)
+
+
+@_ai_job("generate-interior-3d-with-cost")
+async def _run_interior_3d_with_cost_job(payload: dict) -> dict:
+    return await _run_with_cost_job(payload, _interior_3d_inputs)
+
+
+@router.post('/jobs/generate-room-interior', status_code=202, tags=['jobs'])
+async def submit_room_interior_job(
+    request: Request,
+    room_type: str = Form(...),
+    room_label: str = Form(...),
+    design_style: str = Form(...),
+    country: str = Form(...),
+    image: UploadFile = File(None),
+    force_regenerate: bool = Form(False),
+    priority: int = Form(0, ge=0, le=JOB_MAX_PRIORITY)
+):
+    """
+    Queue a room interior generation and return its job id straight away.
+    Poll the returned status_url and fetch the result from result_url.
+    """
+    upload = await ingest_image(image) if image else None
+    params = {"room_type": room_type, "room_label": room_label, "design_style": design_style,
+              "country": country, "force_regenerate": force_regenerate}
+    return await _submit_job(request, "generate-room-interior", params, upload, priority)
+
+
+@router.post('/jobs/generate-interior-with-cost', status_code=202, tags=['jobs'])
+async def submit_interior_with_cost_job(
+    request: Request,
+    prompt: str = Form(...),
+    country: str = Form(...),
+    image: UploadFile = File(None),
+    priority: int = Form(0, ge=0, le=JOB_MAX_PRIORITY)
+):
+    """
+    Queue an interior design generation with cost estimation and return its job id straight away.
+    """
+    upload = await ingest_image(image) if image else None
+    params = {"prompt": prompt, "country": country}
+    return await _submit_job(request, "generate-interior-with-cost", params, upload, priority)
+
+
+@router.post('/jobs/generate-interior-3d-with-cost', status_code=202, tags=['jobs'])
+async def submit_interior_3d_with_cost_job(
+    request: Request,
+    prompt: str = Form(...),
+    country: str = Form(...),
+    image: UploadFile = File(None),
+    priority: int = Form(0, ge=0, le=JOB_MAX_PRIORITY)
+):
+    """
+    Queue a 2D floor plan to 3D interior generation with cost estimation and return its job id straight away.
+    """
+    upload = await ingest_image(image) if image else None
+    params = {"prompt": prompt, "country": country}
+    return await _submit_job(request, "generate-interior-3d-with-cost", params, upload, priority)
+
+
+@router.get('/ai/stats')
+async def get_ai_stats(db: AsyncSession = Depends(get_db), user = Depends(oauth2.get_current_user)):
+    """Get Gemini coalescing, rate limit, circuit breaker and retry state, and result cache counters (admin only)"""
+    await oauth2.check_authorization(user, db)
+    return {
+        "gemini": gemini.coalescing_stats(),
+        "gemini_upstream": gemini.upstream_stats(),
+        "result_cache": image_cache.stats()
+    }
+
+
+@router.get('/ai/prompts')
+async def get_prompt_templates():
+    """List the prompt templates in use with their versions, fingerprints and static token estimates"""
+    return {"templates": prompts.describe_templates()}
+
+
+@router.get('/ai/usage')
+async def get_ai_usage(
+    group_by: str = Query("day,route"),
+    start: Optional[date] = Query(None),
+    end: Optional[date] = Query(None),
+    user_id: Optional[int] = Query(None),
+    route: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_db),
+    user = Depends(oauth2.get_current_user)
+):
+    """
+    Report Gemini calls, tokens, latency and estimated cost (USD), costliest first.
+    group_by is a comma-separated list of day, user, route, model and template.
+    """
+    await oauth2.check_authorization(user, db)
+    groups = [name.strip() for name in group_by.split(",") if name.strip()]
+    unknown = [name for name in groups if name not in GROUP_COLUMNS]
+    if unknown:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"Unknown group_by {', '.join(unknown)}; use any of {', '.join(GROUP_COLUMNS)}")
+    return {"group_by": groups, "usage": await usage_recorder.report(groups, start, end, user_id, route)}
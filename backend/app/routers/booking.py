@@ -1,49 +1,206 @@
-from fastapi import Depends, status, APIRouter, HTTPException
+import os
+from collections import Counter, defaultdict
+from datetime import date
+from typing import List, Optional
+from fastapi import Depends, status, APIRouter, HTTPException, Query, Request
+from pydantic import ValidationError
 from ..database import get_db
-from sqlalchemy.orm import Session
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from .. import models
-from ..schemas import Booking
+from ..schemas import Booking, BookingStatusUpdate, BookingDelete
+from ..pagination import PageParams, page_params, paginate
+from ..streaming import read_items
+from dotenv import load_dotenv
+
+load_dotenv()
 
 router = APIRouter()
 
+BOOKING_FIELDS = ("id", "user_id", "date", "service_type", "status")
+
+# Bulk requests: items accepted per call, and rows per INSERT/UPDATE/DELETE statement
+BOOKING_BULK_MAX_ITEMS = int(os.getenv("BOOKING_BULK_MAX_ITEMS", "10000"))
+BOOKING_BULK_BATCH_SIZE = int(os.getenv("BOOKING_BULK_BATCH_SIZE", "1000"))
+# Largest bulk request body, checked while it is read
+BOOKING_BULK_MAX_BYTES = int(float(os.getenv("BOOKING_BULK_MAX_MB", "10")) * 1024 * 1024)
+
 @router.post("/bookings", tags=['booking'])
-def create_booking(booking: Booking, db: Session = Depends(get_db)):
+async def create_booking(booking: Booking, db: AsyncSession = Depends(get_db)):
     new_booking = models.Booking(**booking.dict())
     db.add(new_booking)
-    db.commit()
-    db.refresh(new_booking)
+    await db.commit()
+    await db.refresh(new_booking)
     return new_booking
 
 @router.get("/bookings", tags=['booking'])
-def get_bookings(db: Session = Depends(get_db)):
-    bookings = db.query(models.Booking).all()
-    return bookings
+async def get_bookings(
+    user_id: Optional[int] = Query(None),
+    status: Optional[int] = Query(None),
+    date_from: Optional[date] = Query(None, description="Earliest booking date, inclusive"),
+    date_to: Optional[date] = Query(None, description="Latest booking date, inclusive"),
+    page: PageParams = Depends(page_params),
+    db: AsyncSession = Depends(get_db)
+):
+    filters = []
+    if user_id is not None:
+        filters.append(models.Booking.user_id == user_id)
+    if status is not None:
+        filters.append(models.Booking.status == status)
+    if date_from is not None:
+        filters.append(models.Booking.date >= date_from)
+    if date_to is not None:
+        filters.append(models.Booking.date <= date_to)
+    return await paginate(db, models.Booking, page, BOOKING_FIELDS, filters)
 
 @router.get("/search_booking", tags=['booking'])
-def search_booking(id: int = None, user_id: int = None, db: Session = Depends(get_db)):
+async def search_booking(id: int = None, user_id: int = None, page: PageParams = Depends(page_params),
+                         db: AsyncSession = Depends(get_db)):
     if id:
-        booking = db.query(models.Booking).filter(models.Booking.id == id).first()
+        booking = await db.get(models.Booking, id)
         return booking
     elif user_id:
-        booking = db.query(models.Booking).filter(models.Booking.user_id == user_id).all()
-        return booking
+        return await paginate(db, models.Booking, page, BOOKING_FIELDS, [models.Booking.user_id == user_id])
     else:
         return {"message": "Please provide either id or user_id"}
     
 @router.put("/bookings", tags=['booking'])
-def update_booking_status(id: int, status: int, db: Session = Depends(get_db)):
-    booking = db.query(models.Booking).filter(models.Booking.id == id).first()
+async def update_booking_status(id: int, status: int, db: AsyncSession = Depends(get_db)):
+    booking = await db.get(models.Booking, id)
     if booking is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Booking not found")
+        # The status query parameter shadows fastapi.status here
+        raise HTTPException(status_code=404, detail="Booking not found")
     booking.status = status
-    db.commit()
+    await db.commit()
     return {"message": "Booking Updated successfully"}
 
 @router.delete("/bookings", tags=['booking'])
-def delete_booking(id: int, db: Session = Depends(get_db)):
-    booking = db.query(models.Booking).filter(models.Booking.id == id).first()
+async def delete_booking(id: int, db: AsyncSession = Depends(get_db)):
+    booking = await db.get(models.Booking, id)
     if booking is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Booking not found")
-    db.delete(booking)
-    db.commit()
-    return {"message": "Booking deleted successfully"}
\ No newline at end of file
+    await db.delete(booking)
+    await db.commit()
+    return {"message": "Booking deleted successfully"}
+
+
+# Bulk endpoints. Each takes a JSON array or an application/x-ndjson stream,
+# validates every item, applies the valid ones with batched set-based
+# statements in a single transaction, and reports a result per item.
+
+def _chunks(items: list, size: int = BOOKING_BULK_BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _error(index: int, message: str) -> dict:
+    return {"index": index, "status": "error", "error": message}
+
+
+def _validate(items: list, schema) -> tuple:
+    """Split request items into ``(index, model)`` pairs and a result list holding their errors."""
+    valid, results = [], [None] * len(items)
+    for index, (item, error) in enumerate(items):
+        if error is None:
+            if not isinstance(item, dict):
+                error = "Expected a JSON object"
+            else:
+                try:
+                    valid.append((index, schema(**item)))
+                    continue
+                except ValidationError as e:
+                    error = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+        results[index] = _error(index, error)
+    return valid, results
+
+
+async def _existing_ids(db: AsyncSession, column, ids) -> set:
+    found = set()
+    for chunk in _chunks(sorted(set(ids))):
+        found.update((await db.scalars(select(column).where(column.in_(chunk)))).all())
+    return found
+
+
+def _summary(results: List[dict]) -> dict:
+    return {"counts": dict(Counter(result["status"] for result in results)), "results": results}
+
+
+@router.post("/bookings/bulk", tags=['booking'])
+async def create_bookings(request: Request, db: AsyncSession = Depends(get_db)):
+    """Create many bookings; items referencing unknown users are rejected individually."""
+    valid, results = _validate(await read_items(request, BOOKING_BULK_MAX_ITEMS, BOOKING_BULK_MAX_BYTES), Booking)
+    users = await _existing_ids(db, models.User.id, [booking.user_id for _, booking in valid])
+
+    rows = []
+    for index, booking in valid:
+        if booking.user_id in users:
+            rows.append((index, booking.dict()))
+        else:
+            results[index] = _error(index, f"User {booking.user_id} not found")
+
+    # Ordered RETURNING maps ids back to items; PostgreSQL still sends each
+    # chunk as one multi-row INSERT, SQLite falls back to a row per statement
+    statement = insert(models.Booking).returning(models.Booking.id, sort_by_parameter_order=True)
+    for chunk in _chunks(rows):
+        ids = (await db.execute(statement, [row for _, row in chunk])).scalars().all()
+        for (index, _), booking_id in zip(chunk, ids):
+            results[index] = {"index": index, "id": booking_id, "status": "created"}
+    await db.commit()
+    return _summary(results)
+
+
+@router.patch("/bookings/bulk/status", tags=['booking'])
+async def update_bookings_status(request: Request, db: AsyncSession = Depends(get_db)):
+    """Set the status of many bookings with one UPDATE per target status and batch.
+
+    When a booking appears more than once, its last item wins.
+    """
+    valid, results = _validate(await read_items(request, BOOKING_BULK_MAX_ITEMS, BOOKING_BULK_MAX_BYTES), BookingStatusUpdate)
+    existing = await _existing_ids(db, models.Booking.id, [item.id for _, item in valid])
+
+    final = {}
+    for index, item in valid:
+        if item.id in existing:
+            final[item.id] = (index, item.status)
+        else:
+            results[index] = _error(index, f"Booking {item.id} not found")
+
+    by_status = defaultdict(list)
+    for booking_id, (_, new_status) in final.items():
+        by_status[new_status].append(booking_id)
+    for new_status, ids in by_status.items():
+        for chunk in _chunks(ids):
+            await db.execute(
+                update(models.Booking).where(models.Booking.id.in_(chunk)).values(status=new_status)
+                .execution_options(synchronize_session=False)
+            )
+    await db.commit()
+
+    for index, item in valid:
+        if item.id in final:
+            if final[item.id][0] == index:
+                results[index] = {"index": index, "id": item.id, "status": "updated"}
+            else:
+                results[index] = {"index": index, "id": item.id, "status": "superseded"}
+    return _summary(results)
+
+
+@router.delete("/bookings/bulk", tags=['booking'])
+async def delete_bookings(request: Request, db: AsyncSession = Depends(get_db)):
+    """Delete many bookings, given as ids or ``{"id": ...}`` objects."""
+    items = [({"id": item} if isinstance(item, int) else item, error)
+             for item, error in await read_items(request, BOOKING_BULK_MAX_ITEMS, BOOKING_BULK_MAX_BYTES)]
+    valid, results = _validate(items, BookingDelete)
+    existing = await _existing_ids(db, models.Booking.id, [item.id for _, item in valid])
+    for chunk in _chunks(sorted(existing)):
+        await db.execute(
+            delete(models.Booking).where(models.Booking.id.in_(chunk)).execution_options(synchronize_session=False)
+        )
+    await db.commit()
+
+    for index, item in valid:
+        if item.id in existing:
+            results[index] = {"index": index, "id": item.id, "status": "deleted"}
+        else:
+            results[index] = _error(index, f"Booking {item.id} not found")
+    return _summary(results)
@@ -0,0 +1,37 @@
+from fastapi import APIRouter, HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from ..jobs import job_queue, JOB_POLL_SECONDS, SUCCEEDED, FAILED
+
+router = APIRouter(prefix='/api/v1', tags=['jobs'])
+
+
+async def _get_job(job_id: str) -> dict:
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return job
+
+
+@router.get('/jobs/{job_id}')
+async def get_job_status(job_id: str):
+    """Return the status of a queued AI job."""
+    job = await _get_job(job_id)
+    job.pop("result")
+    return job
+
+
+@router.get('/jobs/{job_id}/result')
+async def get_job_result(job_id: str):
+    """
+    Return the result of a finished job. Pending jobs answer 202 with their status
+    and a Retry-After hint; failed jobs answer 500 with the last error.
+    """
+    job = await _get_job(job_id)
+    if job["status"] == SUCCEEDED:
+        return job["result"]
+    if job["status"] == FAILED:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Job failed: {job['error']}")
+    job.pop("result")
+    return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=jsonable_encoder(job),
+                        headers={"Retry-After": str(max(1, int(JOB_POLL_SECONDS)))})
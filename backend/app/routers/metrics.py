@@ -0,0 +1,12 @@
+from fastapi import APIRouter
+from fastapi.responses import Response
+from ..metrics import render_metrics
+
+router = APIRouter(tags=['metrics'])
+
+
+@router.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """Prometheus text exposition of the request, Gemini, upload, image, Places, cache, DB and event loop metrics"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
@@ -1,14 +1,19 @@
 # crud operation with authorization check for photos
-from fastapi import Depends, APIRouter, HTTPException, status, File, UploadFile, Path, Form, Request
+from typing import Optional
+from fastapi import Depends, APIRouter, HTTPException, status, File, UploadFile, Path, Form, Request, Query
 from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
-from ..database import get_db, SessionLocal
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import get_db
 from .. import models, oauth2
 from ..models import Photo
 import shutil
 import os
+import uuid
 from pydantic import BaseModel
 from app.oauth2 import check_authorization
+from ..storage import storage, content_key
+from ..uploads import UploadHasher, sniff_image_format
+from ..pagination import PageParams, page_params, paginate
 
 router = APIRouter()
 
@@ -24,57 +29,78 @@ def save_file(file, file_path):
     with open(file_path, "wb") as buffer:
         shutil.copyfileobj(file.file, buffer)
         
+def photo_url(value: str, base_url: str) -> str:
+    """URL for a ``Photo.photo`` value: a storage key, or a full URL on rows stored before keys."""
+    return value if "://" in value else storage.url(value, base_url)
+
+def _file_extension(filename: Optional[str]) -> str:
+    extension = os.path.splitext(filename or "")[1].lstrip(".").lower()
+    return extension if extension.isalnum() and len(extension) <= 10 else "bin"
+
 @router.post("/photos", status_code=201, tags=['photo'])
-async def upload_photo(request: Request, photo: UploadFile = File(...), title: str = Form(...), description: str = Form(...), category: str = Form(...), user = Depends(oauth2.get_current_user)):
-    check_authorization(user)
+async def upload_photo(request: Request, photo: UploadFile = File(...), title: str = Form(...), description: str = Form(...), category: str = Form(...), db: AsyncSession = Depends(get_db), user = Depends(oauth2.get_current_user)):
+    await check_authorization(user, db)
     
     # Get the server's base URL
-    base_url = request.base_url
-
-    # Get the directory path of the current module
-    current_directory = os.path.dirname(os.path.realpath(__file__))
+    base_url = str(request.base_url)
 
-    # Create a new folder named 'photos' in the current directory if it doesn't exist
-    folder_path = os.path.join(current_directory, "..", "..", "assets")
-    os.makedirs(folder_path, exist_ok=True)
+    # Store under the content hash, so identical files share one object and
+    # titles can no longer overwrite each other. The hash is only known once
+    # the upload has been read, so it is written to a temporary key in the
+    # same pass and renamed afterwards.
+    hasher = UploadHasher(photo, kind="photo")
+    temp_key = f"photos/tmp/{uuid.uuid4().hex}"
+    await storage.put_stream(temp_key, hasher.chunks(), photo.content_type)
+    digest = hasher.result()
+    extension = sniff_image_format(digest.header) or _file_extension(photo.filename)
+    key = content_key("photos", digest.sha256, extension)
+    deduplicated = await storage.exists(key)
+    if deduplicated:
+        await storage.delete(temp_key)
+    else:
+        try:
+            await storage.move(temp_key, key)
+        except Exception:
+            await storage.delete(temp_key)
+            raise
 
-    # Save the uploaded photo to the specified folder
-    file_location = os.path.join(folder_path, f"{title}.png")
-    with open(file_location, "wb") as file_object:
-        file_object.write(photo.file.read())
-
-    # Construct the URL for the uploaded photo
-    photo_url = f"{base_url}assets/{title}.png"
-
-    # Save photo information to the database
-    db = SessionLocal()
-    db_photo = Photo(photo=photo_url, title=title, description=description, category=category)
+    # Save photo information to the database. The key is stored rather than a
+    # URL, which may be a presigned link that expires.
+    db_photo = Photo(photo=key, title=title, description=description, category=category,
+                     sha256=digest.sha256, size=digest.size)
     db.add(db_photo)
-    db.commit()
-    db.refresh(db_photo)
-    db.close()
+    await db.commit()
+
+    return {"id": db_photo.id, "filename": photo.filename, "title": title, "description": description, "category": category,
+            "photo_url": photo_url(key, base_url), "sha256": digest.sha256, "size": digest.size, "deduplicated": deduplicated}
 
-    return {"filename": photo.filename, "title": title, "description": description, "category": category, "photo_url": photo_url}
 
+PHOTO_FIELDS = ("id", "photo", "title", "description", "category", "sha256", "size")
 
 @router.get("/photos", tags=['photo'])
-def get_photos(db: Session = Depends(get_db), user = Depends(oauth2.get_current_user)):
-    photos = db.query(models.Photo).all()
-    return photos
+async def get_photos(request: Request, category: Optional[str] = Query(None), page: PageParams = Depends(page_params),
+                     db: AsyncSession = Depends(get_db), user = Depends(oauth2.get_current_user)):
+    filters = [models.Photo.category == category] if category is not None else []
+    result = await paginate(db, models.Photo, page, PHOTO_FIELDS, filters)
+    base_url = str(request.base_url)
+    for item in result["items"]:
+        if "photo" in item:
+            item["photo"] = photo_url(item["photo"], base_url)
+    return result
 
 @router.get("/photos/{photo_id}", tags=['photo'])
-def get_photo(photo_id: int, db: Session = Depends(get_db)):
-    photo = db.query(models.Photo).filter(models.Photo.id == photo_id).first()
+async def get_photo(request: Request, photo_id: int, db: AsyncSession = Depends(get_db)):
+    photo = await db.get(models.Photo, photo_id)
     if photo is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Photo not found")
-    return photo
+    return {field: getattr(photo, field) for field in PHOTO_FIELDS} | {"photo": photo_url(photo.photo, str(request.base_url))}
 
 @router.delete("/photos/{photo_id}", status_code = 204, tags=['photo'])
-def delete_photo(photo_id: int, db : Session = Depends(get_db), user = Depends(oauth2.get_current_user)):
-    check_authorization(user)
-    photo = db.query(models.Photo).filter(models.Photo.id == photo_id).first()
+async def delete_photo(photo_id: int, db : AsyncSession = Depends(get_db), user = Depends(oauth2.get_current_user)):
+    await check_authorization(user, db)
+    photo = await db.get(models.Photo, photo_id)
     if photo is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Photo not found")
-    db.delete(photo)
-    db.commit()
+    await db.delete(photo)
+    await db.commit()
     return {"detail": "Photo deleted successfully"}
\ No newline at end of file
@@ -1,9 +1,16 @@
 from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel
 from typing import List, Optional
-import httpx
+import asyncio
+import math
 import os
+import numpy as np
 from dotenv import load_dotenv
+from ..http_client import get_http_client
+from ..ttl_cache import TTLCache
+from .. import metrics
+from ..geo import geohash_encode, geohash_center, geohash_half_diagonal_m
+from ..spatial import ShopIndex, haversine_m, load_shop_catalogue
 
 load_dotenv()
 
@@ -229,8 +236,94 @@ CATEGORY_MAPPING = {
     "Kitchen": ["kitchen_supply_store", "home_goods_store"]
 }
 
-async def fetch_google_places(latitude: float, longitude: float, radius: int = 5000, category: str = None) -> List[dict]:
-    """Fetch renovation shops from Google Places API"""
+# Limits for the Google Places fan-out. MAX_SHOPS is the default page size;
+# requests may ask for up to SHOPS_LIMIT_MAX, and Nearby Search is paged
+# (20 results per page, at most 3 pages per place type) until enough are found.
+MAX_SHOPS = 20
+SHOPS_LIMIT_MAX = 200
+PLACES_MAX_PAGES = 3
+# A next_page_token only becomes valid a short while after it is issued
+PLACES_PAGE_TOKEN_DELAY_SECONDS = float(os.getenv("PLACES_PAGE_TOKEN_DELAY_SECONDS", "2"))
+PLACES_DETAILS_CONCURRENCY = int(os.getenv("PLACES_DETAILS_CONCURRENCY", "10"))
+PLACES_DEADLINE_SECONDS = float(os.getenv("PLACES_DEADLINE_SECONDS", "8"))
+
+# Nearby results are cached per geohash tile, radius, category and limit bucket, so
+# users a few metres apart share one upstream fan-out. Place details change
+# even less often and get their own longer-lived cache keyed by place_id.
+NEARBY_CACHE_PRECISION = int(os.getenv("SHOPS_CACHE_GEOHASH_PRECISION", "6"))
+RADIUS_BUCKETS = [1000, 2000, 5000, 10000, 20000, 50000]
+LIMIT_BUCKETS = [MAX_SHOPS, 50, 100, SHOPS_LIMIT_MAX]
+# Largest radius Nearby Search accepts
+PLACES_MAX_RADIUS = 50000
+nearby_cache = TTLCache(
+    maxsize=int(os.getenv("SHOPS_CACHE_MAX_ENTRIES", "5000")),
+    ttl=float(os.getenv("SHOPS_CACHE_TTL_SECONDS", str(6 * 3600)))
+)
+place_details_cache = TTLCache(
+    maxsize=int(os.getenv("PLACE_DETAILS_CACHE_MAX_ENTRIES", "50000")),
+    ttl=float(os.getenv("PLACE_DETAILS_CACHE_TTL_SECONDS", str(24 * 3600)))
+)
+metrics.register_cache("shops_nearby", nearby_cache.stats)
+metrics.register_cache("place_details", place_details_cache.stats)
+
+def radius_bucket(radius: int) -> int:
+    """Round a search radius up to the nearest cache bucket"""
+    for bucket in RADIUS_BUCKETS:
+        if radius <= bucket:
+            return bucket
+    return RADIUS_BUCKETS[-1]
+
+def limit_bucket(limit: int) -> int:
+    """Round a result limit up to the nearest cache bucket"""
+    for bucket in LIMIT_BUCKETS:
+        if limit <= bucket:
+            return bucket
+    return LIMIT_BUCKETS[-1]
+
+async def places_get(endpoint: str, url: str, params: dict) -> dict:
+    """GET a Places API endpoint, counting the call and its status for /metrics"""
+    try:
+        response = await get_http_client().get(url, params=params)
+        response.raise_for_status()
+        data = response.json()
+    except Exception:
+        metrics.record_places_call(endpoint, "http_error")
+        raise
+    metrics.record_places_call(endpoint, str(data.get("status", "unknown")).lower())
+    return data
+
+async def search_nearby_places(latitude: float, longitude: float, radius: int, place_type: str, api_key: str,
+                               max_results: int = MAX_SHOPS, deadline: Optional[float] = None) -> List[dict]:
+    """Run Nearby Search for one place type, following result pages until ``max_results`` are found.
+
+    No further page is requested when waiting for its token would pass ``deadline`` (loop time).
+    """
+    url = "https://maps.googleapis.com/maps/api/place/nearbysearch/json"
+    params = {
+        "location": f"{latitude},{longitude}",
+        "radius": radius,
+        "type": place_type,
+        "key": api_key
+    }
+    loop = asyncio.get_running_loop()
+    results = []
+    for _ in range(PLACES_MAX_PAGES):
+        data = await places_get("nearbysearch", url, params)
+        if data.get("status") != "OK":
+            break
+        results.extend(data.get("results", []))
+        page_token = data.get("next_page_token")
+        if not page_token or len(results) >= max_results:
+            break
+        if deadline is not None and loop.time() + PLACES_PAGE_TOKEN_DELAY_SECONDS >= deadline:
+            break
+        await asyncio.sleep(PLACES_PAGE_TOKEN_DELAY_SECONDS)
+        params = {"pagetoken": page_token, "key": api_key}
+    return results
+
+async def fetch_google_places(latitude: float, longitude: float, radius: int = 5000, category: str = None,
+                              max_shops: int = MAX_SHOPS) -> List[dict]:
+    """Fetch up to ``max_shops`` renovation shops from Google Places API"""
     google_api_key = os.getenv("MAP_API_KEY")
     
     if not google_api_key:
@@ -243,50 +336,98 @@ async def fetch_google_places(latitude: float, longitude: float, radius: int = 5
         if category and category in CATEGORY_MAPPING:
             place_types = CATEGORY_MAPPING[category]
         
-        shops = []
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + PLACES_DEADLINE_SECONDS
         
-        # Search for each place type
-        for place_type in place_types:
-            url = "https://maps.googleapis.com/maps/api/place/nearbysearch/json"
-            params = {
-                "location": f"{latitude},{longitude}",
-                "radius": radius,
-                "type": place_type,
-                "key": google_api_key
-            }
-            
-            async with httpx.AsyncClient() as client:
-                response = await client.get(url, params=params)
-                response.raise_for_status()
-                data = response.json()
-                
-                if data.get("status") == "OK":
-                    for place in data.get("results", []):
-                        # Get detailed information for each place
-                        place_details = await get_place_details(place["place_id"], google_api_key)
-                        if place_details:
-                            shops.append(place_details)
+        # Search all place types concurrently; keep whatever finished before the deadline
+        search_tasks = [
+            asyncio.create_task(search_nearby_places(latitude, longitude, radius, place_type, google_api_key,
+                                                     max_shops, deadline))
+            for place_type in place_types
+        ]
+        done, pending = await asyncio.wait(search_tasks, timeout=PLACES_DEADLINE_SECONDS)
+        for task in pending:
+            task.cancel()
         
-        # Remove duplicates and limit results
-        unique_shops = []
+        # Collect unique place ids, preserving place type and ranking order
+        place_ids = []
         seen_place_ids = set()
+        for task in search_tasks:
+            if task not in done:
+                continue
+            if task.exception():
+                print(f"Error searching Google Places: {task.exception()}")
+                continue
+            for place in task.result():
+                if place["place_id"] not in seen_place_ids:
+                    seen_place_ids.add(place["place_id"])
+                    place_ids.append(place["place_id"])
         
-        for shop in shops:
-            if shop["place_id"] not in seen_place_ids:
-                seen_place_ids.add(shop["place_id"])
-                unique_shops.append(shop)
-                
-                if len(unique_shops) >= 20:  # Limit to 20 shops
+        # Look up details concurrently, stopping once enough shops are found
+        semaphore = asyncio.Semaphore(PLACES_DETAILS_CONCURRENCY)
+        shops_by_rank = {}
+        
+        async def lookup(rank: int, place_id: str):
+            async with semaphore:
+                if len(shops_by_rank) >= max_shops:
+                    return
+                place_details = await get_place_details(place_id, google_api_key)
+                if place_details:
+                    shops_by_rank[rank] = place_details
+        
+        pending = {asyncio.create_task(lookup(rank, place_id)) for rank, place_id in enumerate(place_ids)}
+        try:
+            while pending and len(shops_by_rank) < max_shops:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    print("Google Places deadline reached, returning partial results")
                     break
+                _, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in pending:
+                task.cancel()
         
-        return unique_shops
+        return [shops_by_rank[rank] for rank in sorted(shops_by_rank)][:max_shops]
         
     except Exception as e:
         print(f"Error fetching Google Places data: {e}")
         return []
 
+async def fetch_google_places_cached(latitude: float, longitude: float, radius: int = 5000, category: str = None,
+                                     limit: int = MAX_SHOPS) -> List[dict]:
+    """Fetch renovation shops for the geohash tile containing the given location, using the tile cache.
+
+    The search runs from the tile centre with the radius padded by the tile's
+    half-diagonal, so it covers ``radius`` around any point in the tile. The
+    result therefore includes shops farther than ``radius`` from the given
+    location; callers filter by their exact location (see ``sort_shops_by_distance``).
+    Up to ``limit`` shops are fetched, rounded up to a cache bucket.
+    """
+    if category not in CATEGORY_MAPPING:
+        category = None
+    tile = geohash_encode(latitude, longitude, NEARBY_CACHE_PRECISION)
+    bucket = radius_bucket(radius)
+    max_shops = limit_bucket(limit)
+    cache_key = (tile, bucket, category, max_shops)
+    
+    shops = nearby_cache.get(cache_key)
+    if shops is None:
+        # Search from the tile centre so the cached result does not depend on who asked first
+        tile_latitude, tile_longitude = geohash_center(tile)
+        search_radius = min(math.ceil(bucket + geohash_half_diagonal_m(tile)), PLACES_MAX_RADIUS)
+        shops = await fetch_google_places(tile_latitude, tile_longitude, search_radius, category, max_shops)
+        if shops:
+            nearby_cache.set(cache_key, shops)
+    
+    # Callers annotate shops with a per-user distance, so hand out copies
+    return [dict(shop) for shop in shops]
+
 async def get_place_details(place_id: str, api_key: str) -> Optional[dict]:
     """Get detailed information for a specific place"""
+    cached_details = place_details_cache.get(place_id)
+    if cached_details is not None:
+        return cached_details
+    
     try:
         url = "https://maps.googleapis.com/maps/api/place/details/json"
         params = {
@@ -295,36 +436,36 @@ async def get_place_details(place_id: str, api_key: str) -> Optional[dict]:
             "key": api_key
         }
         
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, params=params)
-            response.raise_for_status()
-            data = response.json()
+        data = await places_get("details", url, params)
+        
+        if data.get("status") == "OK":
+            result = data["result"]
             
-            if data.get("status") == "OK":
-                result = data["result"]
-                
-                # Map Google place types to our categories
-                category = map_place_types_to_category(result.get("types", []))
-                
-                # Generate renovation items based on category
-                items = generate_renovation_items(category, result.get("types", []))
-                
-                return {
-                    "place_id": place_id,
-                    "name": result.get("name", "Unknown Store"),
-                    "latitude": result["geometry"]["location"]["lat"],
-                    "longitude": result["geometry"]["location"]["lng"],
-                    "category": category,
-                    "description": f"{category} store offering renovation and home improvement products",
-                    "rating": result.get("rating", 0.0),
-                    "distance": "Unknown",  # Will be calculated on frontend
-                    "phone": result.get("formatted_phone_number"),
-                    "hours": format_opening_hours(result.get("opening_hours", {})),
-                    "address": result.get("formatted_address", "Address not available"),
-                    "items": items,
-                    "website": result.get("website"),
-                    "price_level": result.get("price_level")
-                }
+            # Map Google place types to our categories
+            category = map_place_types_to_category(result.get("types", []))
+            
+            # Generate renovation items based on category
+            items = generate_renovation_items(category, result.get("types", []))
+            
+            place_details = {
+                "id": place_id,
+                "place_id": place_id,
+                "name": result.get("name", "Unknown Store"),
+                "latitude": result["geometry"]["location"]["lat"],
+                "longitude": result["geometry"]["location"]["lng"],
+                "category": category,
+                "description": f"{category} store offering renovation and home improvement products",
+                "rating": result.get("rating", 0.0),
+                "distance": "Unknown",  # Will be calculated on frontend
+                "phone": result.get("formatted_phone_number"),
+                "hours": format_opening_hours(result.get("opening_hours", {})),
+                "address": result.get("formatted_address", "Address not available"),
+                "items": items,
+                "website": result.get("website"),
+                "price_level": result.get("price_level")
+            }
+            place_details_cache.set(place_id, place_details)
+            return place_details
                 
     except Exception as e:
         print(f"Error getting place details for {place_id}: {e}")
@@ -374,89 +515,103 @@ def format_opening_hours(opening_hours: dict) -> str:
     # Return first day's hours as example
     return opening_hours["weekday_text"][0] if opening_hours["weekday_text"] else "Hours not available"
 
-def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> str:
-    """Calculate distance between two points (simplified)"""
-    # Simple distance calculation for demo purposes
-    import math
-    
-    R = 6371  # Earth's radius in kilometers
-    
-    dlat = math.radians(lat2 - lat1)
-    dlon = math.radians(lon2 - lon1)
-    
-    a = math.sin(dlat/2) * math.sin(dlat/2) + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon/2) * math.sin(dlon/2)
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    
-    distance = R * c
-    
-    if distance < 1:
-        return f"{int(distance * 1000)} m"
+def format_distance(distance_m: float) -> str:
+    """Format a distance in metres for display"""
+    if distance_m < 1000:
+        return f"{int(distance_m)} m"
     else:
-        return f"{distance:.1f} km"
+        return f"{distance_m / 1000:.1f} km"
+
+# Spatial indexes over local shop data. SHOP_CATALOGUE_PATH points at a JSON
+# list of shops shaped like STATIC_SHOPS; when it is set, /shops/nearby is
+# answered from that catalogue without calling Google at all.
+SHOP_CATALOGUE_PATH = os.getenv("SHOP_CATALOGUE_PATH")
+catalogue_index = None
+if SHOP_CATALOGUE_PATH:
+    try:
+        catalogue_index = ShopIndex(load_shop_catalogue(SHOP_CATALOGUE_PATH))
+        print(f"Loaded {len(catalogue_index)} shops from {SHOP_CATALOGUE_PATH}")
+    except Exception as e:
+        print(f"Error loading shop catalogue {SHOP_CATALOGUE_PATH}: {e}")
+static_index = ShopIndex(STATIC_SHOPS)
+
+def shops_from_index(index: ShopIndex, indices, distances) -> List[dict]:
+    """Copy indexed shops and annotate them with their distance"""
+    shops_data = []
+    for i, distance_m in zip(indices.tolist(), distances.tolist()):
+        shop = dict(index.shops[i])
+        shop["distance"] = format_distance(distance_m)
+        shops_data.append(shop)
+    return shops_data
+
+def sort_shops_by_distance(shops_data: List[dict], latitude: float, longitude: float, radius: int) -> List[dict]:
+    """Annotate shops with their distance, drop those outside radius and sort nearest first"""
+    if not shops_data:
+        return shops_data
+    distances = haversine_m(
+        latitude, longitude,
+        np.array([shop["latitude"] for shop in shops_data]),
+        np.array([shop["longitude"] for shop in shops_data])
+    )
+    order = [i for i in np.argsort(distances, kind="stable").tolist() if distances[i] <= radius]
+    for i in order:
+        shops_data[i]["distance"] = format_distance(distances[i])
+    return [shops_data[i] for i in order]
+
+def static_shops_nearest(latitude: float, longitude: float, category: Optional[str], limit: int) -> List[dict]:
+    """Return the nearest static demo shops regardless of radius"""
+    indices, distances = static_index.query_knn(latitude, longitude, limit, category)
+    return shops_from_index(static_index, indices, distances)
 
 @router.get("/shops/nearby", response_model=ShopsResponse)
 async def get_nearby_shops(
     latitude: float = Query(..., description="User's latitude"),
     longitude: float = Query(..., description="User's longitude"),
     radius: int = Query(5000, description="Search radius in meters (default: 5000)"),
-    category: Optional[str] = Query(None, description="Filter by renovation category")
+    category: Optional[str] = Query(None, description="Filter by renovation category"),
+    limit: int = Query(MAX_SHOPS, ge=1, le=SHOPS_LIMIT_MAX, description="Maximum number of shops to return")
 ):
     """
-    Get nearby renovation shops based on user location.
-    Falls back to static data if Google Places API is not available.
+    Get nearby renovation shops based on user location, nearest first.
+    Served from the local shop catalogue when one is configured, otherwise from
+    Google Places. Falls back to the nearest static shops if neither has results.
     """
     try:
-        # Try to fetch from Google Places API first
-        google_shops = await fetch_google_places(latitude, longitude, radius, category)
+        shops_data = []
         
-        if google_shops:
-            # Use Google Places data
-            shops_data = google_shops
-        else:
-            # Fall back to static data
-            shops_data = STATIC_SHOPS.copy()
-            
-            # Filter by category if specified
-            if category:
-                shops_data = [shop for shop in shops_data if shop["category"] == category]
+        if catalogue_index is not None:
+            indices, distances = catalogue_index.query_radius(latitude, longitude, radius, category, limit)
+            shops_data = shops_from_index(catalogue_index, indices, distances)
+        
+        if not shops_data:
+            google_shops = await fetch_google_places_cached(latitude, longitude, radius, category, limit)
+            shops_data = sort_shops_by_distance(google_shops, latitude, longitude, radius)[:limit]
         
-        # Calculate distances for all shops
-        for shop in shops_data:
-            shop["distance"] = calculate_distance(
-                latitude, longitude, 
-                shop["latitude"], shop["longitude"]
-            )
+        if not shops_data:
+            # Fall back to static data
+            shops_data = static_shops_nearest(latitude, longitude, category, limit)
         
         # Convert to Shop objects
         shops = [Shop(**shop) for shop in shops_data]
         
-        return ShopsResponse(
-            shops=shops,
-            total_count=len(shops),
-            location=ShopLocation(latitude=latitude, longitude=longitude)
-        )
-        
     except Exception as e:
+        print(f"Error getting nearby shops: {e}")
         # Return static data as fallback
-        shops_data = STATIC_SHOPS.copy()
-        
-        if category:
-            shops_data = [shop for shop in shops_data if shop["category"] == category]
-        
-        # Calculate distances
-        for shop in shops_data:
-            shop["distance"] = calculate_distance(
-                latitude, longitude, 
-                shop["latitude"], shop["longitude"]
-            )
-        
-        shops = [Shop(**shop) for shop in shops_data]
-        
-        return ShopsResponse(
-            shops=shops,
-            total_count=len(shops),
-            location=ShopLocation(latitude=latitude, longitude=longitude)
-        )
+        shops = [Shop(**shop) for shop in static_shops_nearest(latitude, longitude, category, limit)]
+    
+    return ShopsResponse(
+        shops=shops,
+        total_count=len(shops),
+        location=ShopLocation(latitude=latitude, longitude=longitude)
+    )
+
+@router.get("/shops/cache/stats")
+async def get_shop_cache_stats():
+    """Get hit/miss counters for the nearby-shops and place-details caches"""
+    return {
+        "nearby": nearby_cache.stats(),
+        "place_details": place_details_cache.stats()
+    }
 
 @router.get("/shops/categories")
 async def get_shop_categories():
@@ -1,11 +1,13 @@
-from fastapi import Depends, APIRouter
+from typing import Optional
+from fastapi import Depends, APIRouter, Query
 from fastapi.exceptions import HTTPException
 from ..database import get_db
-from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from ..schemas import User, ResponseUser, Token
-from passlib.context import CryptContext
-from .. import models, oauth2
+from .. import models, oauth2, utils
 from ..oauth2 import check_authorization
+from ..pagination import PageParams, page_params, paginate
 
 router = APIRouter()
 
@@ -14,24 +16,29 @@ def home():
     return {"ping": "pong"}
 
 @router.post("/register", status_code = 201, response_model = Token, tags=['user'])
-def create_user(user : User ,db : Session = Depends(get_db)) :
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-    hashed_pass = pwd_context.hash(user.password)
-    user.password = hashed_pass
+async def create_user(user : User ,db : AsyncSession = Depends(get_db)) :
+    user.password = await utils.hash_password(user.password)
     new_user = models.User(**user.dict())
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
-    access_token = oauth2.create_access_token({ "id": new_user.id, "email": new_user.email })
+    try:
+        await db.commit()
+    except IntegrityError:
+        raise HTTPException(status_code=409, detail="Email already registered")
+    await db.refresh(new_user)
+    access_token = oauth2.create_access_token(oauth2.user_claims(new_user))
     return {"access_token": access_token, "token_type": "Bearer" }
 
 @router.get("/me", response_model=ResponseUser, tags=['user'])
-def get_info(db: Session = Depends(get_db), user = Depends(oauth2.get_current_user)):
-    user_from_db = db.query(models.User).filter(models.User.id == user.id).first()
+async def get_info(db: AsyncSession = Depends(get_db), user = Depends(oauth2.get_current_user)):
+    user_from_db = await db.get(models.User, user.id)
     return user_from_db
 
+# Password hashes are never listed
+USER_FIELDS = ("id", "username", "email", "role")
+
 @router.get("/users", tags=['user'])
-def get_users(db: Session = Depends(get_db), user = Depends(oauth2.get_current_user)):
-    check_authorization(user)
-    users = db.query(models.User).all()
-    return users
\ No newline at end of file
+async def get_users(role: Optional[int] = Query(None), page: PageParams = Depends(page_params),
+                    db: AsyncSession = Depends(get_db), user = Depends(oauth2.get_current_user)):
+    await check_authorization(user, db)
+    filters = [models.User.role == role] if role is not None else []
+    return await paginate(db, models.User, page, USER_FIELDS, filters)
@@ -1,3 +1,5 @@
+from datetime import date
+from typing import List, Optional
 from pydantic import BaseModel, EmailStr
 
 
@@ -15,9 +17,16 @@ class Photo(BaseModel) :
     
 class Booking(BaseModel) :
     user_id : int
-    date : str
+    date : date
     service_type : str
     status : int
+
+class BookingStatusUpdate(BaseModel) :
+    id : int
+    status : int
+
+class BookingDelete(BaseModel) :
+    id : int
      
 class ResponseUser(BaseModel) :
     id : int
@@ -39,6 +48,7 @@ class Token(BaseModel) :
 class TokenData(BaseModel) :
     id : int 
     email : str
+    role : Optional[int] = None
 
 class TokenResponse(BaseModel) :
     access_token : str
@@ -46,4 +56,49 @@ class TokenResponse(BaseModel) :
     user : ResponseUser
     
     class Config :
-        orm_mode = True
\ No newline at end of file
+        orm_mode = True
+
+
+# Structured model output. These models double as Gemini response schemas,
+# which do not support default values, so every field is required (nullable
+# where the model may have nothing to say).
+
+class RoomCoordinates(BaseModel) :
+    x : int
+    y : int
+    width : int
+    height : int
+
+class DetectedRoom(BaseModel) :
+    id : str
+    label : str
+    type : str
+    coordinates : RoomCoordinates
+    confidence : float
+    furniture : List[str]
+    description : str
+
+class RoomDetection(BaseModel) :
+    rooms : List[DetectedRoom]
+
+class CostCategory(BaseModel) :
+    category : str
+    cost : str
+    description : str
+
+class ShoppingLink(BaseModel) :
+    platform : str
+    url : str
+    note : Optional[str]
+
+class CostItem(BaseModel) :
+    item : str
+    cost : str
+    quantity : int
+    shopping_links : Optional[List[ShoppingLink]]
+
+class CostEstimation(BaseModel) :
+    total_cost : str
+    currency : str
+    breakdown : List[CostCategory]
+    items : List[CostItem]
@@ -0,0 +1,56 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable
+from .metrics import SINGLE_FLIGHT_CALLS
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key into one execution.
+
+    The first caller for a key starts the call; callers arriving while it is
+    in flight wait for the same result (or exception). The call runs in its own
+    task, so a caller that is cancelled or times out does not abort it for the
+    others; it is only cancelled once every caller has gone away.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self._waiters: Dict[Hashable, int] = {}
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, group: str, field: str):
+        counters = self.stats.setdefault(group, {"calls": 0, "coalesced": 0})
+        counters[field] += 1
+        SINGLE_FLIGHT_CALLS.labels(group=group, result="upstream" if field == "calls" else "coalesced").inc()
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable], group: str = "default"):
+        """Return the result of ``call()``, shared with concurrent callers using ``key``."""
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(call())
+            self._calls[key] = task
+            self._waiters[key] = 0
+            task.add_done_callback(lambda _: self._forget(key, task))
+            self._count(group, "calls")
+        else:
+            self._count(group, "coalesced")
+
+        self._waiters[key] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            remaining = self._waiters.get(key)
+            if remaining is not None and self._calls.get(key) is task:
+                self._waiters[key] = remaining - 1
+                if remaining == 1 and not task.done():
+                    task.cancel()
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+            del self._waiters[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved even if every caller went away
+            task.exception()
+
+    def in_flight(self) -> int:
+        return len(self._calls)
@@ -0,0 +1,162 @@
+import json
+import math
+import numpy as np
+from typing import List, Optional, Tuple
+
+EARTH_RADIUS_M = 6371000.0
+# Arc length of one degree along a great circle on the same sphere haversine uses
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_M / 180.0
+MAX_DISTANCE_M = math.pi * EARTH_RADIUS_M
+# Widens bounding boxes slightly so shops on a cell edge survive float rounding
+_BOX_MARGIN_DEG = 1e-9
+
+
+def haversine_m(latitude: float, longitude: float, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    """Vectorized great-circle distance in metres from one point to arrays of points (degrees)."""
+    lat1 = math.radians(latitude)
+    lon1 = math.radians(longitude)
+    lat2 = np.radians(latitudes)
+    lon2 = np.radians(longitudes)
+    return _haversine_rad(lat1, lon1, math.cos(lat1), lat2, lon2, np.cos(lat2))
+
+
+def _haversine_rad(lat1, lon1, cos_lat1, lat2, lon2, cos_lat2) -> np.ndarray:
+    a = np.sin((lat2 - lat1) / 2) ** 2 + cos_lat1 * cos_lat2 * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+class ShopIndex:
+    """In-memory spatial index over shop dicts for radius and k-nearest queries.
+
+    Coordinates are kept as NumPy arrays (radians and cosines precomputed) and
+    bucketed into a fixed lat/lon grid. A query only computes distances for the
+    grid cells overlapping its bounding box. Category filters use boolean masks
+    built once when the index is created.
+    """
+
+    def __init__(self, shops: List[dict], cell_size_deg: float = 0.1):
+        self.shops = list(shops)
+        self.cell_size_deg = cell_size_deg
+        self._columns = int(math.ceil(360.0 / cell_size_deg))
+        self._rows = int(math.ceil(180.0 / cell_size_deg))
+
+        latitudes = np.array([shop["latitude"] for shop in self.shops], dtype=np.float64)
+        longitudes = np.array([shop["longitude"] for shop in self.shops], dtype=np.float64)
+        self._lat_rad = np.radians(latitudes)
+        self._lon_rad = np.radians(longitudes)
+        self._cos_lat = np.cos(self._lat_rad)
+
+        cell_keys = self._cell_keys(latitudes, longitudes)
+        self._order = np.argsort(cell_keys, kind="stable")
+        self._sorted_keys = cell_keys[self._order]
+
+        categories = np.array([shop.get("category", "") for shop in self.shops], dtype=object)
+        self.category_masks = {
+            category: categories == category for category in set(categories.tolist())
+        }
+
+    def __len__(self):
+        return len(self.shops)
+
+    def _row(self, latitude):
+        return np.clip(np.floor((latitude + 90.0) / self.cell_size_deg), 0, self._rows - 1).astype(np.int64)
+
+    def _column(self, longitude):
+        return np.floor(((longitude + 180.0) % 360.0) / self.cell_size_deg).astype(np.int64) % self._columns
+
+    def _cell_keys(self, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+        return self._row(latitudes) * self._columns + self._column(longitudes)
+
+    def _candidates(self, latitude: float, longitude: float, radius_m: float) -> np.ndarray:
+        """Return indices of shops in grid cells overlapping the query's bounding box."""
+        if radius_m >= MAX_DISTANCE_M / 2:
+            return self._order
+        dlat = radius_m / METERS_PER_DEGREE + _BOX_MARGIN_DEG
+        lat_min, lat_max = latitude - dlat, latitude + dlat
+
+        if lat_min <= -90.0 or lat_max >= 90.0:
+            # The cap contains a pole, so it spans every longitude
+            dlon = 180.0
+        else:
+            # Longitude half-width of a spherical cap: asin(sin(r/R) / cos(lat))
+            ratio = math.sin(radius_m / EARTH_RADIUS_M) / math.cos(math.radians(latitude))
+            dlon = 180.0 if ratio >= 1.0 else math.degrees(math.asin(ratio)) + _BOX_MARGIN_DEG
+
+        row_start = int(self._row(np.float64(max(lat_min, -90.0))))
+        row_end = int(self._row(np.float64(min(lat_max, 90.0))))
+        if 2 * dlon >= 360.0:
+            column_spans = [(0, self._columns - 1)]
+        else:
+            column_start = int(self._column(np.float64(longitude - dlon)))
+            column_end = int(self._column(np.float64(longitude + dlon)))
+            if column_start <= column_end:
+                column_spans = [(column_start, column_end)]
+            else:
+                # Bounding box crosses the antimeridian
+                column_spans = [(column_start, self._columns - 1), (0, column_end)]
+
+        slices = []
+        for row in range(row_start, row_end + 1):
+            for column_start, column_end in column_spans:
+                lo = np.searchsorted(self._sorted_keys, row * self._columns + column_start, side="left")
+                hi = np.searchsorted(self._sorted_keys, row * self._columns + column_end, side="right")
+                if hi > lo:
+                    slices.append(self._order[lo:hi])
+        if not slices:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(slices)
+
+    def _distances(self, latitude: float, longitude: float, indices: np.ndarray) -> np.ndarray:
+        lat1 = math.radians(latitude)
+        return _haversine_rad(
+            lat1, math.radians(longitude), math.cos(lat1),
+            self._lat_rad[indices], self._lon_rad[indices], self._cos_lat[indices]
+        )
+
+    def query_radius(self, latitude: float, longitude: float, radius_m: float,
+                     category: Optional[str] = None, limit: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (indices, distances_m) of shops within ``radius_m``, nearest first."""
+        indices = self._candidates(latitude, longitude, radius_m)
+        if category is not None:
+            mask = self.category_masks.get(category)
+            if mask is None:
+                return np.empty(0, dtype=np.int64), np.empty(0)
+            indices = indices[mask[indices]]
+        if indices.size == 0:
+            return indices, np.empty(0)
+
+        distances = self._distances(latitude, longitude, indices)
+        within = distances <= radius_m
+        indices, distances = indices[within], distances[within]
+
+        if limit is not None and indices.size > limit:
+            nearest = np.argpartition(distances, limit - 1)[:limit]
+            indices, distances = indices[nearest], distances[nearest]
+        order = np.argsort(distances, kind="stable")
+        return indices[order], distances[order]
+
+    def query_knn(self, latitude: float, longitude: float, k: int,
+                  category: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (indices, distances_m) of the ``k`` nearest shops, nearest first."""
+        radius_m = 2000.0
+        while True:
+            indices, distances = self.query_radius(latitude, longitude, radius_m, category, limit=k)
+            if indices.size >= k or radius_m >= MAX_DISTANCE_M:
+                return indices, distances
+            radius_m = min(radius_m * 4, MAX_DISTANCE_M)
+
+    def query_radius_batch(self, points: List[Tuple[float, float]], radius_m: float,
+                           category: Optional[str] = None, limit: Optional[int] = None):
+        """Run ``query_radius`` for each (latitude, longitude) in ``points``."""
+        return [self.query_radius(latitude, longitude, radius_m, category, limit) for latitude, longitude in points]
+
+    def query_knn_batch(self, points: List[Tuple[float, float]], k: int, category: Optional[str] = None):
+        """Run ``query_knn`` for each (latitude, longitude) in ``points``."""
+        return [self.query_knn(latitude, longitude, k, category) for latitude, longitude in points]
+
+
+def load_shop_catalogue(path: str) -> List[dict]:
+    """Load a JSON list of shop dicts shaped like ``STATIC_SHOPS``."""
+    with open(path) as f:
+        shops = json.load(f)
+    return [shop for shop in shops if shop.get("latitude") is not None and shop.get("longitude") is not None]
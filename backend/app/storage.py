@@ -0,0 +1,282 @@
+import os
+from typing import AsyncIterator, Optional
+from urllib.parse import quote
+from starlette.concurrency import run_in_threadpool, iterate_in_threadpool
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CHUNK_SIZE = 1024 * 1024
+SIGNED_URL_TTL_SECONDS = int(os.getenv("STORAGE_SIGNED_URL_TTL_SECONDS", "3600"))
+
+
+def content_key(prefix: str, digest: str, extension: str) -> str:
+    """Build a content-addressed key such as ``photos/<sha256>.png``."""
+    return f"{prefix}/{digest}.{extension.lstrip('.')}"
+
+
+async def _aiter(data: bytes):
+    for start in range(0, len(data), CHUNK_SIZE):
+        yield data[start:start + CHUNK_SIZE]
+
+
+class Storage:
+    """Interface shared by the storage backends.
+
+    Keys are ``/``-separated relative paths. Streams are async iterables of
+    bytes; ``end`` in range reads is inclusive, as in an HTTP Range header.
+    """
+
+    async def put_stream(self, key: str, chunks, content_type: Optional[str] = None) -> int:
+        raise NotImplementedError
+
+    async def put_bytes(self, key: str, data: bytes, content_type: Optional[str] = None) -> int:
+        return await self.put_stream(key, _aiter(data), content_type)
+
+    def get_stream(self, key: str, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        raise NotImplementedError
+
+    async def size(self, key: str) -> Optional[int]:
+        raise NotImplementedError
+
+    async def exists(self, key: str) -> bool:
+        return await self.size(key) is not None
+
+    async def delete(self, key: str):
+        raise NotImplementedError
+
+    async def move(self, source: str, destination: str):
+        """Rename ``source`` to ``destination``, replacing any object already there."""
+        raise NotImplementedError
+
+    def url(self, key: str, base_url: str) -> str:
+        """Public URL for ``key``; ``base_url`` is the API's own base URL."""
+        raise NotImplementedError
+
+
+class LocalStorage(Storage):
+    """Stores objects as files under ``root``; the public instance's root is mounted at ``/assets``."""
+
+    def __init__(self, root: str = "assets"):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        path = os.path.normpath(os.path.join(self.root, key))
+        if not path.startswith(os.path.normpath(self.root) + os.sep):
+            raise ValueError(f"Invalid storage key: {key}")
+        return path
+
+    async def put_stream(self, key: str, chunks, content_type: Optional[str] = None) -> int:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.urandom(4).hex()}.part"
+        size = 0
+        f = await run_in_threadpool(open, temp_path, "wb")
+        try:
+            async for chunk in chunks:
+                await run_in_threadpool(f.write, chunk)
+                size += len(chunk)
+            await run_in_threadpool(f.close)
+            # Publish atomically so readers never see a partial file
+            await run_in_threadpool(os.replace, temp_path, path)
+        except BaseException:
+            f.close()
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+        return size
+
+    async def get_stream(self, key: str, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        path = self._path(key)
+        f = await run_in_threadpool(open, path, "rb")
+        try:
+            await run_in_threadpool(f.seek, start)
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                chunk = await run_in_threadpool(f.read, CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+        finally:
+            f.close()
+
+    async def size(self, key: str) -> Optional[int]:
+        try:
+            return os.path.getsize(self._path(key))
+        except OSError:
+            return None
+
+    async def delete(self, key: str):
+        try:
+            await run_in_threadpool(os.remove, self._path(key))
+        except FileNotFoundError:
+            pass
+
+    async def move(self, source: str, destination: str):
+        path = self._path(destination)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        await run_in_threadpool(os.replace, self._path(source), path)
+
+    def url(self, key: str, base_url: str) -> str:
+        return f"{base_url.rstrip('/')}/assets/{quote(key)}"
+
+
+class S3Storage(Storage):
+    """S3-compatible object storage (AWS S3, GCS interop, MinIO).
+
+    Set ``STORAGE_ENDPOINT_URL`` to target a local MinIO-style server. Objects
+    are served from ``STORAGE_PUBLIC_URL`` when set, otherwise through
+    presigned URLs, so any instance can return a URL that works everywhere.
+    """
+
+    # S3 multipart parts must be at least 5 MB (except the last one)
+    PART_SIZE = 8 * 1024 * 1024
+
+    def __init__(self, bucket: str, endpoint_url: Optional[str] = None, public_url: Optional[str] = None,
+                 region: Optional[str] = None, prefix: str = ""):
+        try:
+            import boto3
+            from botocore.exceptions import ClientError
+        except ImportError as e:
+            raise RuntimeError("boto3 is required for STORAGE_BACKEND=s3") from e
+        self._client_error = ClientError
+        self.bucket = bucket
+        self.public_url = public_url.rstrip("/") if public_url else None
+        self.prefix = prefix.strip("/")
+        self.client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    async def put_stream(self, key: str, chunks, content_type: Optional[str] = None) -> int:
+        object_key = self._key(key)
+        extra = {"ContentType": content_type} if content_type else {}
+        buffer = bytearray()
+        size = 0
+        upload_id = None
+        parts = []
+        try:
+            async for chunk in chunks:
+                buffer.extend(chunk)
+                size += len(chunk)
+                if len(buffer) >= self.PART_SIZE:
+                    if upload_id is None:
+                        response = await run_in_threadpool(
+                            self.client.create_multipart_upload, Bucket=self.bucket, Key=object_key, **extra
+                        )
+                        upload_id = response["UploadId"]
+                    parts.append(await self._upload_part(object_key, upload_id, len(parts) + 1, bytes(buffer)))
+                    buffer.clear()
+            if upload_id is None:
+                await run_in_threadpool(
+                    self.client.put_object, Bucket=self.bucket, Key=object_key, Body=bytes(buffer), **extra
+                )
+            else:
+                if buffer:
+                    parts.append(await self._upload_part(object_key, upload_id, len(parts) + 1, bytes(buffer)))
+                await run_in_threadpool(
+                    self.client.complete_multipart_upload, Bucket=self.bucket, Key=object_key,
+                    UploadId=upload_id, MultipartUpload={"Parts": parts}
+                )
+        except BaseException:
+            if upload_id is not None:
+                await run_in_threadpool(
+                    self.client.abort_multipart_upload, Bucket=self.bucket, Key=object_key, UploadId=upload_id
+                )
+            raise
+        return size
+
+    async def _upload_part(self, object_key: str, upload_id: str, part_number: int, data: bytes) -> dict:
+        response = await run_in_threadpool(
+            self.client.upload_part, Bucket=self.bucket, Key=object_key,
+            UploadId=upload_id, PartNumber=part_number, Body=data
+        )
+        return {"ETag": response["ETag"], "PartNumber": part_number}
+
+    async def get_stream(self, key: str, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        params = {"Bucket": self.bucket, "Key": self._key(key)}
+        if start or end is not None:
+            params["Range"] = f"bytes={start}-{'' if end is None else end}"
+        response = await run_in_threadpool(self.client.get_object, **params)
+        body = response["Body"]
+        try:
+            async for chunk in iterate_in_threadpool(body.iter_chunks(CHUNK_SIZE)):
+                yield chunk
+        finally:
+            body.close()
+
+    async def size(self, key: str) -> Optional[int]:
+        try:
+            response = await run_in_threadpool(self.client.head_object, Bucket=self.bucket, Key=self._key(key))
+        except self._client_error:
+            return None
+        return response["ContentLength"]
+
+    async def delete(self, key: str):
+        await run_in_threadpool(self.client.delete_object, Bucket=self.bucket, Key=self._key(key))
+
+    async def move(self, source: str, destination: str):
+        # S3 has no rename; the copy keeps the source's content type
+        await run_in_threadpool(
+            self.client.copy_object, Bucket=self.bucket, Key=self._key(destination),
+            CopySource={"Bucket": self.bucket, "Key": self._key(source)}
+        )
+        await self.delete(source)
+
+    def url(self, key: str, base_url: str) -> str:
+        if self.public_url:
+            return f"{self.public_url}/{quote(self._key(key))}"
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": self._key(key)}, ExpiresIn=SIGNED_URL_TTL_SECONDS
+        )
+
+
+def create_storage() -> Storage:
+    """Build the storage backend selected by ``STORAGE_BACKEND`` (``local`` or ``s3``)."""
+    backend = os.getenv("STORAGE_BACKEND", "local").lower()
+    if backend == "s3":
+        return S3Storage(
+            bucket=os.getenv("STORAGE_BUCKET"),
+            endpoint_url=os.getenv("STORAGE_ENDPOINT_URL"),
+            public_url=os.getenv("STORAGE_PUBLIC_URL"),
+            region=os.getenv("STORAGE_REGION"),
+            prefix=os.getenv("STORAGE_PREFIX", "")
+        )
+    return LocalStorage(os.getenv("STORAGE_LOCAL_ROOT", "assets"))
+
+
+def create_private_storage() -> Storage:
+    """Build the backend for objects that are never served publicly: job inputs and debug dumps.
+
+    Locally this is a separate, unmounted directory. On S3 it is
+    ``STORAGE_PRIVATE_BUCKET`` (the main bucket by default) under its own
+    prefix, and URLs are never built from ``STORAGE_PUBLIC_URL``. A public
+    main bucket without a private bucket or an explicit private prefix is a
+    configuration error.
+    """
+    backend = os.getenv("STORAGE_BACKEND", "local").lower()
+    if backend == "s3":
+        private_bucket = os.getenv("STORAGE_PRIVATE_BUCKET")
+        if not private_bucket and os.getenv("STORAGE_PUBLIC_URL") and not os.getenv("STORAGE_PRIVATE_PREFIX"):
+            raise RuntimeError(
+                "STORAGE_PUBLIC_URL is set but STORAGE_PRIVATE_BUCKET is not, so private objects would share "
+                "the public bucket; set STORAGE_PRIVATE_BUCKET, or STORAGE_PRIVATE_PREFIX to a prefix the "
+                "bucket policy keeps private"
+            )
+        default_prefix = "/".join(part for part in (os.getenv("STORAGE_PREFIX", "").strip("/"), "private") if part)
+        return S3Storage(
+            bucket=private_bucket or os.getenv("STORAGE_BUCKET"),
+            endpoint_url=os.getenv("STORAGE_ENDPOINT_URL"),
+            region=os.getenv("STORAGE_REGION"),
+            prefix=os.getenv("STORAGE_PRIVATE_PREFIX", default_prefix)
+        )
+    return LocalStorage(os.getenv("STORAGE_PRIVATE_ROOT", "private"))
+
+
+storage = create_storage()
+private_storage = create_private_storage()
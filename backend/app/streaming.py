@@ -0,0 +1,194 @@
+import asyncio
+import json
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from fastapi import HTTPException, Request, status
+from fastapi.responses import StreamingResponse
+from dotenv import load_dotenv
+
+load_dotenv()
+
+STREAM_MEDIA_TYPES = {
+    "sse": "text/event-stream",
+    "ndjson": "application/x-ndjson",
+}
+
+# Idle connections are dropped by proxies (Cloud Run, mobile carriers) well
+# before a slow generation finishes, so a heartbeat is sent while waiting.
+HEARTBEAT_SECONDS = float(os.getenv("STREAM_HEARTBEAT_SECONDS", "10"))
+
+
+def stream_format(request: Request, stream: Optional[str] = None) -> Optional[str]:
+    """Return ``"sse"``, ``"ndjson"`` or None for a plain JSON response.
+
+    Streaming is opt-in, either with the ``stream`` form field or through the
+    ``Accept`` header (``text/event-stream`` or ``application/x-ndjson``).
+    """
+    if stream:
+        fmt = stream.lower()
+        if fmt in ("true", "1", "yes"):
+            return "sse"
+        if fmt in ("false", "0", "no"):
+            return None
+        if fmt not in STREAM_MEDIA_TYPES:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail="stream must be one of: sse, ndjson")
+        return fmt
+    accept = request.headers.get("accept", "")
+    for fmt, media_type in STREAM_MEDIA_TYPES.items():
+        if media_type in accept:
+            return fmt
+    return None
+
+
+def encode_event(fmt: str, event: str, data: dict) -> str:
+    payload = json.dumps(data, default=str)
+    if fmt == "sse":
+        return f"event: {event}\ndata: {payload}\n\n"
+    return f'{{"event": "{event}", "data": {payload}}}\n'
+
+
+def encode_heartbeat(fmt: str) -> str:
+    if fmt == "sse":
+        return ": keepalive\n\n"
+    return '{"event": "heartbeat"}\n'
+
+
+def _error_message(error: Exception) -> str:
+    return error.detail if isinstance(error, HTTPException) else str(error)
+
+
+async def run_stages(stages: Dict[str, Awaitable[dict]]) -> Tuple[dict, dict]:
+    """Await independent stages concurrently.
+
+    Each stage resolves to a dict of response fields. Returns the merged fields
+    of the stages that succeeded and an error message per stage that failed.
+    If every stage failed with an HTTPException (e.g. 503 while Gemini is
+    unavailable) the first one is raised so its status and headers reach the client.
+    """
+    names = list(stages)
+    results = await asyncio.gather(*stages.values(), return_exceptions=True)
+    if all(isinstance(result, HTTPException) for result in results):
+        raise results[0]
+    fields, errors = {}, {}
+    for name, result in zip(names, results):
+        if isinstance(result, BaseException):
+            if not isinstance(result, Exception):
+                raise result
+            print(f"Error in {name} stage: {result}")
+            errors[name] = _error_message(result)
+        else:
+            fields.update(result)
+    return fields, errors
+
+
+def stream_stages(
+    fmt: str,
+    accepted: dict,
+    stages: Dict[str, Awaitable[dict]],
+    finish: Callable[[dict, dict], dict]
+) -> StreamingResponse:
+    """Stream the progress of independent stages as SSE or NDJSON events.
+
+    Emits ``accepted`` straight away, then one event per stage named after it
+    as soon as that stage completes (in completion order, so a fast stage never
+    waits for a slow one), ``error`` for a failed stage and finally ``done``
+    with ``finish(fields, errors)``. Stage payloads are response fields, so a
+    client can merge each event into the partial result it renders.
+    """
+    async def events():
+        yield encode_event(fmt, "accepted", accepted)
+        tasks = {asyncio.ensure_future(coro): name for name, coro in stages.items()}
+        fields, errors = {}, {}
+        try:
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=HEARTBEAT_SECONDS,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    yield encode_heartbeat(fmt)
+                    continue
+                for task in done:
+                    name = tasks[task]
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        print(f"Error in {name} stage: {e}")
+                        errors[name] = _error_message(e)
+                        yield encode_event(fmt, "error", {"stage": name, "detail": errors[name]})
+                    else:
+                        fields.update(result)
+                        yield encode_event(fmt, name, result)
+            yield encode_event(fmt, "done", finish(fields, errors))
+        finally:
+            # The client went away: stop any stage still running
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(
+        events(),
+        media_type=STREAM_MEDIA_TYPES[fmt],
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def _append_line(items: list, line: bytes, max_items: int):
+    line = line.strip()
+    if not line:
+        return
+    if len(items) >= max_items:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f"At most {max_items} items per request")
+    try:
+        items.append((json.loads(line), None))
+    except ValueError as e:
+        items.append((None, f"Invalid JSON: {e}"))
+
+
+def _body_too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                         detail=f"Body exceeds the {max_bytes / (1024 * 1024):g} MB limit")
+
+
+async def _body_chunks(request: Request, max_bytes: int):
+    """Yield the request body, rejecting it as soon as it exceeds ``max_bytes``."""
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        raise _body_too_large(max_bytes)
+    total = 0
+    async for chunk in request.stream():
+        total += len(chunk)
+        if total > max_bytes:
+            raise _body_too_large(max_bytes)
+        yield chunk
+
+
+async def read_items(request: Request, max_items: int, max_bytes: int) -> List[Tuple[Any, Optional[str]]]:
+    """Read a bulk request body: a JSON array, or NDJSON parsed as it streams in.
+
+    Returns ``(item, error)`` pairs in order. A malformed NDJSON line becomes
+    an error entry rather than failing the whole batch; more than
+    ``max_items`` items or ``max_bytes`` bytes is a 413.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type == STREAM_MEDIA_TYPES["ndjson"]:
+        items, buffer = [], b""
+        async for chunk in _body_chunks(request, max_bytes):
+            *lines, buffer = (buffer + chunk).split(b"\n")
+            for line in lines:
+                _append_line(items, line, max_items)
+        _append_line(items, buffer, max_items)
+        return items
+
+    body = b"".join([chunk async for chunk in _body_chunks(request, max_bytes)])
+    try:
+        body = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Body must be a JSON array or application/x-ndjson")
+    if not isinstance(body, list):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Body must be a JSON array")
+    if len(body) > max_items:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f"At most {max_items} items per request")
+    return [(item, None) for item in body]
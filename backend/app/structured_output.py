@@ -0,0 +1,44 @@
+from typing import Type, TypeVar
+from google.genai import types
+from pydantic import BaseModel, ValidationError
+
+Model = TypeVar("Model", bound=BaseModel)
+
+
+class StructuredOutputError(ValueError):
+    """The model reply could not be validated against the expected schema."""
+
+
+def json_config(schema: Type[BaseModel]) -> types.GenerateContentConfig:
+    """Generation config constraining the reply to JSON matching ``schema``."""
+    return types.GenerateContentConfig(response_mime_type="application/json", response_schema=schema)
+
+
+def response_text(response) -> str:
+    for part in response.candidates[0].content.parts:
+        if getattr(part, "text", None):
+            return part.text
+    return ""
+
+
+def parse_response(response, schema: Type[Model]) -> Model:
+    """Validate a JSON reply straight into ``schema``.
+
+    Schema-constrained replies are plain JSON and go through pydantic's JSON
+    parser in one pass. If a reply was wrapped in prose or a code fence, the
+    outermost object is sliced out once (no regex scan) and validated.
+    Raises ``StructuredOutputError`` when the reply does not fit the schema.
+    """
+    text = response_text(response)
+    try:
+        return schema.model_validate_json(text)
+    except ValidationError as first_error:
+        start, end = text.find("{"), text.rfind("}")
+        if 0 <= start < end and (start, end) != (0, len(text) - 1):
+            try:
+                return schema.model_validate_json(text[start:end + 1])
+            except ValidationError:
+                pass
+        raise StructuredOutputError(
+            f"Model reply did not match {schema.__name__}: {first_error.error_count()} validation errors"
+        ) from first_error
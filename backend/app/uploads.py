@@ -0,0 +1,249 @@
+import hashlib
+import os
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Optional, Tuple
+from fastapi import HTTPException, UploadFile, status
+from PIL import Image, ImageOps
+from starlette.concurrency import run_in_threadpool
+from dotenv import load_dotenv
+from .metrics import UPLOAD_BYTES, IMAGE_PROCESSING_SECONDS, timed
+
+load_dotenv()
+
+MAX_UPLOAD_SIZE_MB = float(os.getenv("MAX_UPLOAD_SIZE_MB", "10"))
+MAX_UPLOAD_BYTES = int(MAX_UPLOAD_SIZE_MB * 1024 * 1024)
+CHUNK_SIZE = 1024 * 1024
+
+IMAGE_MIME_TYPES = {
+    "png": "image/png",
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+}
+
+ORIENTATION_TAG = 0x0112
+TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+
+@dataclass
+class ModelInputProfile:
+    """How an uploaded image is downscaled and re-encoded before it is sent to Gemini."""
+    max_edge: int
+    format: str
+    quality: int
+
+
+# Floor plans and detection inputs are line art or renders the model reads at
+# low resolution; room photos keep more detail for photoreal edits.
+MODEL_INPUT_PROFILES = {
+    "photo": ModelInputProfile(
+        max_edge=int(os.getenv("MODEL_INPUT_MAX_EDGE_PHOTO", "1536")),
+        format=os.getenv("MODEL_INPUT_FORMAT_PHOTO", "jpeg"),
+        quality=int(os.getenv("MODEL_INPUT_QUALITY", "85"))
+    ),
+    "floor_plan": ModelInputProfile(
+        max_edge=int(os.getenv("MODEL_INPUT_MAX_EDGE_FLOOR_PLAN", "1024")),
+        format=os.getenv("MODEL_INPUT_FORMAT_FLOOR_PLAN", "webp"),
+        quality=int(os.getenv("MODEL_INPUT_QUALITY", "85"))
+    ),
+    "detection": ModelInputProfile(
+        max_edge=int(os.getenv("MODEL_INPUT_MAX_EDGE_DETECTION", "1024")),
+        format=os.getenv("MODEL_INPUT_FORMAT_DETECTION", "jpeg"),
+        quality=int(os.getenv("MODEL_INPUT_QUALITY", "85"))
+    ),
+}
+
+
+@dataclass
+class PreparedImage:
+    """Image bytes ready to send to the model, with the size of the upload they came from."""
+    data: bytes
+    mime_type: str
+    size: Tuple[int, int]
+    original_size: Tuple[int, int]
+
+    def to_original(self, coordinates: dict) -> dict:
+        """Map an x/y/width/height box from model pixel space back to the original upload."""
+        scale_x = self.original_size[0] / self.size[0]
+        scale_y = self.original_size[1] / self.size[1]
+        mapped = dict(coordinates)
+        for key, scale in (("x", scale_x), ("width", scale_x), ("y", scale_y), ("height", scale_y)):
+            if isinstance(mapped.get(key), (int, float)):
+                mapped[key] = round(mapped[key] * scale)
+        return mapped
+
+
+@dataclass
+class IngestedImage:
+    """An uploaded image held in memory, sniffed but not yet decoded."""
+    data: bytes
+    format: str
+    mime_type: str
+
+    async def prepare(self, profile: str) -> PreparedImage:
+        """Orient, downscale and re-encode the upload for a model input profile, off the event loop."""
+        try:
+            return await run_in_threadpool(prepare_image, self.data, self.format, MODEL_INPUT_PROFILES[profile])
+        except Exception as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid image upload: {e}")
+
+
+def sniff_image_format(header: bytes) -> Optional[str]:
+    """Identify a supported image format from its leading bytes."""
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if header.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+async def upload_chunks(upload: UploadFile, chunk_size: int = CHUNK_SIZE, kind: Optional[str] = "file"):
+    """Yield an upload's contents in chunks without reading it all into memory.
+
+    The total size is observed under ``kind``; pass None when it was already recorded.
+    """
+    total = 0
+    while True:
+        chunk = await upload.read(chunk_size)
+        if not chunk:
+            break
+        total += len(chunk)
+        yield chunk
+    if kind is not None:
+        UPLOAD_BYTES.labels(kind=kind).observe(total)
+
+
+@dataclass
+class UploadDigest:
+    sha256: str
+    size: int
+    header: bytes
+
+
+def _upload_too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                         detail=f"Upload exceeds the {max_bytes / (1024 * 1024):g} MB limit")
+
+
+class UploadHasher:
+    """SHA-256 and measure an upload while it streams through ``chunks()``.
+
+    The upload is read once, one chunk at a time, so it can be written to
+    storage and hashed in the same pass. Going over ``max_bytes`` is a 413.
+    """
+
+    def __init__(self, upload: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES, kind: str = "file"):
+        self.upload = upload
+        self.max_bytes = max_bytes
+        self.kind = kind
+        self._digest = hashlib.sha256()
+        self._header = b""
+        self._size = 0
+
+    async def chunks(self):
+        if self.upload.size is not None and self.upload.size > self.max_bytes:
+            raise _upload_too_large(self.max_bytes)
+        async for chunk in upload_chunks(self.upload, kind=None):
+            self._size += len(chunk)
+            if self._size > self.max_bytes:
+                raise _upload_too_large(self.max_bytes)
+            if not self._header:
+                self._header = chunk[:16]
+            # hashlib releases the GIL on large buffers
+            await run_in_threadpool(self._digest.update, chunk)
+            yield chunk
+        UPLOAD_BYTES.labels(kind=self.kind).observe(self._size)
+
+    def result(self) -> UploadDigest:
+        """The digest of everything ``chunks()`` yielded."""
+        return UploadDigest(sha256=self._digest.hexdigest(), size=self._size, header=self._header)
+
+
+async def read_upload(upload: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES, kind: str = "image") -> bytes:
+    """Read an upload in chunks, rejecting it as soon as it exceeds ``max_bytes``.
+
+    The chunks are joined into one buffer, so an upload larger than one chunk is copied once.
+    """
+    if upload.size is not None and upload.size > max_bytes:
+        raise _upload_too_large(max_bytes)
+    chunks = []
+    total = 0
+    while True:
+        chunk = await upload.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > max_bytes:
+            raise _upload_too_large(max_bytes)
+        chunks.append(chunk)
+    UPLOAD_BYTES.labels(kind=kind).observe(total)
+    return chunks[0] if len(chunks) == 1 else b"".join(chunks)
+
+
+def prepare_image(data: bytes, image_format: str, profile: ModelInputProfile) -> PreparedImage:
+    """Apply EXIF orientation, cap the longest edge and re-encode for the model.
+
+    Uploads that are already upright, small enough and in the target format are
+    passed through untouched. JPEGs that still need decoding use libjpeg's draft
+    mode to decode at a reduced scale.
+    """
+    with timed(IMAGE_PROCESSING_SECONDS, operation="prepare"):
+        return _prepare_image(data, image_format, profile)
+
+
+def _prepare_image(data: bytes, image_format: str, profile: ModelInputProfile) -> PreparedImage:
+    img = Image.open(BytesIO(data))
+    stored_size = img.size
+    if image_format == "jpeg":
+        img.draft("RGB", (profile.max_edge, profile.max_edge))
+    img.load()
+    if stored_size[0] == 0 or stored_size[1] == 0:
+        raise ValueError("Empty or corrupt image file")
+
+    orientation = img.getexif().get(ORIENTATION_TAG, 1)
+    original_size = stored_size[::-1] if orientation in TRANSPOSED_ORIENTATIONS else stored_size
+
+    if orientation == 1 and max(stored_size) <= profile.max_edge and image_format == profile.format:
+        return PreparedImage(data=data, mime_type=IMAGE_MIME_TYPES[image_format],
+                             size=original_size, original_size=original_size)
+
+    if orientation != 1:
+        img = ImageOps.exif_transpose(img)
+    longest_edge = max(original_size)
+    if longest_edge > profile.max_edge:
+        scale = profile.max_edge / longest_edge
+        target_size = (max(1, round(original_size[0] * scale)), max(1, round(original_size[1] * scale)))
+        img = img.resize(target_size, Image.Resampling.LANCZOS)
+
+    if profile.format == "jpeg" and img.mode not in ("RGB", "L"):
+        # JPEG has no alpha channel; flatten transparency onto white
+        rgba = img.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        img = background
+
+    buffer = BytesIO()
+    img.save(buffer, format=profile.format.upper(), quality=profile.quality)
+    return PreparedImage(data=buffer.getvalue(), mime_type=IMAGE_MIME_TYPES[profile.format],
+                         size=img.size, original_size=original_size)
+
+
+async def ingest_image(upload: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES) -> IngestedImage:
+    """Read an uploaded image into memory and check its format from the leading bytes.
+
+    Decoding waits for ``IngestedImage.prepare``, so a cache hit never pays
+    for it. Raises HTTPException 413 for oversized uploads and 400 for empty
+    or unsupported images; undecodable ones fail with 400 in ``prepare``.
+    """
+    data = await read_upload(upload, max_bytes)
+    if not data:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid image upload: Empty image file")
+
+    image_format = sniff_image_format(data[:16])
+    if image_format is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Unsupported image type: expected PNG, JPEG or WebP")
+
+    return IngestedImage(data=data, format=image_format, mime_type=IMAGE_MIME_TYPES[image_format])
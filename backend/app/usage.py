@@ -0,0 +1,266 @@
+import asyncio
+import contextvars
+import json
+import os
+from contextlib import contextmanager
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+from fastapi import Depends, Request
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import DataError, IntegrityError
+from dotenv import load_dotenv
+from . import oauth2
+from .database import SessionLocal
+from .metrics import GEMINI_COST_USD, GEMINI_TOKENS
+from .models import GeminiUsage
+
+load_dotenv()
+
+# Aggregates are written every USAGE_FLUSH_SECONDS, or sooner once this many
+# distinct (day, user, route, model, template) keys are pending
+USAGE_FLUSH_SECONDS = float(os.getenv("USAGE_FLUSH_SECONDS", "30"))
+USAGE_FLUSH_MAX_KEYS = int(os.getenv("USAGE_FLUSH_MAX_KEYS", "500"))
+# Failed batch writes are retried on this many flushes; the batch is then
+# written row by row and rows that still fail are logged and dropped
+USAGE_FLUSH_MAX_ATTEMPTS = int(os.getenv("USAGE_FLUSH_MAX_ATTEMPTS", "3"))
+
+# USD per million tokens: prompt (input), text output and image output.
+# Override with GEMINI_PRICES, a JSON object of the same shape keyed by model.
+MODEL_PRICES = {
+    "gemini-2.5-flash-image-preview": {"input": 0.30, "output": 2.50, "image_output": 30.00},
+    "gemini-2.5-flash": {"input": 0.30, "output": 2.50, "image_output": 0.0},
+    "gemini-2.0-flash-exp": {"input": 0.10, "output": 0.40, "image_output": 0.0},
+}
+MODEL_PRICES.update(json.loads(os.getenv("GEMINI_PRICES", "{}")))
+
+# Tokens billed per generated image when the response does not break output
+# tokens down by modality
+IMAGE_OUTPUT_TOKENS = int(os.getenv("GEMINI_IMAGE_OUTPUT_TOKENS", "1290"))
+
+GROUP_COLUMNS = {
+    "day": GeminiUsage.day,
+    "user": GeminiUsage.user_id,
+    "route": GeminiUsage.route,
+    "model": GeminiUsage.model,
+    "template": GeminiUsage.prompt_template,
+}
+COUNTER_FIELDS = ("calls", "prompt_tokens", "candidate_tokens", "image_tokens", "total_tokens",
+                  "latency_seconds", "cost_usd")
+
+UsageKey = Tuple[date, Optional[int], str, str, Optional[str]]
+
+# Who a Gemini call is made for: (user_id, route). Set per request by the
+# ``track_usage`` dependency and per job by ``usage_context``.
+_context: contextvars.ContextVar[Tuple[Optional[int], str]] = contextvars.ContextVar(
+    "usage_context", default=(None, "unknown")
+)
+
+
+async def track_usage(request: Request, user = Depends(oauth2.get_optional_user)):
+    """Router dependency attributing the request's Gemini calls to its route and user.
+
+    Async so the context variable is set in the task that runs the endpoint.
+    """
+    route = request.scope.get("route")
+    _context.set((user.id if user else None, route.path if route else request.url.path))
+
+
+@contextmanager
+def usage_context(user_id: Optional[int], route: str):
+    """Attribute Gemini calls made inside the block, e.g. by a background job."""
+    token = _context.set((user_id, route))
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def current_user_id() -> Optional[int]:
+    return _context.get()[0]
+
+
+def _token_counts(response) -> Tuple[int, int, int, int]:
+    """Prompt, candidate, image and total tokens from a response's usage metadata."""
+    usage = getattr(response, "usage_metadata", None)
+    prompt_tokens = getattr(usage, "prompt_token_count", None) or 0
+    candidate_tokens = getattr(usage, "candidates_token_count", None) or 0
+    total_tokens = getattr(usage, "total_token_count", None) or prompt_tokens + candidate_tokens
+
+    details = getattr(usage, "candidates_tokens_details", None)
+    if details:
+        image_tokens = sum(
+            detail.token_count or 0 for detail in details
+            if str(getattr(detail, "modality", "")).upper().endswith("IMAGE")
+        )
+    else:
+        image_parts = 0
+        for candidate in getattr(response, "candidates", None) or []:
+            for part in getattr(getattr(candidate, "content", None), "parts", None) or []:
+                if getattr(part, "inline_data", None):
+                    image_parts += 1
+        image_tokens = min(image_parts * IMAGE_OUTPUT_TOKENS, candidate_tokens) if candidate_tokens else 0
+    return prompt_tokens, candidate_tokens, image_tokens, total_tokens
+
+
+def estimate_cost(model: str, prompt_tokens: int, candidate_tokens: int, image_tokens: int) -> float:
+    prices = MODEL_PRICES.get(model)
+    if not prices:
+        return 0.0
+    return (
+        prompt_tokens * prices.get("input", 0)
+        + (candidate_tokens - image_tokens) * prices.get("output", 0)
+        + image_tokens * prices.get("image_output", 0)
+    ) / 1_000_000
+
+
+class UsageRecorder:
+    """Aggregates Gemini usage in memory and appends it to ``gemini_usage`` in batches.
+
+    Each flush inserts one row per (day, user, route, model, template) seen
+    since the previous flush, in a single executemany. Rows are never
+    updated, so several instances can flush concurrently; reports sum them.
+    """
+
+    def __init__(self, interval: float = USAGE_FLUSH_SECONDS, max_keys: int = USAGE_FLUSH_MAX_KEYS,
+                 max_attempts: int = USAGE_FLUSH_MAX_ATTEMPTS):
+        self.interval = interval
+        self.max_keys = max_keys
+        self.max_attempts = max_attempts
+        self._failed_flushes = 0
+        self._pending: Dict[UsageKey, Dict[str, float]] = {}
+        self._task = None
+        self._wakeup = None
+        self._flush_lock = None
+
+    def record(self, model: str, response, latency: float, template: Optional[str] = None):
+        """Add one successful Gemini call to the pending aggregates."""
+        prompt_tokens, candidate_tokens, image_tokens, total_tokens = _token_counts(response)
+        cost = estimate_cost(model, prompt_tokens, candidate_tokens, image_tokens)
+        GEMINI_TOKENS.labels(model=model, type="prompt").inc(prompt_tokens)
+        GEMINI_TOKENS.labels(model=model, type="candidate").inc(candidate_tokens)
+        GEMINI_TOKENS.labels(model=model, type="image").inc(image_tokens)
+        GEMINI_COST_USD.labels(model=model).inc(cost)
+
+        user_id, route = _context.get()
+        key = (datetime.utcnow().date(), user_id, route, model, template)
+        counters = self._pending.get(key)
+        if counters is None:
+            counters = self._pending[key] = dict.fromkeys(COUNTER_FIELDS, 0)
+        counters["calls"] += 1
+        counters["prompt_tokens"] += prompt_tokens
+        counters["candidate_tokens"] += candidate_tokens
+        counters["image_tokens"] += image_tokens
+        counters["total_tokens"] += total_tokens
+        counters["latency_seconds"] += latency
+        counters["cost_usd"] += cost
+        if len(self._pending) >= self.max_keys and self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _write(self, rows: List[dict]):
+        async with SessionLocal() as db:
+            await db.execute(insert(GeminiUsage), rows)
+            await db.commit()
+
+    async def _write_each(self, rows: List[dict]):
+        """Write rows one at a time, logging and dropping the ones the database rejects."""
+        for position, row in enumerate(rows):
+            try:
+                await self._write([row])
+            except (IntegrityError, DataError) as e:
+                print(f"Dropping Gemini usage row {json.dumps(row, default=str)}: {e}")
+            except Exception as e:
+                # The database itself is failing; don't wait on it once per row
+                print(f"Dropping {len(rows) - position} Gemini usage rows: {e}")
+                return
+
+    async def flush(self):
+        """Write the pending aggregates.
+
+        A failed batch is kept for the next flush, up to ``max_attempts``
+        flushes in a row; after that its rows are written individually so a
+        row the database rejects cannot hold back the rest.
+        """
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            rows = [
+                {"day": day, "user_id": user_id, "route": route, "model": model, "prompt_template": template,
+                 **counters}
+                for (day, user_id, route, model, template), counters in pending.items()
+            ]
+            try:
+                await self._write(rows)
+                self._failed_flushes = 0
+            except Exception as e:
+                self._failed_flushes += 1
+                print(f"Error flushing Gemini usage (attempt {self._failed_flushes}): {e}")
+                if self._failed_flushes >= self.max_attempts:
+                    self._failed_flushes = 0
+                    await self._write_each(rows)
+                    return
+                for key, counters in pending.items():
+                    merged = self._pending.setdefault(key, dict.fromkeys(COUNTER_FIELDS, 0))
+                    for name, value in counters.items():
+                        merged[name] += value
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flusher and write whatever is still pending."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def _report(self, group_by: List[str], start: Optional[date], end: Optional[date],
+                user_id: Optional[int], route: Optional[str]) -> List[dict]:
+        columns = [GROUP_COLUMNS[name].label(name) for name in group_by]
+        sums = [func.sum(getattr(GeminiUsage, name)).label(name) for name in COUNTER_FIELDS]
+        query = select(*columns, *sums)
+        if start is not None:
+            query = query.where(GeminiUsage.day >= start)
+        if end is not None:
+            query = query.where(GeminiUsage.day <= end)
+        if user_id is not None:
+            query = query.where(GeminiUsage.user_id == user_id)
+        if route is not None:
+            query = query.where(GeminiUsage.route == route)
+        if columns:
+            query = query.group_by(*columns)
+        async with SessionLocal() as db:
+            rows = (await db.execute(query.order_by(func.sum(GeminiUsage.cost_usd).desc()))).all()
+        report = []
+        for row in rows:
+            item = dict(row._mapping)
+            if not item["calls"]:
+                continue
+            item["avg_latency_seconds"] = round(item["latency_seconds"] / item["calls"], 3)
+            item["latency_seconds"] = round(item["latency_seconds"], 3)
+            item["cost_usd"] = round(item["cost_usd"], 6)
+            report.append(item)
+        return report
+
+    async def report(self, group_by: List[str], start: Optional[date] = None, end: Optional[date] = None,
+                     user_id: Optional[int] = None, route: Optional[str] = None) -> List[dict]:
+        """Summed usage grouped by any of ``day``, ``user``, ``route``, ``model`` and ``template``, costliest first."""
+        await self.flush()
+        return await self._report(group_by, start, end, user_id, route)
+
+
+usage_recorder = UsageRecorder()
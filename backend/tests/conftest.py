@@ -0,0 +1,4 @@
+import os
+
+# app.database builds its engine at import time
+os.environ.setdefault("DB_URL", "sqlite://")
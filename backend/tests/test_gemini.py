@@ -0,0 +1,34 @@
+import asyncio
+from unittest import mock
+
+import pytest
+from fastapi import HTTPException
+
+from app import gemini
+
+
+def test_hanging_upstream_opens_the_circuit(monkeypatch):
+    calls = []
+
+    async def hang(**kwargs):
+        calls.append(kwargs["model"])
+        await asyncio.sleep(3600)
+
+    client = mock.MagicMock()
+    client.aio.models.generate_content = hang
+    model = "test-hanging-model"
+    monkeypatch.setattr(gemini, "get_client", lambda: client)
+    monkeypatch.setattr(gemini, "DEFAULT_ATTEMPT_TIMEOUT_SECONDS", 0.01)
+    monkeypatch.setattr(gemini, "RETRY_BASE_SECONDS", 0.001)
+    monkeypatch.setattr(gemini, "RETRY_MAX_SECONDS", 0.001)
+    monkeypatch.setattr(gemini, "MAX_RETRIES", gemini.BREAKER_FAILURES)
+
+    async def run():
+        with pytest.raises(HTTPException) as raised:
+            await gemini._generate_content(model, "hello")
+        return raised.value
+
+    error = asyncio.run(run())
+    assert error.status_code == 503
+    assert len(calls) == gemini.BREAKER_FAILURES
+    assert gemini._get_breaker(model).state == gemini.CircuitBreaker.OPEN
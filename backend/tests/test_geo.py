@@ -0,0 +1,32 @@
+import random
+
+import numpy as np
+
+from app.geo import geohash_bounds, geohash_center, geohash_encode, geohash_half_diagonal_m
+from app.spatial import haversine_m
+
+
+def test_bounds_contain_encoded_point():
+    rng = random.Random(3)
+    for _ in range(200):
+        latitude, longitude = rng.uniform(-90, 90), rng.uniform(-180, 180)
+        min_lat, min_lon, max_lat, max_lon = geohash_bounds(geohash_encode(latitude, longitude, 6))
+        assert min_lat <= latitude <= max_lat
+        assert min_lon <= longitude <= max_lon
+
+
+def test_half_diagonal_covers_every_point_in_the_cell():
+    rng = random.Random(5)
+    for _ in range(200):
+        tile = geohash_encode(rng.uniform(-85, 85), rng.uniform(-180, 180), 6)
+        min_lat, min_lon, max_lat, max_lon = geohash_bounds(tile)
+        latitude, longitude = geohash_center(tile)
+        points_lat = np.array([rng.uniform(min_lat, max_lat) for _ in range(50)])
+        points_lon = np.array([rng.uniform(min_lon, max_lon) for _ in range(50)])
+        assert haversine_m(latitude, longitude, points_lat, points_lon).max() <= geohash_half_diagonal_m(tile)
+
+
+def test_half_diagonal_at_precision_6():
+    # Cells are about 1.2 km x 0.6 km at the equator
+    assert 600 < geohash_half_diagonal_m(geohash_encode(0.0, 0.0, 6)) < 700
+    assert geohash_half_diagonal_m(geohash_encode(60.0, 10.0, 6)) < geohash_half_diagonal_m(geohash_encode(0.0, 0.0, 6))
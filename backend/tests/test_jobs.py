@@ -0,0 +1,101 @@
+import asyncio
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app import jobs
+from app.database import Base
+from app.jobs import JobQueue, job_handler
+
+
+@job_handler("test-echo")
+async def _echo(payload):
+    return payload
+
+
+@job_handler("test-slow")
+async def _slow(payload):
+    await asyncio.sleep(payload["seconds"])
+    return payload
+
+
+def _use_database(tmp_path, monkeypatch):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'jobs.sqlite'}")
+    monkeypatch.setattr(jobs, "SessionLocal", async_sessionmaker(engine, expire_on_commit=False))
+    return engine
+
+
+def test_concurrent_submissions_from_two_instances_share_one_job(tmp_path, monkeypatch):
+    engine = _use_database(tmp_path, monkeypatch)
+
+    async def run():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        # Separate queues stand in for separate instances: no shared in-process state
+        queues = [JobQueue(), JobQueue()]
+        submitted = await asyncio.gather(*(
+            queues[i % 2].submit("test-echo", {"n": i}, "same-key", priority=99) for i in range(10)
+        ))
+        await engine.dispose()
+        return submitted
+
+    submitted = asyncio.run(run())
+    assert len({job["id"] for job in submitted}) == 1
+    assert sum(not job["deduplicated"] for job in submitted) == 1
+    assert all(job["priority"] == jobs.JOB_MAX_PRIORITY for job in submitted)
+
+
+def test_heartbeat_keeps_a_long_job_from_being_claimed_again(tmp_path, monkeypatch):
+    engine = _use_database(tmp_path, monkeypatch)
+    monkeypatch.setattr(jobs, "JOB_LEASE_SECONDS", 0.3)
+    monkeypatch.setattr(jobs, "JOB_HEARTBEAT_SECONDS", 0.1)
+
+    async def run():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        queue, other = JobQueue(workers=1), JobQueue(workers=1)
+        job = await queue.submit("test-slow", {"seconds": 1.0}, "slow")
+        claimed = await queue._claim()
+        running = asyncio.create_task(queue._run(*claimed))
+        await asyncio.sleep(0.6)
+        reclaimed = await other._claim()
+        await running
+        finished = await queue.get(job["id"])
+        await engine.dispose()
+        return reclaimed, finished
+
+    reclaimed, finished = asyncio.run(run())
+    assert reclaimed is None
+    assert finished["status"] == jobs.SUCCEEDED and finished["attempts"] == 1
+
+
+def test_worker_survives_a_failure_to_record_a_result(tmp_path, monkeypatch):
+    engine = _use_database(tmp_path, monkeypatch)
+    finished = []
+
+    async def broken_finish(self, job_id, result):
+        finished.append(job_id)
+        if len(finished) == 1:
+            raise RuntimeError("connection lost")
+        await original_finish(self, job_id, result)
+
+    original_finish = JobQueue._finish
+    monkeypatch.setattr(JobQueue, "_finish", broken_finish)
+    monkeypatch.setattr(jobs, "JOB_POLL_SECONDS", 0.05)
+
+    async def run():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        queue = JobQueue(workers=1)
+        queue.start()
+        first = await queue.submit("test-echo", {"n": 1}, "first")
+        second = await queue.submit("test-echo", {"n": 2}, "second")
+        for _ in range(100):
+            if (await queue.get(second["id"]))["status"] == jobs.SUCCEEDED:
+                break
+            await asyncio.sleep(0.05)
+        statuses = [(await queue.get(job["id"]))["status"] for job in (first, second)]
+        await queue.stop()
+        await engine.dispose()
+        return statuses
+
+    assert asyncio.run(run()) == [jobs.RUNNING, jobs.SUCCEEDED]
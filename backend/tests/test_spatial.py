@@ -0,0 +1,75 @@
+import random
+
+import numpy as np
+import pytest
+
+from app.spatial import ShopIndex, haversine_m
+
+
+def _shops(rng: random.Random, count: int):
+    shops = []
+    for i in range(count):
+        kind = i % 4
+        if kind == 0:
+            latitude, longitude = rng.uniform(-90, 90), rng.uniform(-180, 180)
+        elif kind == 1:
+            # Clustered near the poles
+            latitude, longitude = rng.choice((-1, 1)) * rng.uniform(85, 90), rng.uniform(-180, 180)
+        elif kind == 2:
+            # Clustered around the antimeridian
+            latitude, longitude = rng.uniform(-70, 70), rng.choice((-1, 1)) * rng.uniform(179, 180)
+        else:
+            # A dense city
+            latitude, longitude = rng.gauss(48.85, 0.3), rng.gauss(2.35, 0.3)
+        shops.append({"latitude": latitude, "longitude": longitude, "category": rng.choice("ab")})
+    return shops
+
+
+def _query_points(rng: random.Random, shops, count: int):
+    points = []
+    for _ in range(count):
+        shop = rng.choice(shops)
+        # Near existing shops, so most queries have answers close to the radius edge
+        points.append((max(-90.0, min(90.0, shop["latitude"] + rng.uniform(-0.5, 0.5))),
+                       (shop["longitude"] + rng.uniform(-0.5, 0.5) + 180.0) % 360.0 - 180.0))
+    return points
+
+
+@pytest.fixture(scope="module")
+def index():
+    rng = random.Random(1234)
+    return ShopIndex(_shops(rng, 4000))
+
+
+@pytest.fixture(scope="module")
+def coordinates(index):
+    latitudes = np.array([shop["latitude"] for shop in index.shops])
+    longitudes = np.array([shop["longitude"] for shop in index.shops])
+    return latitudes, longitudes
+
+
+@pytest.mark.parametrize("radius_m", [500, 5000, 20000, 50000, 300000, 2000000])
+def test_query_radius_matches_brute_force(index, coordinates, radius_m):
+    rng = random.Random(radius_m)
+    for latitude, longitude in _query_points(rng, index.shops, 100):
+        indices, distances = index.query_radius(latitude, longitude, radius_m)
+        expected_distances = haversine_m(latitude, longitude, *coordinates)
+        expected = set(np.nonzero(expected_distances <= radius_m)[0].tolist())
+        assert set(indices.tolist()) == expected, (latitude, longitude, radius_m)
+        assert np.all(np.diff(distances) >= 0)
+
+
+@pytest.mark.parametrize("k", [1, 5, 25])
+def test_query_knn_matches_brute_force(index, coordinates, k):
+    rng = random.Random(k)
+    for latitude, longitude in _query_points(rng, index.shops, 100):
+        _, distances = index.query_knn(latitude, longitude, k)
+        expected = np.sort(haversine_m(latitude, longitude, *coordinates))[:k]
+        np.testing.assert_allclose(distances, expected)
+
+
+def test_query_radius_at_poles(index, coordinates):
+    for latitude in (90.0, -90.0, 89.99, -89.99):
+        indices, _ = index.query_radius(latitude, 0.0, 600000)
+        expected = np.nonzero(haversine_m(latitude, 0.0, *coordinates) <= 600000)[0]
+        assert set(indices.tolist()) == set(expected.tolist())
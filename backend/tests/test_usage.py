@@ -0,0 +1,51 @@
+import asyncio
+from types import SimpleNamespace
+
+from sqlalchemy.exc import IntegrityError
+
+from app.usage import UsageRecorder
+
+
+def _response(prompt_tokens=10, candidate_tokens=5):
+    usage = SimpleNamespace(prompt_token_count=prompt_tokens, candidates_token_count=candidate_tokens,
+                            total_token_count=prompt_tokens + candidate_tokens, candidates_tokens_details=None)
+    return SimpleNamespace(usage_metadata=usage, candidates=[])
+
+
+class FlakyRecorder(UsageRecorder):
+    """Fails batch writes, and single-row writes for rows of ``bad_route``."""
+
+    def __init__(self, bad_route, **kwargs):
+        super().__init__(**kwargs)
+        self.bad_route = bad_route
+        self.batch_calls = 0
+        self.written = []
+
+    async def _write(self, rows):
+        if len(rows) > 1:
+            self.batch_calls += 1
+            raise IntegrityError("INSERT", {}, Exception("foreign key"))
+        if rows[0]["route"] == self.bad_route:
+            raise IntegrityError("INSERT", {}, Exception("foreign key"))
+        self.written.extend(rows)
+
+
+def test_failed_batch_is_retried_then_written_row_by_row():
+    from app import usage
+
+    recorder = FlakyRecorder("/bad", max_attempts=3)
+    for route in ("/good", "/bad", "/other"):
+        token = usage._context.set((1, route))
+        recorder.record("gemini-2.5-flash", _response(), 0.1)
+        usage._context.reset(token)
+
+    async def run():
+        await recorder.flush()
+        await recorder.flush()
+        assert len(recorder._pending) == 3
+        await recorder.flush()
+
+    asyncio.run(run())
+    assert recorder.batch_calls == 3
+    assert sorted(row["route"] for row in recorder.written) == ["/good", "/other"]
+    assert recorder._pending == {}